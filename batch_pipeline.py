@@ -0,0 +1,249 @@
+# Staged batch printing: render ahead while the printer works, sync alongside
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class _StageStats:
+    """Busy and waiting time of the workers of one stage"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.waiting = 0.0  # render: blocked by backpressure, spool: starved
+        self._lock = threading.Lock()
+
+    def done(self, seconds, ok):
+        with self._lock:
+            self.items += 1
+            self.failed += 0 if ok else 1
+            self.busy += seconds
+
+    def waited(self, seconds):
+        with self._lock:
+            self.waiting += seconds
+
+    def to_dict(self, wall):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "failed": self.failed,
+                "busy_s": round(self.busy, 3),
+                "waiting_s": round(self.waiting, 3),
+                "avg_ms": round(self.busy / self.items * 1000, 1) if self.items else None,
+                "utilization": round(self.busy / (wall * self.workers), 3) if wall > 0 else 0.0,
+            }
+
+
+class BatchPipeline:
+    """Prints serials through render -> spool stages, with sync alongside.
+
+    render(serial) -> label bytes or None runs on render_workers threads; at
+    most render_ahead labels are rendered (or rendering) but not yet printed,
+    so rendering waits for the printer instead of piling up. One spooler
+    thread owns the printer and calls spool(serial, data) in submission
+    order. sync(serial) (I/O, e.g. InvenTree) runs on sync_workers threads
+    once its label is printed, alongside the printing of the next ones; a
+    label that was not printed is not synced. A serial is done when it is
+    printed and synced (or failed); on_result(result) is called for each.
+
+    run() prints a list; start() / submit() / close() feed it as a queue.
+    """
+
+    def __init__(
+        self,
+        render,
+        spool,
+        sync=None,
+        render_ahead=4,
+        render_workers=1,
+        sync_workers=4,
+        on_result=None,
+        logger=None,
+    ):
+        self.render = render
+        self.spool = spool
+        self.sync = sync
+        self.render_workers = render_workers
+        self.on_result = on_result
+        self.logger = logger
+        self.results = []  # per submission: serial, printed, synced, error
+        self.stages = {
+            "render": _StageStats(render_workers),
+            "spool": _StageStats(1),
+            "sync": _StageStats(sync_workers if sync else 0),
+        }
+        self._inbox = queue.Queue()  # (seq, serial)
+        self._ahead = threading.Semaphore(render_ahead)  # released by the spooler
+        self._rendered = {}  # seq -> (data, error)
+        self._cond = threading.Condition()
+        self._sync_pool = ThreadPoolExecutor(sync_workers, thread_name_prefix="batch-sync") if sync else None
+        self._closed = False
+        self._completed = 0
+        self._threads = []
+        self._started = None
+        self._finished = None
+        self._all_done = threading.Event()
+
+    def start(self):
+        if self._started is None:
+            self._started = time.perf_counter()
+            self._threads = [
+                threading.Thread(target=self._render_worker, name=f"batch-render-{i}", daemon=True)
+                for i in range(self.render_workers)
+            ] + [threading.Thread(target=self._spooler, name="batch-spool", daemon=True)]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def submit(self, serial):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batch is closed")
+            seq = len(self.results)
+            self.results.append(
+                {"serial": serial, "printed": None, "synced": None if self.sync else False, "error": None}
+            )
+        self._inbox.put((seq, serial))
+        return seq
+
+    def close(self):
+        """No more submissions; workers exit once everything is done"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            if self._completed == len(self.results):
+                self._finish_batch()
+        self._inbox.put(_DONE)
+
+    def wait(self, timeout=None):
+        return self._all_done.wait(timeout)
+
+    def run(self, serials):
+        """Print all serials, return the report"""
+        self.start()
+        for serial in serials:
+            self.submit(serial)
+        self.close()
+        self.wait()
+        return self.report()
+
+    @property
+    def running(self):
+        return self._started is not None and not self._all_done.is_set()
+
+    def _render_worker(self):
+        stats = self.stages["render"]
+        while True:
+            t0 = time.perf_counter()
+            self._ahead.acquire()
+            stats.waited(time.perf_counter() - t0)
+            item = self._inbox.get()
+            if item is _DONE:
+                self._ahead.release()
+                self._inbox.put(_DONE)  # for the other render workers
+                return
+            seq, serial = item
+            t0 = time.perf_counter()
+            try:
+                data = self.render(serial)
+                error = None if data is not None else "label render failed"
+            except Exception as e:
+                data, error = None, str(e)
+            stats.done(time.perf_counter() - t0, data is not None)
+            with self._cond:
+                self._rendered[seq] = (data, error)
+                self._cond.notify_all()
+
+    def _spooler(self):
+        stats = self.stages["spool"]
+        seq = 0
+        while True:
+            t0 = time.perf_counter()
+            with self._cond:
+                while seq not in self._rendered and not (self._closed and seq >= len(self.results)):
+                    self._cond.wait()
+                if seq not in self._rendered:
+                    if self._sync_pool is not None:
+                        self._sync_pool.shutdown(wait=False)  # queued syncs still run
+                    return
+                data, error = self._rendered.pop(seq)
+                serial = self.results[seq]["serial"]
+            stats.waited(time.perf_counter() - t0)
+            printed = False
+            if data is not None:
+                t0 = time.perf_counter()
+                try:
+                    printed = bool(self.spool(serial, data))
+                    error = None if printed else "printing failed"
+                except Exception as e:
+                    error = str(e)
+                stats.done(time.perf_counter() - t0, printed)
+            self._ahead.release()
+            if error and self.logger:
+                self.logger.error("Batch: %s not printed: %s", serial, error)
+            self._update(seq, "printed", printed, error)
+            if self._sync_pool is not None:
+                if printed:
+                    self._sync_pool.submit(self._sync_one, seq, serial)
+                else:
+                    self._update(seq, "synced", False, None)
+            seq += 1
+
+    def _sync_one(self, seq, serial):
+        t0 = time.perf_counter()
+        try:
+            self.sync(serial)
+            ok = True
+        except Exception as e:
+            ok = False
+            if self.logger:
+                self.logger.warning("Batch: sync of %s failed: %s", serial, e)
+        self.stages["sync"].done(time.perf_counter() - t0, ok)
+        self._update(seq, "synced", ok, None)
+
+    def _update(self, seq, field, value, error):
+        with self._cond:
+            result = self.results[seq]
+            result[field] = value
+            if error:
+                result["error"] = error
+            if result["printed"] is None or result["synced"] is None:
+                return
+        if self.on_result is not None:
+            self.on_result(result)
+        with self._cond:
+            self._completed += 1
+            if self._closed and self._completed == len(self.results):
+                self._finish_batch()
+
+    def _finish_batch(self):
+        self._finished = time.perf_counter()
+        self._all_done.set()
+
+    def report(self):
+        """Progress, per-stage utilization and the stage that limits throughput"""
+        end = self._finished or time.perf_counter()
+        wall = end - self._started if self._started is not None else 0.0
+        stages = {name: stats.to_dict(wall) for name, stats in self.stages.items() if stats.workers}
+        with self._cond:
+            submitted = len(self.results)
+            printed = sum(1 for r in self.results if r["printed"])
+            failed = sum(1 for r in self.results if r["printed"] is False)
+        return {
+            "running": self.running,
+            "submitted": submitted,
+            "printed": printed,
+            "failed": failed,
+            "wall_s": round(wall, 3),
+            "labels_per_min": round(printed / wall * 60, 1) if wall > 0 else 0.0,
+            "bottleneck": max(stages, key=lambda name: stages[name]["utilization"]) if stages else None,
+            "stages": stages,
+        }
@@ -32,6 +32,24 @@ a = Analysis(
         ('static', 'static'),      
         ('print_labels.py', '.'),  
         ('hardware.py', '.'),       
+        ('raster_compositor.py', '.'),
+        ('datamatrix.py', '.'),
+        ('layout.py', '.'),
+        ('serial_ingest.py', '.'),
+        ('label_cache.py', '.'),
+        ('label_archive.py', '.'),
+        ('logging_setup.py', '.'),
+        ('batch_pipeline.py', '.'),
+        ('production_stats.py', '.'),
+        ('tspl_printer.py', '.'),
+        ('tracing.py', '.'),
+        ('throughput.py', '.'),
+        ('render_service.py', '.'),
+        ('render_client.py', '.'),
+        ('scan_events.py', '.'),
+        ('profiling.py', '.'),
+        ('readiness.py', '.'),
+        ('warmup.py', '.'),
         ('conf.toml', '.'),         
         ('template51x25.pdf', '.'), 
     ] + collect_data_files('reportlab'), 
@@ -43,6 +61,26 @@ a = Analysis(
         'requests',     
         'hardware',
         'print_labels',
+        'raster_compositor',
+        'datamatrix',
+        'layout',
+        'serial_ingest',
+        'label_cache',
+        'label_archive',
+        'logging_setup',
+        'batch_pipeline',
+        'production_stats',
+        'tspl_printer',
+        'tracing',
+        'throughput',
+        'render_service',
+        'render_client',
+        'scan_events',
+        'profiling',
+        'readiness',
+        'warmup',
+        'psycopg2.pool',
+        'numpy',
         'PyPDF2',
         'PIL.Image',
         'PIL.ImageWin',  
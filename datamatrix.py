@@ -0,0 +1,372 @@
+# Data Matrix (ECC200) encoding with NumPy module-to-bitmap expansion
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# Native encoder (libdmtx-64.dll through ctypes)
+try:
+    from pylibdmtx import pylibdmtx
+
+    LIBDMTX_AVAILABLE = True
+except ImportError:
+    LIBDMTX_AVAILABLE = False
+
+QUIET_ZONE_MODULES = 2  # libdmtx default margin: 10 px at 5 px per module
+LIBDMTX_MODULE_PIXELS = 5
+LIBDMTX_MARGIN_PIXELS = 10
+
+# Square ECC200 symbols with a single Reed-Solomon block:
+# symbol size -> (data region size, data codewords, error correction codewords)
+SYMBOL_SIZES = {
+    10: (8, 3, 5),
+    12: (10, 5, 7),
+    14: (12, 8, 10),
+    16: (14, 12, 12),
+    18: (16, 18, 14),
+    20: (18, 22, 18),
+    22: (20, 30, 20),
+    24: (22, 36, 24),
+    26: (24, 44, 28),
+    32: (14, 62, 36),
+    36: (16, 86, 42),
+    40: (18, 114, 48),
+    44: (20, 144, 56),
+}
+
+# GF(256) tables, primitive polynomial x^8 + x^5 + x^3 + x^2 + 1
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _GF_EXP[_i] = _value
+    _GF_LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x12D
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+
+_GENERATORS = {}
+
+
+def _gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _GF_EXP[_GF_LOG[a] + _GF_LOG[b]]
+
+
+def _generator(ecc_len):
+    """Reed-Solomon generator polynomial (x - a^1)...(x - a^n), highest power first"""
+    poly = _GENERATORS.get(ecc_len)
+    if poly is None:
+        poly = [1]
+        for i in range(1, ecc_len + 1):
+            root = _GF_EXP[i]
+            nxt = poly + [0]
+            for j, coef in enumerate(poly):
+                nxt[j + 1] ^= _gf_mul(coef, root)
+            poly = nxt
+        _GENERATORS[ecc_len] = poly
+    return poly
+
+
+def _reed_solomon(data, ecc_len):
+    gen = _generator(ecc_len)
+    remainder = [0] * ecc_len
+    for codeword in data:
+        factor = codeword ^ remainder[0]
+        remainder = remainder[1:] + [0]
+        if factor:
+            for j in range(ecc_len):
+                remainder[j] ^= _gf_mul(gen[j + 1], factor)
+    return remainder
+
+
+def _ascii_codewords(data: bytes):
+    """ASCII encodation with digit pair compaction"""
+    codewords = []
+    i = 0
+    while i < len(data):
+        byte = data[i]
+        if (
+            48 <= byte <= 57
+            and i + 1 < len(data)
+            and 48 <= data[i + 1] <= 57
+        ):
+            codewords.append(130 + (byte - 48) * 10 + (data[i + 1] - 48))
+            i += 2
+            continue
+        if byte < 128:
+            codewords.append(byte + 1)
+        else:
+            codewords.extend((235, byte - 127))  # Upper Shift
+        i += 1
+    return codewords
+
+
+def _pad(codewords, capacity):
+    padded = list(codewords)
+    if len(padded) < capacity:
+        padded.append(129)
+    while len(padded) < capacity:
+        position = len(padded) + 1
+        value = 129 + ((149 * position) % 253) + 1
+        if value > 254:
+            value -= 254
+        padded.append(value)
+    return padded
+
+
+def _place_codewords(nrow, ncol, codewords):
+    """ECC200 module placement (ISO/IEC 16022 Annex F) into the mapping matrix"""
+    array = np.full((nrow, ncol), -1, dtype=np.int8)
+
+    def module(row, col, index, bit):
+        if row < 0:
+            row += nrow
+            col += 4 - ((nrow + 4) % 8)
+        if col < 0:
+            col += ncol
+            row += 4 - ((ncol + 4) % 8)
+        array[row, col] = (codewords[index] >> (8 - bit)) & 1
+
+    def utah(row, col, index):
+        module(row - 2, col - 2, index, 1)
+        module(row - 2, col - 1, index, 2)
+        module(row - 1, col - 2, index, 3)
+        module(row - 1, col - 1, index, 4)
+        module(row - 1, col, index, 5)
+        module(row, col - 2, index, 6)
+        module(row, col - 1, index, 7)
+        module(row, col, index, 8)
+
+    def corner(index, positions):
+        for bit, (row, col) in enumerate(positions, start=1):
+            module(row, col, index, bit)
+
+    corner1 = [(nrow - 1, 0), (nrow - 1, 1), (nrow - 1, 2), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)]
+    corner2 = [(nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 4),
+               (0, ncol - 3), (0, ncol - 2), (0, ncol - 1), (1, ncol - 1)]
+    corner3 = [(nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)]
+    corner4 = [(nrow - 1, 0), (nrow - 1, ncol - 1), (0, ncol - 3), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 3), (1, ncol - 2), (1, ncol - 1)]
+
+    index, row, col = 0, 4, 0
+    while True:
+        if row == nrow and col == 0:
+            corner(index, corner1)
+            index += 1
+        if row == nrow - 2 and col == 0 and ncol % 4:
+            corner(index, corner2)
+            index += 1
+        if row == nrow - 2 and col == 0 and ncol % 8 == 4:
+            corner(index, corner3)
+            index += 1
+        if row == nrow + 4 and col == 2 and not ncol % 8:
+            corner(index, corner4)
+            index += 1
+
+        # Sweep upward diagonally
+        while True:
+            if row < nrow and col >= 0 and array[row, col] < 0:
+                utah(row, col, index)
+                index += 1
+            row -= 2
+            col += 2
+            if not (row >= 0 and col < ncol):
+                break
+        row += 1
+        col += 3
+
+        # Sweep downward diagonally
+        while True:
+            if row >= 0 and col < ncol and array[row, col] < 0:
+                utah(row, col, index)
+                index += 1
+            row += 2
+            col -= 2
+            if not (row < nrow and col >= 0):
+                break
+        row += 3
+        col += 1
+
+        if not (row < nrow or col < ncol):
+            break
+
+    # Fixed pattern for the unused bottom-right corner
+    if array[nrow - 1, ncol - 1] < 0:
+        array[nrow - 1, ncol - 1] = 1
+        array[nrow - 2, ncol - 2] = 1
+    array[array < 0] = 0
+    return array.astype(bool)
+
+
+def encode_modules_python(data: str):
+    """Pure Python ECC200 encoder. Returns boolean module matrix (True = dark)"""
+    codewords = _ascii_codewords(data.encode("utf-8"))
+
+    for size, (region, data_len, ecc_len) in SYMBOL_SIZES.items():
+        if len(codewords) <= data_len:
+            break
+    else:
+        raise ValueError(f"Data too long for Data Matrix: {data}")
+
+    padded = _pad(codewords, data_len)
+    full = padded + _reed_solomon(padded, ecc_len)
+
+    regions = size // (region + 2)
+    mapping = _place_codewords(region * regions, region * regions, full)
+
+    symbol = np.zeros((size, size), dtype=bool)
+    step = region + 2
+    for ry in range(regions):
+        for rx in range(regions):
+            y0, x0 = ry * step, rx * step
+            # Finder pattern: solid left and bottom edges
+            symbol[y0 : y0 + step, x0] = True
+            symbol[y0 + step - 1, x0 : x0 + step] = True
+            # Clock track: alternating top and right edges
+            symbol[y0, x0 : x0 + step : 2] = True
+            symbol[y0 + 1 : y0 + step : 2, x0 + step - 1] = True
+            symbol[y0 + 1 : y0 + 1 + region, x0 + 1 : x0 + 1 + region] = mapping[
+                ry * region : (ry + 1) * region, rx * region : (rx + 1) * region
+            ]
+    return symbol
+
+
+def encode_modules_libdmtx(data: str):
+    """Encode with libdmtx and sample module centers back into a module matrix"""
+    encoded = pylibdmtx.encode(data.encode("utf-8"))
+    bpp = encoded.bpp // 8
+    pixels = np.frombuffer(encoded.pixels, dtype=np.uint8).reshape(
+        encoded.height, encoded.width, bpp
+    )[:, :, 0]
+    centers_y = np.arange(
+        LIBDMTX_MARGIN_PIXELS + LIBDMTX_MODULE_PIXELS // 2,
+        encoded.height - LIBDMTX_MARGIN_PIXELS,
+        LIBDMTX_MODULE_PIXELS,
+    )
+    centers_x = np.arange(
+        LIBDMTX_MARGIN_PIXELS + LIBDMTX_MODULE_PIXELS // 2,
+        encoded.width - LIBDMTX_MARGIN_PIXELS,
+        LIBDMTX_MODULE_PIXELS,
+    )
+    return pixels[np.ix_(centers_y, centers_x)] < 128
+
+
+def _expansion_counts(modules: int, size_pixels: int):
+    """Pixels per module matching nearest-neighbour scaling of the whole symbol"""
+    index = (np.arange(size_pixels) * modules) // size_pixels
+    return np.bincount(index, minlength=modules)
+
+
+class DataMatrixEncoder:
+    """Data Matrix encoder with a batch API.
+
+    Module matrices are kept as compact packed bit arrays; expansion to the
+    target pixel size is done with NumPy repeat/kron instead of PIL resize.
+    backend: "libdmtx" (native DLL), "python" (pure Python) or "auto".
+    """
+
+    def __init__(self, backend: str = "auto", quiet_zone: int = QUIET_ZONE_MODULES):
+        if backend == "auto":
+            backend = "libdmtx" if LIBDMTX_AVAILABLE else "python"
+        if backend == "libdmtx" and not LIBDMTX_AVAILABLE:
+            raise ImportError("pylibdmtx / libdmtx is not available")
+        if backend not in ("libdmtx", "python"):
+            raise ValueError(f"Unknown Data Matrix backend: {backend}")
+
+        self.backend = backend
+        self.quiet_zone = quiet_zone
+        self._encode = (
+            encode_modules_libdmtx if backend == "libdmtx" else encode_modules_python
+        )
+
+    def encode(self, data: str):
+        """Encode one string. Returns packed module matrix (uint8, bit = dark)"""
+        return self.encode_batch([data])[0]
+
+    def encode_batch(self, items):
+        """Encode many strings. Returns (n, modules, bytes_per_row) packed array.
+
+        All items must produce the same symbol size (fixed-length serials).
+        """
+        matrices = [self._encode(item) for item in items]
+        if not matrices:
+            return np.zeros((0, 0, 0), dtype=np.uint8)
+
+        shape = matrices[0].shape
+        for item, matrix in zip(items, matrices):
+            if matrix.shape != shape:
+                raise ValueError(
+                    f"Symbol size mismatch for {item}: {matrix.shape} != {shape}"
+                )
+
+        stacked = np.stack(matrices)
+        if self.quiet_zone:
+            q = self.quiet_zone
+            stacked = np.pad(stacked, ((0, 0), (q, q), (q, q)))
+        return np.packbits(stacked, axis=2)
+
+    @staticmethod
+    def unpack(packed, modules: int = None):
+        """Unpack packed module matrices back to booleans"""
+        if modules is None:
+            modules = packed.shape[-2]
+        return np.unpackbits(packed, axis=-1, count=modules).astype(bool)
+
+    def to_bitmaps(self, packed, size_pixels: int):
+        """Expand packed module matrices to (n, size, size) boolean bitmaps"""
+        modules = self.unpack(packed)
+        n = modules.shape[-2]
+        if size_pixels % n == 0:
+            scale = size_pixels // n
+            kernel = np.ones((1, scale, scale), dtype=bool)
+            return np.kron(modules, kernel)
+
+        counts = _expansion_counts(n, size_pixels)
+        return np.repeat(np.repeat(modules, counts, axis=-2), counts, axis=-1)
+
+    def to_bitmap(self, packed, size_pixels: int):
+        """Expand one packed module matrix to a (size, size) boolean bitmap"""
+        return self.to_bitmaps(packed[np.newaxis], size_pixels)[0]
+
+    def render(self, data: str, size_pixels: int):
+        """Encode one string straight to a (size, size) boolean bitmap"""
+        return self.to_bitmap(self.encode(data), size_pixels)
+
+    def render_batch(self, items, size_pixels: int):
+        """Encode many strings straight to (n, size, size) boolean bitmaps"""
+        return self.to_bitmaps(self.encode_batch(items), size_pixels)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from PIL import Image
+
+    serials = sys.argv[1:] or ["RC-110-333456", "RC-103-000001", "RC-410-123456"]
+    encoder = DataMatrixEncoder("python")
+    print(f"Backend: {encoder.backend}")
+
+    # Reference decoder: libdmtx, else zxing-cpp (pip install zxing-cpp)
+    decode = None
+    if LIBDMTX_AVAILABLE:
+        decode = lambda img: [r.data.decode("utf-8") for r in pylibdmtx.decode(img)]
+    else:
+        try:
+            import zxingcpp
+
+            decode = lambda img: [r.text for r in zxingcpp.read_barcodes(img)]
+        except ImportError:
+            pass
+
+    bitmaps = encoder.render_batch(serials, 200)
+    for serial, bitmap in zip(serials, bitmaps):
+        if decode is None:
+            print(f"{serial}: encoded (no decoder available, decode skipped)")
+            continue
+        img = Image.fromarray(np.pad(np.where(bitmap, 0, 255).astype(np.uint8), 20, constant_values=255))
+        ok = decode(img) == [serial]
+        print(f"{serial}: {'OK' if ok else 'DECODE FAILED'}")
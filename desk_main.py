@@ -1,29 +1,78 @@
 # Desktop версия с webview - улучшенная
-import webview
+import warmup  # first: startup reference time for the time-to-interactive metric
+import logging
+import socket
 import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
 import time
-from main import app
 
+import webview
+from werkzeug.serving import make_server
+
+from main import app, start_background_services
+from main import warmup as app_warmup
+
+PREFERRED_PORT = 5000
+HEALTH_TIMEOUT = 30
+
+logger = logging.getLogger("desk_main")
+
+
+def port_in_use(port):
+    """Something already answers on 127.0.0.1:port (e.g. a second copy of the app)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
 
-def start_flask():
-    # Даем время webview на запуск
-    time.sleep(1)
-    app.run(debug=False, host="127.0.0.1", port=5000, use_reloader=False, threaded=True)
+
+def create_server():
+    """Bind the server socket before anything waits on it: the usual port,
+    any free port if it is taken"""
+    port = 0 if port_in_use(PREFERRED_PORT) else PREFERRED_PORT
+    try:
+        return make_server("127.0.0.1", port, app, threaded=True)
+    except OSError:
+        return make_server("127.0.0.1", 0, app, threaded=True)
+
+
+def wait_until_healthy(url, timeout):
+    """True as soon as the server answers HTTP (503 during warm-up counts)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=1):
+                return True
+        except urllib.error.HTTPError:
+            return True
+        except OSError:
+            time.sleep(0.01)
+    return False
 
 
 def main():
-    # Запускаем Flask в отдельном потоке
-    flask_thread = threading.Thread(target=start_flask)
+    # Warm-up, hot reload of label positions from conf.toml, statistics polling
+    start_background_services()
+
+    # Сервер слушает порт сразу, запросы ждут в очереди до serve_forever
+    server = create_server()
+    url = f"http://127.0.0.1:{server.server_port}"
+    flask_thread = threading.Thread(target=server.serve_forever, name="Flask")
     flask_thread.daemon = True
     flask_thread.start()
+    app_warmup.mark("listening")
 
-    # Даем Flask время запуститься
-    time.sleep(2)
+    if not wait_until_healthy(url, HEALTH_TIMEOUT):
+        logger.error("Server at %s did not answer within %s s", url, HEALTH_TIMEOUT)
+        server.shutdown()
+        return 1
+    app_warmup.mark("healthy")
 
-    # Создаем desktop окно с отключенным кэшированием
-    webview.create_window(
+    # Окно открывается сразу; пока идет прогрев - заставка, затем основная страница
+    window = webview.create_window(
         title="Принтер этикеток RCDevices",
-        url="http://127.0.0.1:5000",
+        url=url if app_warmup.ready else f"{url}/splash",
         width=1200,
         height=800,
         min_size=(800, 600),
@@ -32,12 +81,33 @@ def main():
         js_api=None,  # Можно добавить JS API если нужно
     )
 
+    def on_loaded(*_args):
+        if "interactive" in app_warmup.milestones or urlparse(window.get_current_url() or "").path != "/":
+            return
+        interactive = app_warmup.mark("interactive")
+        m = app_warmup.milestones
+        print(f"Готово к работе через {interactive:.2f} с")
+        logger.info(
+            "Time to interactive: %.2f s (listening %.2f s, healthy %.2f s, "
+            "warm-up ready %.2f s, window shown %.2f s)",
+            interactive,
+            m["listening"],
+            m["healthy"],
+            app_warmup.ready_at or 0,
+            m.get("window shown", 0),
+        )
+
+    window.events.shown += lambda *_args: app_warmup.mark("window shown")
+    window.events.loaded += on_loaded
+
     # Запускаем с отключенной отладкой для стабильности
     webview.start(
         debug=False,
         # Принудительно используем нативный движок
         gui="cef" if hasattr(webview, "CEF") else None,
     )
+    server.shutdown()
+    return 0
 
 
 if __name__ == "__main__":
@@ -4,37 +4,34 @@ import ctypes
 import sys
 import os
 import platform
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
 from ctypes import c_uint32, c_uint64, c_uint8, c_char_p, POINTER, byref, create_string_buffer
 
-# Global variables for DLL and functions
-dll = None
-GetDeviceList = None
-GetDeviceMCUId = None
-GetDeviceSerial = None
-GetDeviceDatabaseInfo = None
 ERR_DB_OK = 0
+ERR_DB_FAILED = 1  # Simulated database read failure
 
 
-
-def init_dll():
-    """Initialize DLL"""
-    global dll, GetDeviceList, GetDeviceMCUId, GetDeviceSerial, GetDeviceDatabaseInfo
-    
+def init_dll(dll_path=None):
+    """Load RCDevices.dll and return (GetDeviceList, GetDeviceMCUId, GetDeviceSerial, GetDeviceDatabaseInfo)"""
     # Find DLL
-    exe_dir = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
-    dll_path = os.path.join(exe_dir, "RCDevices.dll")
-    
+    if dll_path is None:
+        exe_dir = os.path.dirname(os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else __file__))
+        dll_path = os.path.join(exe_dir, "RCDevices.dll")
+
     if not os.path.exists(dll_path):
         raise FileNotFoundError(f"DLL not found: {dll_path}")
-    
+
     # Load DLL - use cdll for 64-bit DLL
     dll = ctypes.cdll.LoadLibrary(dll_path)
-    
+
     # Setup functions without suffixes for 64-bit DLL
     try:
         # Try without suffixes first (64-bit)
         GetDeviceList = dll.GetDeviceList
-        GetDeviceMCUId = dll.GetDeviceMCUId  
+        GetDeviceMCUId = dll.GetDeviceMCUId
         GetDeviceSerial = dll.GetDeviceSerial
         GetDeviceDatabaseInfo = dll.GetDeviceDatabaseInfo
     except AttributeError:
@@ -42,191 +39,401 @@ def init_dll():
         dll = ctypes.windll.LoadLibrary(dll_path)
         GetDeviceList = getattr(dll, "GetDeviceList@4")
         GetDeviceMCUId = getattr(dll, "GetDeviceMCUId@8")
-        GetDeviceSerial = getattr(dll, "GetDeviceSerial@8") 
+        GetDeviceSerial = getattr(dll, "GetDeviceSerial@8")
         GetDeviceDatabaseInfo = getattr(dll, "GetDeviceDatabaseInfo@20")
-    
+
     # Setup argument types and return types
     GetDeviceList.argtypes = [POINTER(c_uint32)]
     GetDeviceList.restype = c_uint32
-    
+
     GetDeviceMCUId.argtypes = [c_uint32, POINTER(c_uint8)]
     GetDeviceMCUId.restype = c_uint32
-    
+
     GetDeviceSerial.argtypes = [c_uint32, c_char_p]
     GetDeviceSerial.restype = c_uint32
-    
+
     GetDeviceDatabaseInfo.argtypes = [c_uint32, POINTER(c_uint8), POINTER(c_uint8), POINTER(c_uint64), POINTER(c_uint64)]
     GetDeviceDatabaseInfo.restype = c_uint32
 
-def get_device_list():
-    """Get list of devices"""
-    device_count = GetDeviceList(None)
-    if device_count == 0:
-        return []
-    
-    devices = (c_uint32 * device_count)()
-    GetDeviceList(devices)
-    return [devices[i] for i in range(device_count)]
-
-def get_device_mcu_id(handle):
-    """Get device MCU ID"""
-    size = GetDeviceMCUId(handle, None)
-    if size == 0:
-        return None
-    
-    hwid = (c_uint8 * size)()
-    GetDeviceMCUId(handle, hwid)
-    return [hwid[i] for i in range(size)]
-
-def get_device_serial(handle):
-    """Get device serial number"""
-    size = GetDeviceSerial(handle, None)
-    if size == 0:
-        return None
-    
-    serial_buffer = create_string_buffer(size)
-    GetDeviceSerial(handle, serial_buffer)
-    return serial_buffer.value.decode('utf-8')
-
-def get_device_database_info(handle):
-    """Get database information"""
-    tests_ok = c_uint8()
-    calibration_ok = c_uint8()
-    prog_time = c_uint64()
-    calib_time = c_uint64()
-    
-    result = GetDeviceDatabaseInfo(handle, byref(tests_ok), byref(calibration_ok), 
-                                  byref(prog_time), byref(calib_time))
-    
-
-    
-    return {
-        "result": result,
-        "tests_ok": tests_ok.value,
-        "calibration_ok": calibration_ok.value,
-        "prog_time": prog_time.value,
-        "calib_time": calib_time.value
-    }
+    return GetDeviceList, GetDeviceMCUId, GetDeviceSerial, GetDeviceDatabaseInfo
+
+
+class DeviceBackend(ABC):
+    """Interface of a device source used by RCDevicesClient"""
+
+    mode = "Abstract"
+
+    @abstractmethod
+    def get_device_list(self):
+        """Handles of connected devices"""
+
+    @abstractmethod
+    def get_device_mcu_id(self, handle):
+        """MCU ID bytes as list of ints, None on error"""
+
+    @abstractmethod
+    def get_device_serial(self, handle):
+        """Serial number string, None on error"""
+
+    @abstractmethod
+    def get_device_database_info(self, handle):
+        """Dict with result, tests_ok, calibration_ok, prog_time, calib_time"""
+
+
+class DllBackend(DeviceBackend):
+    """RCDevices.dll through ctypes.
+
+    Output buffers are allocated once and grown on demand, so polling does
+    not allocate ctypes arrays per call. Calls are serialized by a lock
+    because the buffers are shared.
+    """
+
+    mode = "Direct DLL"
+
+    def __init__(self, dll_path=None):
+        (
+            self._get_device_list,
+            self._get_mcu_id,
+            self._get_serial,
+            self._get_db_info,
+        ) = init_dll(dll_path)
+        self._lock = threading.Lock()
+
+        self._devices = (c_uint32 * 8)()
+        self._mcu_id = (c_uint8 * 32)()
+        self._serial = create_string_buffer(64)
+
+        self._tests_ok = c_uint8()
+        self._calibration_ok = c_uint8()
+        self._prog_time = c_uint64()
+        self._calib_time = c_uint64()
+        self._db_refs = (
+            byref(self._tests_ok),
+            byref(self._calibration_ok),
+            byref(self._prog_time),
+            byref(self._calib_time),
+        )
+
+    def get_device_list(self):
+        with self._lock:
+            device_count = self._get_device_list(None)
+            if device_count == 0:
+                return []
+            if device_count > len(self._devices):
+                self._devices = (c_uint32 * (device_count * 2))()
+            # The list may change between the two calls: trust only the second count
+            device_count = min(self._get_device_list(self._devices), len(self._devices))
+            return self._devices[:device_count]
+
+    def get_device_mcu_id(self, handle):
+        with self._lock:
+            size = self._get_mcu_id(handle, None)
+            if size == 0:
+                return None
+            if size > len(self._mcu_id):
+                self._mcu_id = (c_uint8 * size)()
+            self._get_mcu_id(handle, self._mcu_id)
+            return self._mcu_id[:size]
+
+    def get_device_serial(self, handle):
+        with self._lock:
+            size = self._get_serial(handle, None)
+            if size == 0:
+                return None
+            if size > len(self._serial):
+                self._serial = create_string_buffer(size)
+            ctypes.memset(self._serial, 0, len(self._serial))
+            self._get_serial(handle, self._serial)
+            return self._serial.value.decode('utf-8')
+
+    def get_device_database_info(self, handle):
+        with self._lock:
+            result = self._get_db_info(handle, *self._db_refs)
+            return {
+                "result": result,
+                "tests_ok": self._tests_ok.value,
+                "calibration_ok": self._calibration_ok.value,
+                "prog_time": self._prog_time.value,
+                "calib_time": self._calib_time.value
+            }
+
+
+class SimulatedDevice:
+    """State of one simulated device"""
+
+    __slots__ = ("handle", "serial", "mcu_id", "tests_ok", "calibration_ok", "prog_time", "calib_time")
+
+    def __init__(self, handle, serial, mcu_id, ready=True):
+        self.handle = handle
+        self.serial = serial
+        self.mcu_id = mcu_id
+        now = int(time.time())
+        self.tests_ok = 1 if ready else 0
+        self.calibration_ok = 1 if ready else 0
+        self.prog_time = now if ready else 0
+        self.calib_time = now if ready else 0
+
+
+class SimulatedBackend(DeviceBackend):
+    """RCDevices stand-in for load and soak tests on any OS.
+
+    device_count    devices connected at start
+    hotplug_rate    plug/unplug events per second (0 - static set)
+    max_devices     upper bound of connected devices during hot-plug
+    latency_ms      delay of every call (DLL/USB round trip)
+    failure_rate    probability that a call fails like the DLL does
+                    (size 0 / None or non-zero database result)
+    not_ready_rate  probability that a new device has failed tests
+    """
+
+    mode = "Simulator"
+
+    def __init__(
+        self,
+        device_count=1,
+        hotplug_rate=0.0,
+        max_devices=None,
+        latency_ms=0.0,
+        failure_rate=0.0,
+        not_ready_rate=0.0,
+        models=("RC-102", "RC-103", "RC-103G", "RC-110", "RC-410"),
+        seed=None,
+    ):
+        self.hotplug_rate = hotplug_rate
+        self.max_devices = max(device_count, 1) if max_devices is None else max_devices
+        self.latency = latency_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.not_ready_rate = not_ready_rate
+        self.models = tuple(models)
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_handle = 0x1000
+        self._next_number = 1
+        self._devices = {}
+        self._last_event = time.monotonic()
+        for _ in range(device_count):
+            self.plug()
+
+    # --- test control ---
+    def plug(self, serial=None, ready=None):
+        """Connect a device. Returns its handle"""
+        with self._lock:
+            return self._plug(serial, ready)
+
+    def unplug(self, handle=None):
+        """Disconnect a device (random one without handle)"""
+        with self._lock:
+            self._unplug(handle)
+
+    def _plug(self, serial=None, ready=None):
+        if serial is None:
+            model = self._random.choice(self.models)
+            serial = f"{model}-{self._next_number:06d}"
+            self._next_number += 1
+        if ready is None:
+            ready = self._random.random() >= self.not_ready_rate
+        handle = self._next_handle
+        self._next_handle += 1
+        mcu_id = [self._random.randrange(256) for _ in range(12)]
+        self._devices[handle] = SimulatedDevice(handle, serial, mcu_id, ready)
+        return handle
+
+    def _unplug(self, handle=None):
+        if not self._devices:
+            return
+        if handle is None:
+            handle = self._random.choice(list(self._devices))
+        self._devices.pop(handle, None)
+
+    def _hotplug(self):
+        if self.hotplug_rate <= 0:
+            return
+        now = time.monotonic()
+        elapsed, self._last_event = now - self._last_event, now
+        # Poisson approximation: expected events in the elapsed interval
+        events = int(elapsed * self.hotplug_rate + self._random.random())
+        for _ in range(events):
+            if self._devices and (len(self._devices) >= self.max_devices or self._random.random() < 0.5):
+                self._unplug()
+            else:
+                self._plug()
+
+    def _call(self):
+        """Common per-call work: latency and failure injection. True if the call fails"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            failed = self.failure_rate > 0 and self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+            return failed
+
+    # --- DeviceBackend ---
+    def get_device_list(self):
+        self._call()
+        with self._lock:
+            self._hotplug()
+            return list(self._devices)
+
+    def get_device_mcu_id(self, handle):
+        failed = self._call()
+        device = self._devices.get(handle)
+        if failed or device is None:
+            return None
+        return list(device.mcu_id)
+
+    def get_device_serial(self, handle):
+        failed = self._call()
+        device = self._devices.get(handle)
+        if failed or device is None:
+            return None
+        return device.serial
+
+    def get_device_database_info(self, handle):
+        failed = self._call()
+        device = self._devices.get(handle)
+        if failed or device is None:
+            return {"result": ERR_DB_FAILED, "tests_ok": 0, "calibration_ok": 0, "prog_time": 0, "calib_time": 0}
+        return {
+            "result": ERR_DB_OK,
+            "tests_ok": device.tests_ok,
+            "calibration_ok": device.calibration_ok,
+            "prog_time": device.prog_time,
+            "calib_time": device.calib_time
+        }
+
+
+def create_backend(settings=None):
+    """Backend from the [hardware] section of conf.toml (DLL when not configured).
+    RCDEVICES_BACKEND environment variable overrides the configured backend"""
+    settings = settings or {}
+    backend = os.environ.get("RCDEVICES_BACKEND") or settings.get("backend", "dll")
+    if backend == "dll":
+        return DllBackend(settings.get("dll_path") or None)
+    if backend == "simulator":
+        return SimulatedBackend(**settings.get("simulator", {}))
+    raise ValueError(f"Unknown hardware backend: {backend}")
+
 
 class RCDevicesClient:
-    def __init__(self):
-        init_dll()
-    
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else DllBackend()
+
     def get_device_list(self):
         """Get list of devices"""
-        return get_device_list()
-    
+        return self.backend.get_device_list()
+
     def get_device_count(self):
         """Get number of devices"""
-        return len(get_device_list())
-    
+        return len(self.backend.get_device_list())
+
     def get_device_mcu_id(self, handle):
         """Get device MCU ID"""
-        return get_device_mcu_id(handle)
-    
+        return self.backend.get_device_mcu_id(handle)
+
     def get_device_serial(self, handle):
         """Get device serial number"""
-        return get_device_serial(handle)
-    
+        return self.backend.get_device_serial(handle)
+
     def get_device_database_info(self, handle):
         """Get device database information"""
-        return get_device_database_info(handle)
-    
+        return self.backend.get_device_database_info(handle)
+
+    def get_device_info(self, handle):
+        """Get all information for one device"""
+        return {
+            "handle": handle,
+            "mcu_id": self.backend.get_device_mcu_id(handle),
+            "serial": self.backend.get_device_serial(handle),
+            "db_info": self.backend.get_device_database_info(handle)
+        }
+
     def get_all_devices_info(self):
         """Get all information for all devices"""
-        devices = get_device_list()
-        result = []
-        
-        for handle in devices:
-            device_info = {
-                "handle": handle,
-                "mcu_id": get_device_mcu_id(handle),
-                "serial": get_device_serial(handle),
-                "db_info": get_device_database_info(handle)
-            }
-            result.append(device_info)
-        
-        return result
-    
+        return [self.get_device_info(handle) for handle in self.backend.get_device_list()]
+
     def get_single_device(self):
         """Get single device info. Raises exception if 0 or more than 1 device found"""
-        device_count = self.get_device_count()
-        
+        devices = self.backend.get_device_list()
+        device_count = len(devices)
+
         if device_count == 0:
             raise Exception("No devices found. Check connection and drivers.")
         elif device_count > 1:
             raise Exception(f"Multiple devices found ({device_count}). Only single device mode supported.")
-        
+
         # Get info for the single device
-        all_devices = self.get_all_devices_info()
-        return all_devices[0]
-    
+        return self.get_device_info(devices[0])
+
     def get_version(self):
         """Get version info"""
         return {
             "success": True,
             "version": "2.0",
             "architecture": "64-bit" if platform.machine().endswith('64') else "32-bit",
-            "mode": "Direct DLL"
+            "mode": self.backend.mode
         }
 
 def main():
     try:
-        # Create client
-        client = RCDevicesClient()
-        
+        # Create client (--simulate: no DLL/hardware needed)
+        backend = SimulatedBackend(latency_ms=5) if "--simulate" in sys.argv else None
+        client = RCDevicesClient(backend)
+
         # Check version
         version_info = client.get_version()
         print(f"DLL Client version: {version_info['version']} ({version_info['architecture']}) - {version_info['mode']}")
-        
+
         # Get single device (will fail if 0 or >1 devices)
         try:
             print("\n=== ПЕРВЫЙ ВЫЗОВ ===")
             device = client.get_single_device()
             print("Single device mode: SUCCESS")
-            
+
             handle = device["handle"]
             print(f"Handle: 0x{handle:X}")
-            
+
             # Serial number
             serial = device["serial"]
             if serial:
                 print(f"Serial: {serial}")
             else:
                 print("Serial: Error")
-            
+
             # Database info
             db_info = device["db_info"]
             print(f"Database result: {db_info['result']}")
             print(f"Tests OK: {db_info['tests_ok']}")
             print(f"Calibration OK: {db_info['calibration_ok']}")
-            
+
             # ВТОРОЙ ВЫЗОВ для проверки
             print("\n=== ВТОРОЙ ВЫЗОВ (через 2 секунды) ===")
-            import time
             time.sleep(0.1)
-            
+
             device2 = client.get_single_device()
             db_info2 = device2["db_info"]
             print(f"Database result: {db_info2['result']}")
             print(f"Tests OK: {db_info2['tests_ok']}")
             print(f"Calibration OK: {db_info2['calibration_ok']}")
-            
+
             # ТРЕТИЙ ВЫЗОВ для проверки
             print("\n=== ТРЕТИЙ ВЫЗОВ (через 5 секунд) ===")
             time.sleep(0.1)
-            
+
             device3 = client.get_single_device()
             db_info3 = device3["db_info"]
             print(f"Database result: {db_info3['result']}")
             print(f"Tests OK: {db_info3['tests_ok']}")
             print(f"Calibration OK: {db_info3['calibration_ok']}")
-        
+
         except Exception as device_error:
             print(f"Single device mode: FAILED - {device_error}")
-    
+
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
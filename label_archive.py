@@ -0,0 +1,466 @@
+# Append-only archive of every printed label (exact bytes sent to the printer)
+# -*- coding: utf-8 -*-
+import hashlib
+import heapq
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+KINDS = {"pdf": 1, "tspl": 2}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+SERIAL_BYTES = 32
+
+# Segment record: header, then `length` data bytes unless it is a reference
+# to identical bytes stored earlier (reprint). The CRC covers the header.
+RECORD_MAGIC = b"RCLA"
+RECORD = struct.Struct("<4sBB32sqI32sIQ")  # magic, kind, is_ref, serial, printed_ms, length, sha256, segment, offset
+RECORD_CRC = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + RECORD_CRC.size
+
+# Index file: header, then fixed-size entries sorted by (serial, printed_ms)
+INDEX_MAGIC = b"RCLAIDX1"
+INDEX_HEADER = struct.Struct("<8sIQQ")  # magic, covered segment, covered offset, entries
+INDEX_ENTRY = struct.Struct("<32sq16sIQIB3x")  # serial, printed_ms, sha256[:16], segment, offset, length, kind
+INDEX_NAME = "index.idx"
+
+SEGMENT_NAME = re.compile(r"^seg-(\d{6})-(\d{8})\.pack$")
+
+
+class ArchiveError(Exception):
+    """Archive record unreadable or not matching its checksum"""
+
+
+def _serial_key(serial):
+    key = serial.encode("utf-8")
+    if not key or len(key) > SERIAL_BYTES:
+        raise ValueError(f"Serial number must be 1..{SERIAL_BYTES} bytes: {serial!r}")
+    return key.ljust(SERIAL_BYTES, b"\0")
+
+
+def _serial_text(key):
+    return key.rstrip(b"\0").decode("utf-8", "replace")
+
+
+def _entry_dict(entry):
+    serial, printed_ms, _digest, segment, offset, length, kind = entry
+    return {
+        "serial": _serial_text(serial),
+        "printed_at": printed_ms / 1000.0,
+        "kind": KIND_NAMES.get(kind, "unknown"),
+        "segment": segment,
+        "offset": offset,
+        "length": length,
+    }
+
+
+class LabelArchive:
+    """Label bytes in append-only segment files, looked up by serial number.
+
+    Storing a label is one sequential write of a record (header + bytes) to
+    the current segment; a reprint with identical bytes writes a header that
+    references the earlier copy. The index is a sorted file of fixed-size
+    entries, memory-mapped and binary-searched; entries written since it was
+    built are kept in memory (rebuilt from the segments on open) and merged
+    into it when a segment is rotated (by size or date) and on close().
+
+    read_only: for tools next to the printing process - no writes at all
+    (no recovery truncation, no index merge) and the index is read into
+    memory instead of mapped, so the writer can still replace it.
+    """
+
+    def __init__(
+        self, directory, max_segment_bytes=256 << 20, rotate_daily=True, fsync=True, logger=None, read_only=False
+    ):
+        self.directory = directory
+        self.read_only = read_only
+        self.max_segment_bytes = max_segment_bytes
+        self.rotate_daily = rotate_daily
+        self.fsync = fsync
+        self.logger = logger
+        self.stored = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._tail = {}  # serial key -> [index entry tuples], not yet in the index file
+        self._tail_count = 0
+        self._index_file = None
+        self._index = None  # mmap of the index file
+        self._index_count = 0
+        self._writer = None
+        self._paths = {}  # segment number -> path
+        self._segment = 0  # number of the newest segment
+        self._segment_day = None
+        if read_only:
+            if not os.path.isdir(directory):
+                raise ArchiveError(f"No label archive in {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self._open_index()
+        self._recover()
+
+    # --- segments ---
+
+    def _segments(self):
+        """(number, day, path) of all segments, oldest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), match.group(2), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _read_records(self, path, start=0, with_data=False):
+        """Yield (offset, fields, data) of the records of a segment from `start`.
+        Stops at the first damaged record; the generator's return value is
+        the offset where the valid records end"""
+        with open(path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while True:
+                raw = f.read(RECORD_SIZE)
+                if len(raw) < RECORD_SIZE:
+                    return offset
+                fields = RECORD.unpack_from(raw)
+                (crc,) = RECORD_CRC.unpack_from(raw, RECORD.size)
+                if fields[0] != RECORD_MAGIC or zlib.crc32(raw[: RECORD.size]) != crc:
+                    return offset
+                is_ref, length = fields[2], fields[5]
+                data = None
+                if not is_ref:
+                    if with_data:
+                        data = f.read(length)
+                        if len(data) < length:
+                            return offset
+                    else:
+                        f.seek(length, os.SEEK_CUR)
+                        if f.tell() > os.fstat(f.fileno()).st_size:
+                            return offset
+                yield offset, fields, data
+                offset = f.tell()
+
+    @staticmethod
+    def _index_entry(segment, offset, fields):
+        _magic, kind, is_ref, serial, printed_ms, length, digest, blob_segment, blob_offset = fields
+        if is_ref:
+            segment, offset = blob_segment, blob_offset
+        else:
+            offset += RECORD_SIZE
+        return (serial, printed_ms, digest[:16], segment, offset, length, kind)
+
+    def _recover(self):
+        """Rebuild the in-memory tail from the records after the index watermark;
+        cut off a torn write at the end of the last segment (read-only: the
+        writer may be in the middle of that write, leave it)"""
+        covered_segment, covered_offset = self._covered
+        segments = self._segments()
+        for number, _day, path in segments:
+            self._paths[number] = path
+            if number < covered_segment:
+                continue
+            start = covered_offset if number == covered_segment else 0
+            records = self._read_records(path, start)
+            while True:
+                try:
+                    offset, fields, _data = next(records)
+                except StopIteration as end:
+                    valid = end.value
+                    break
+                self._add_to_tail(self._index_entry(number, offset, fields))
+            size = os.path.getsize(path)
+            if valid < size and not self.read_only:
+                if number == segments[-1][0]:
+                    if self.logger:
+                        self.logger.warning("Label archive: dropping %s bytes of a torn write in %s", size - valid, path)
+                    with open(path, "r+b") as f:
+                        f.truncate(valid)
+                elif self.logger:
+                    self.logger.error("Label archive: damaged record at %s:%s, run verify", path, valid)
+        if segments:
+            self._segment, self._segment_day = segments[-1][0], segments[-1][1]
+
+    def _current_writer(self, incoming):
+        """Segment open for appending, rotated by size and date"""
+        day = datetime.now().strftime("%Y%m%d")
+        if self._writer is None and self._segment:
+            self._writer = open(self._paths[self._segment], "ab")  # resume after a restart
+        if self._writer is not None:
+            size = self._writer.tell()
+            if (size and size + incoming > self.max_segment_bytes) or (
+                self.rotate_daily and day != self._segment_day
+            ):
+                self._writer.close()
+                self._writer = None
+                self._segment += 1
+                self._merge_index((self._segment, 0))
+            else:
+                return self._writer
+        else:
+            self._segment += 1
+        path = os.path.join(self.directory, f"seg-{self._segment:06d}-{day}.pack")
+        self._paths[self._segment] = path
+        self._segment_day = day
+        self._writer = open(path, "ab")
+        return self._writer
+
+    # --- index ---
+
+    def _open_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if self.read_only:
+            # A copy: an open mapping keeps the writer from replacing the file on Windows
+            try:
+                with open(path, "rb") as f:
+                    self._index = f.read()
+            except FileNotFoundError:
+                self._index = INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0)
+        else:
+            if not os.path.exists(path):
+                self._write_index_file(path, [], 0, 0)
+            self._index_file = open(path, "rb")
+            self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, segment, offset, count = INDEX_HEADER.unpack_from(self._index)
+        if magic != INDEX_MAGIC or len(self._index) != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+            raise ArchiveError(f"Damaged index {path}: delete it to rebuild from the segments")
+        self._covered = (segment, offset)
+        self._index_count = count
+
+    def _close_index(self):
+        if self._index_file is not None:
+            self._index.close()
+            self._index_file.close()
+        self._index = self._index_file = None
+
+    @staticmethod
+    def _write_index_file(path, entries, segment, offset):
+        tmp = f"{path}.tmp"
+        count = 0
+        with open(tmp, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, segment, offset, 0))
+            for entry in entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+                count += 1
+            f.seek(0)
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, segment, offset, count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _index_entries(self, start=0, stop=None):
+        stop = self._index_count if stop is None else stop
+        for i in range(start, stop):
+            yield INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self._index_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = INDEX_HEADER.size + mid * INDEX_ENTRY.size
+            if self._index[start : start + SERIAL_BYTES] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _add_to_tail(self, entry):
+        self._tail.setdefault(entry[0], []).append(entry)
+        self._tail_count += 1
+
+    def _merge_index(self, covered):
+        """Fold the in-memory tail into a new index file (one sequential pass);
+        `covered` is the (segment, offset) the new index reaches"""
+        if not self._tail_count and self._covered == covered:
+            return
+        tail = sorted(entry for entries in self._tail.values() for entry in entries)
+        path = os.path.join(self.directory, INDEX_NAME)
+        merged = heapq.merge(self._index_entries(), tail)
+        self._write_index_file(f"{path}.new", merged, *covered)
+        self._close_index()
+        os.replace(f"{path}.new", path)
+        self._tail.clear()
+        self._tail_count = 0
+        self._open_index()
+
+    # --- public ---
+
+    def store(self, serial, kind, data):
+        """Archive the bytes of a printed label. Returns its index entry dict"""
+        if self.read_only:
+            raise ArchiveError("Label archive is opened read-only")
+        key = _serial_key(serial)
+        digest = hashlib.sha256(data).digest()
+        printed_ms = int(time.time() * 1000)
+        with self._lock:
+            same = next((e for e in reversed(self._entries(key)) if e[2] == digest[:16] and e[5] == len(data)), None)
+            writer = self._current_writer(RECORD_SIZE + (0 if same else len(data)))
+            offset = writer.tell()
+            if same is not None:
+                fields = (RECORD_MAGIC, KINDS[kind], 1, key, printed_ms, len(data), digest, same[3], same[4])
+                payload = b""
+                self.deduplicated += 1
+            else:
+                fields = (RECORD_MAGIC, KINDS[kind], 0, key, printed_ms, len(data), digest, 0, 0)
+                payload = data
+            header = RECORD.pack(*fields)
+            writer.write(header + RECORD_CRC.pack(zlib.crc32(header)) + payload)
+            writer.flush()
+            if self.fsync:
+                os.fsync(writer.fileno())
+            entry = self._index_entry(self._segment, offset, fields)
+            self._add_to_tail(entry)
+            self.stored += 1
+        return _entry_dict(entry)
+
+    def _entries(self, key):
+        start = self._lower_bound(key)
+        entries = []
+        for entry in self._index_entries(start):
+            if entry[0] != key:
+                break
+            entries.append(entry)
+        entries.extend(self._tail.get(key, ()))
+        entries.sort(key=lambda e: e[1])
+        return entries
+
+    def history(self, serial):
+        """All archived prints of a serial, oldest first"""
+        with self._lock:
+            return [_entry_dict(e) for e in self._entries(_serial_key(serial))]
+
+    def get(self, serial, index=-1):
+        """(entry dict, bytes) of a print of the serial (default the latest), None if never archived"""
+        with self._lock:
+            entries = self._entries(_serial_key(serial))
+            if not entries:
+                return None
+            entry = entries[index]
+            path = self._paths.get(entry[3])
+            if path is None:
+                raise ArchiveError(f"Segment {entry[3]} of {serial} is missing")
+        with open(path, "rb") as f:
+            f.seek(entry[4])
+            data = f.read(entry[5])
+        if len(data) != entry[5] or hashlib.sha256(data).digest()[:16] != entry[2]:
+            raise ArchiveError(f"Archived label of {serial} does not match its checksum")
+        return _entry_dict(entry), data
+
+    def verify(self):
+        """Check every record (header CRC, data SHA-256, references) and the index"""
+        errors = []
+        records = data_bytes = 0
+        blobs = {}  # (segment, data offset) -> sha256
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+            segments = self._segments()
+            for number, _day, path in segments:
+                reader = self._read_records(path, with_data=True)
+                while True:
+                    try:
+                        offset, fields, data = next(reader)
+                    except StopIteration as end:
+                        if end.value != os.path.getsize(path):
+                            errors.append(f"{os.path.basename(path)}:{end.value}: damaged record")
+                        break
+                    records += 1
+                    digest, serial = fields[6], _serial_text(fields[3])
+                    if fields[2]:
+                        if blobs.get((fields[7], fields[8])) != digest:
+                            errors.append(f"{os.path.basename(path)}:{offset}: {serial} references missing data")
+                    elif hashlib.sha256(data).digest() != digest:
+                        errors.append(f"{os.path.basename(path)}:{offset}: {serial} checksum mismatch")
+                    else:
+                        blobs[(number, offset + RECORD_SIZE)] = digest
+                        data_bytes += len(data)
+            previous = None
+            for entry in self._index_entries():
+                if previous is not None and entry[:2] < previous[:2]:
+                    errors.append(f"index not sorted at {_serial_text(entry[0])}")
+                    break
+                if blobs.get((entry[3], entry[4]), b"")[:16] != entry[2]:
+                    errors.append(f"index entry of {_serial_text(entry[0])} points to no data")
+                previous = entry
+        return {
+            "ok": not errors,
+            "segments": len(segments),
+            "records": records,
+            "data_bytes": data_bytes,
+            "errors": errors,
+        }
+
+    def stats(self):
+        with self._lock:
+            segments = self._segments()
+            return {
+                "entries": self._index_count + self._tail_count,
+                "indexed": self._index_count,
+                "segments": len(segments),
+                "bytes": sum(os.path.getsize(path) for _n, _d, path in segments),
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._segment and not self.read_only:
+                self._merge_index((self._segment, os.path.getsize(self._paths[self._segment])))
+            self._close_index()
+
+
+def main():
+    import argparse
+    import sys
+
+    import toml
+
+    parser = argparse.ArgumentParser(description="Printed label archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get = commands.add_parser("get", help="write the archived label of a serial to a file")
+    get.add_argument("serial")
+    get.add_argument("-o", "--output", help="file name (default <serial>.<kind>)")
+    get.add_argument("--print-index", type=int, default=-1, help="which print: 0 first, -1 latest")
+    commands.add_parser("history", help="all archived prints of a serial").add_argument("serial")
+    commands.add_parser("verify", help="check all segments and the index")
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    settings = toml.load("conf.toml")["archive"]
+    # Read-only: the printing app may be writing this archive right now
+    try:
+        archive = LabelArchive(settings["directory"], read_only=True)
+    except ArchiveError as e:
+        sys.exit(str(e))
+    try:
+        if args.command == "get":
+            found = archive.get(args.serial, args.print_index)
+            if found is None:
+                sys.exit(f"{args.serial}: not archived")
+            entry, data = found
+            output = args.output or f"{args.serial}.{entry['kind']}"
+            with open(output, "wb") as f:
+                f.write(data)
+            print(f"{output}: {len(data)} bytes, printed {datetime.fromtimestamp(entry['printed_at'])}")
+        elif args.command == "history":
+            for entry in archive.history(args.serial):
+                print(f"{datetime.fromtimestamp(entry['printed_at'])}  {entry['kind']}  {entry['length']} bytes")
+        elif args.command == "verify":
+            result = archive.verify()
+            for error in result["errors"]:
+                print(error)
+            print(f"{result['records']} records in {result['segments']} segments: {'OK' if result['ok'] else 'DAMAGED'}")
+            sys.exit(0 if result["ok"] else 1)
+        else:
+            for name, value in archive.stats().items():
+                print(f"{name}: {value}")
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
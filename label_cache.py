@@ -0,0 +1,151 @@
+# On-disk content-addressed cache of rendered labels (PDF and raster bytes)
+# -*- coding: utf-8 -*-
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_digest(path: str):
+    """SHA-256 of a file, memoized by (path, mtime, size)"""
+    st = os.stat(path)
+    return _file_digest(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_digest(path, _mtime_ns, _size):
+    # mtime and size only key the memo: a changed file gets a new entry
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    """Stable key from render inputs (serial, layout hash, template hash, ...)"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class LabelCache:
+    """Size-capped LRU cache of label bytes on disk.
+
+    Entries live in <directory>/<key[:2]>/<key>.<kind>. Recency is the file
+    mtime, refreshed on every hit, so the LRU order survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, logger=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, oldest first
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    try:
+                        os.remove(path)  # interrupted write
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        for _mtime, path, size in sorted(found):
+            self._entries[path] = size
+            self._total += size
+        self._evict()
+
+    def _path(self, key: str, kind: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{kind}")
+
+    def get(self, key: str, kind: str):
+        """Return cached bytes or None"""
+        path = self._path(key, kind)
+        with self._lock:
+            if path not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget(path)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, kind: str, data: bytes):
+        """Store bytes atomically (write temp file, then rename)"""
+        path = self._path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("Label cache write failed: %s", e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._forget(path)
+            self._entries[path] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def _forget(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            while self._entries:
+                path, _size = self._entries.popitem(last=False)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,519 @@
+# Compiled label layout and conf.toml hot reload
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import string
+import threading
+import time
+
+import toml
+from reportlab.lib.units import mm
+
+LABEL_WIDTH_MM = 51
+LABEL_HEIGHT_MM = 25
+FONT_NAME = "Helvetica-Bold"
+
+# Position keys of [label_positions] (x, y pairs in mm)
+POSITION_KEYS = (
+    "serial_number_prefix",
+    "serialLabel",
+    "typeLabel",
+    "fccLabel",
+    "powerULabel",
+    "powerALabel",
+    "powerWLabel",
+    "powerILabel",
+    "powermAhLabel",
+    "powerWhLabel",
+)
+FONT_SIZE_KEYS = ("serialLabel_font_size", "typeLabel_font_size", "powerLabels_font_size")
+
+# Per-model label texts: type, FCC ID and power labels
+# Power order: U (input), I (battery), A, W, mAh, Wh
+MODEL_TEXTS = {
+    "RC-102": (
+        "Type RADIACODE-102",
+        "FCC ID: 2BDDP-102",
+        ("5.0 V", "3.7 V", "0.5 A", "2.5 W", "1000 mAh", "3.7 Wh"),
+    ),
+    "RC-103": (
+        "Type RADIACODE-103",
+        "FCC ID: 2BDDP-103",
+        ("5.0 V", "3.7 V", "0.5 A", "2.5 W", "1000 mAh", "3.7 Wh"),
+    ),
+    "RC-103G": (
+        "Type RADIACODE-103G",
+        "FCC ID: 2BDDP-103",
+        ("5.0 V", "3.7 V", "0.5 A", "2.5 W", "1000 mAh", "3.7 Wh"),
+    ),
+    "RC-110": (
+        "Type RADIACODE-110",
+        "FCC ID: 2BDDP-110",
+        ("5.0 V", "3.7 V", "0.8 A", "4.0 W", "1500 mAh", "5.55 Wh"),
+    ),
+    "RC-410": (
+        "Type RADIACODE ZERO",
+        "FCC ID: 2BDDP-ZERO",
+        ("5.0 V", "3.7 V", "0.8 A", "4.0 W", "1500 mAh", "5.55 Wh"),
+    ),
+}
+POWER_KEYS = (
+    "powerULabel",
+    "powerILabel",
+    "powerALabel",
+    "powerWLabel",
+    "powermAhLabel",
+    "powerWhLabel",
+)
+
+# Label set member drawn from [label_positions] / [datamatrix] / template51x25.pdf
+DEVICE_LABEL = "device"
+# Placeholders of [labels.<name>] field texts
+FIELD_PLACEHOLDERS = ("serial", "model", "type", "fcc")
+
+# Allowed keys of [model_offsets.<model>] (mm)
+OFFSET_KEYS = tuple(f"{key}_dx_mm" for key in POSITION_KEYS) + (
+    "serial_split_dx_mm",
+)
+
+
+class _Frozen:
+    """Base for immutable slot objects"""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _init(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+
+class TextItem(_Frozen):
+    """Static text drawn at (x, y) points with a Helvetica-Bold font size"""
+
+    __slots__ = ("x", "y", "size", "text")
+
+    def __init__(self, x, y, size, text):
+        self._init(x=x, y=y, size=size, text=text)
+
+    def __repr__(self):
+        return f"TextItem({self.x:.3f}, {self.y:.3f}, {self.size}, {self.text!r})"
+
+
+class SerialRun(_Frozen):
+    """Part serial_number[start:end] drawn at (x, y) points"""
+
+    __slots__ = ("x", "y", "start", "end")
+
+    def __init__(self, x, y, start, end):
+        self._init(x=x, y=y, start=start, end=end)
+
+    def __repr__(self):
+        return f"SerialRun({self.x:.3f}, {self.y:.3f}, {self.start}, {self.end})"
+
+
+class ModelLayout(_Frozen):
+    """Compiled per-model label layout, coordinates in points"""
+
+    __slots__ = ("device_type", "static_items", "serial_runs", "serial_font_size", "fingerprint")
+
+    def __init__(self, device_type, static_items, serial_runs, serial_font_size, fingerprint):
+        self._init(
+            device_type=device_type,
+            static_items=static_items,
+            serial_runs=serial_runs,
+            serial_font_size=serial_font_size,
+            fingerprint=fingerprint,
+        )
+
+    def serial_text_runs(self, serial_number):
+        """Return (x, y, text) runs of a serial number"""
+        return [
+            (run.x, run.y, serial_number[run.start : run.end])
+            for run in self.serial_runs
+        ]
+
+
+class ExtraLabel(_Frozen):
+    """Compiled [labels.<name>] label (box, carton, ...), coordinates in points.
+
+    fields are TextItems whose text holds {serial}, {model}, {type}, {fcc};
+    dm_size 0 - no Data Matrix.
+    """
+
+    __slots__ = (
+        "name",
+        "width_mm",
+        "height_mm",
+        "width",
+        "height",
+        "template",
+        "copies",
+        "fields",
+        "dm_x",
+        "dm_y",
+        "dm_size",
+        "fingerprint",
+    )
+
+    def __init__(self, name, width_mm, height_mm, template, copies, fields, dm_x, dm_y, dm_size, fingerprint):
+        self._init(
+            name=name,
+            width_mm=width_mm,
+            height_mm=height_mm,
+            width=width_mm * mm,
+            height=height_mm * mm,
+            template=template,
+            copies=copies,
+            fields=fields,
+            dm_x=dm_x,
+            dm_y=dm_y,
+            dm_size=dm_size,
+            fingerprint=fingerprint,
+        )
+
+    def field_texts(self, serial_number, device_type):
+        """Return (x, y, size, text) of the fields with placeholders filled in"""
+        type_text, fcc_text, _power = MODEL_TEXTS[device_type]
+        values = {"serial": serial_number, "model": device_type, "type": type_text, "fcc": fcc_text}
+        return [(item.x, item.y, item.size, item.text.format(**values)) for item in self.fields]
+
+    def __repr__(self):
+        return f"ExtraLabel({self.name}, {self.width_mm}x{self.height_mm} mm, {len(self.fields)} fields)"
+
+
+class LabelLayout(_Frozen):
+    """Immutable, validated layout compiled from conf.toml"""
+
+    __slots__ = (
+        "width",
+        "height",
+        "dm_x",
+        "dm_y",
+        "dm_size",
+        "dm_pixels",
+        "models",
+        "labels",
+        "label_sets",
+        "fingerprint",
+        "source",
+        "mtime",
+    )
+
+    def __init__(
+        self, width, height, dm_x, dm_y, dm_size, dm_pixels, models, labels, label_sets, fingerprint, source, mtime
+    ):
+        self._init(
+            width=width,
+            height=height,
+            dm_x=dm_x,
+            dm_y=dm_y,
+            dm_size=dm_size,
+            dm_pixels=dm_pixels,
+            models=models,
+            labels=labels,
+            label_sets=label_sets,
+            fingerprint=fingerprint,
+            source=source,
+            mtime=mtime,
+        )
+
+    def model(self, device_type):
+        return self.models[device_type]
+
+    def label_set(self, device_type):
+        """Names of the labels printed for one unit of a model, in order"""
+        return self.label_sets[device_type]
+
+    def __repr__(self):
+        return f"LabelLayout({self.source}, {sorted(self.models)}, {self.fingerprint[:12]})"
+
+
+def _number(section, key, errors, positive=False, limit=None):
+    value = section.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        errors.append(f"{key}: expected number, got {value!r}")
+        return 0.0
+    if positive and value <= 0:
+        errors.append(f"{key}: must be > 0, got {value}")
+    if limit is not None and not 0 <= value <= limit:
+        errors.append(f"{key}: {value} outside label (0..{limit} mm)")
+    return float(value)
+
+
+def _fingerprint(*parts):
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _placeholder_errors(text):
+    """Problems of a field text: unknown or malformed {placeholders}"""
+    try:
+        names = [name for _literal, name, _spec, _conv in string.Formatter().parse(text) if name is not None]
+    except ValueError as e:
+        return [str(e)]
+    return [f"unknown placeholder {{{name}}}" for name in names if name not in FIELD_PLACEHOLDERS]
+
+
+def _compile_label(name, section, errors):
+    """Compile one [labels.<name>] section; problems go to errors"""
+    problems = []
+    width = _number(section, "width_mm", problems, positive=True)
+    height = _number(section, "height_mm", problems, positive=True)
+
+    template = section.get("template", "")
+    if not isinstance(template, str):
+        problems.append(f"template: expected path, got {template!r}")
+        template = ""
+    elif template and not os.path.isfile(template):
+        problems.append(f"template: {template} not found")
+
+    copies = section.get("copies", 1)
+    if isinstance(copies, bool) or not isinstance(copies, int) or copies <= 0:
+        problems.append(f"copies: expected positive integer, got {copies!r}")
+
+    fields = []
+    for i, field in enumerate(section.get("fields", [])):
+        field_problems = []
+        if not isinstance(field, dict):
+            problems.append(f"fields[{i}]: expected table, got {field!r}")
+            continue
+        text = field.get("text")
+        if not isinstance(text, str):
+            field_problems.append(f"text: expected string, got {text!r}")
+        else:
+            field_problems += [f"text: {problem}" for problem in _placeholder_errors(text)]
+        x = _number(field, "x_mm", field_problems, limit=width)
+        y = _number(field, "y_mm", field_problems, limit=height)
+        size = _number(field, "font_size", field_problems, positive=True)
+        problems += [f"fields[{i}].{problem}" for problem in field_problems]
+        fields.append(TextItem(x * mm, y * mm, size, text))
+
+    dm = section.get("datamatrix")
+    dm_x = dm_y = dm_size = 0.0
+    if dm is not None:
+        dm_problems = []
+        dm_x = _number(dm, "x_mm", dm_problems, limit=width)
+        dm_y = _number(dm, "y_mm", dm_problems, limit=height)
+        dm_size = _number(dm, "size_mm", dm_problems, positive=True)
+        problems += [f"datamatrix.{problem}" for problem in dm_problems]
+
+    errors += [f"labels.{name}.{problem}" for problem in problems]
+    if problems:
+        return None
+
+    fields = tuple(fields)
+    return ExtraLabel(
+        name,
+        width,
+        height,
+        template,
+        copies,
+        fields,
+        dm_x * mm,
+        dm_y * mm,
+        dm_size * mm,
+        _fingerprint(name, width, height, template, copies, fields, dm_x, dm_y, dm_size),
+    )
+
+
+def _compile_label_sets(sets, labels, errors):
+    """Model -> tuple of label names; "default" covers models not listed"""
+    compiled = {}
+    for model, names in sets.items():
+        if model != "default" and model not in MODEL_TEXTS:
+            errors.append(f"label_sets.{model}: unknown model")
+            continue
+        if not isinstance(names, list) or not names:
+            errors.append(f"label_sets.{model}: expected non-empty list of label names, got {names!r}")
+            continue
+        for name in names:
+            if name != DEVICE_LABEL and name not in labels:
+                errors.append(f"label_sets.{model}: unknown label {name!r}")
+        compiled[model] = tuple(names)
+
+    default = compiled.pop("default", (DEVICE_LABEL,))
+    return {model: compiled.get(model, default) for model in MODEL_TEXTS}
+
+
+def compile_layout(config: dict, source: str = "<dict>", mtime: float = 0.0):
+    """Compile conf.toml dict into LabelLayout. Raises ValueError listing all problems"""
+    errors = []
+    labels = config.get("label_positions", {})
+    dm = config.get("datamatrix", {})
+    offsets = config.get("model_offsets", {})
+
+    pos = {}
+    for key in POSITION_KEYS:
+        x = _number(labels, f"{key}_x_mm", errors, limit=LABEL_WIDTH_MM)
+        y = _number(labels, f"{key}_y_mm", errors, limit=LABEL_HEIGHT_MM)
+        pos[key] = (x, y)
+    sizes = {key: _number(labels, key, errors, positive=True) for key in FONT_SIZE_KEYS}
+
+    dm_x = _number(dm, "dm_x_mm", errors, limit=LABEL_WIDTH_MM)
+    dm_y = _number(dm, "dm_y_mm", errors, limit=LABEL_HEIGHT_MM)
+    dm_size = _number(dm, "dm_size_mm", errors, positive=True)
+    dm_pixels = dm.get("dm_pixels")
+    if not isinstance(dm_pixels, int) or dm_pixels <= 0:
+        errors.append(f"dm_pixels: expected positive integer, got {dm_pixels!r}")
+
+    for model, model_offsets in offsets.items():
+        if model not in MODEL_TEXTS:
+            errors.append(f"model_offsets.{model}: unknown model")
+            continue
+        for key in model_offsets:
+            if key not in OFFSET_KEYS:
+                errors.append(f"model_offsets.{model}.{key}: unknown offset")
+            else:
+                _number(model_offsets, key, errors)
+
+    labels = {}
+    for name, section in config.get("labels", {}).items():
+        if name == DEVICE_LABEL:
+            errors.append(f"labels.{name}: reserved for the device label")
+            continue
+        label = _compile_label(name, section, errors)
+        if label is not None:
+            labels[name] = label
+    label_sets = _compile_label_sets(config.get("label_sets", {}), config.get("labels", {}), errors)
+
+    if errors:
+        raise ValueError(f"Invalid layout in {source}: " + "; ".join(errors))
+
+    def point(key, model_offsets):
+        x, y = pos[key]
+        return (x + model_offsets.get(f"{key}_dx_mm", 0.0)) * mm, y * mm
+
+    models = {}
+    for model, (type_text, fcc_text, power_texts) in MODEL_TEXTS.items():
+        model_offsets = offsets.get(model, {})
+        power_size = sizes["powerLabels_font_size"]
+
+        items = [TextItem(*point("serial_number_prefix", model_offsets), power_size, "Ser.No.")]
+        items.append(TextItem(*point("typeLabel", model_offsets), sizes["typeLabel_font_size"], type_text))
+        items.append(TextItem(*point("fccLabel", model_offsets), power_size, fcc_text))
+        for key, text in zip(POWER_KEYS, power_texts):
+            items.append(TextItem(*point(key, model_offsets), power_size, text))
+
+        serial_x, serial_y = point("serialLabel", model_offsets)
+        split_dx = model_offsets.get("serial_split_dx_mm")
+        if split_dx is None:
+            runs = (SerialRun(serial_x, serial_y, 0, None),)
+        else:
+            # "RC-" + "410-000000" с микро отступом
+            runs = (
+                SerialRun(serial_x, serial_y, 0, 3),
+                SerialRun(serial_x + split_dx * mm, serial_y, 3, None),
+            )
+
+        items = tuple(items)
+        serial_size = sizes["serialLabel_font_size"]
+        models[model] = ModelLayout(
+            model,
+            items,
+            runs,
+            serial_size,
+            _fingerprint(model, items, runs, serial_size, dm_x, dm_y, dm_size),
+        )
+
+    return LabelLayout(
+        LABEL_WIDTH_MM * mm,
+        LABEL_HEIGHT_MM * mm,
+        dm_x * mm,
+        dm_y * mm,
+        dm_size * mm,
+        dm_pixels,
+        models,
+        labels,
+        label_sets,
+        _fingerprint(
+            sorted((m, l.fingerprint) for m, l in models.items()),
+            dm_pixels,
+            sorted((name, label.fingerprint) for name, label in labels.items()),
+            sorted(label_sets.items()),
+        ),
+        source,
+        mtime,
+    )
+
+
+def load_layout(config_file: str):
+    """Read and compile layout from a TOML file"""
+    mtime = os.path.getmtime(config_file)
+    with open(config_file, "r", encoding="utf-8") as f:
+        config = toml.load(f)
+    return compile_layout(config, config_file, mtime)
+
+
+class LayoutWatcher:
+    """Poll conf.toml and hand a freshly compiled layout to on_change.
+
+    Invalid files are logged and ignored - the previous layout stays active.
+    """
+
+    def __init__(self, config_file, on_change, logger, interval=1.0):
+        self.config_file = config_file
+        self.on_change = on_change
+        self.logger = logger
+        self.interval = interval
+        self._stamp = self._file_stamp()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.config_file)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="LayoutWatcher", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self):
+        """Reload if the file changed. Returns True when a new layout was applied"""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+
+        try:
+            layout = load_layout(self.config_file)
+        except Exception as e:
+            self.logger.error("Layout reload failed, keeping previous layout: %s", e)
+            return False
+
+        self.on_change(layout)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error("Layout watcher error: %s", e)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    compiled = load_layout("conf.toml")
+    print(f"{compiled} compiled in {(time.perf_counter() - started) * 1000:.2f} ms")
+    for name, model_layout in compiled.models.items():
+        print(name, model_layout.serial_runs, len(model_layout.static_items), "items", compiled.label_set(name))
+    for label in compiled.labels.values():
+        print(label)
@@ -0,0 +1,97 @@
+# Logging off the request threads: queue handler, background writer, JSON lines
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LEVEL_OFF = logging.CRITICAL + 10
+
+_listener = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues the record as is: the message is formatted by the writer thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message"""
+
+    def format(self, record):
+        entry = {
+            "time": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_level(name):
+    """Level number of "DEBUG" ... "CRITICAL" or "OFF" """
+    name = str(name).upper()
+    if name == "OFF":
+        return LEVEL_OFF
+    level = logging.getLevelName(name)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+def setup_logging(settings):
+    """Route all loggers through one queue to a background writer thread.
+
+    settings is the [logging] section of conf.toml; the first call wins,
+    later calls return the running listener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    # Records are created on the request threads: skip the caller lookup and
+    # process fields nothing prints
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    handlers = []
+    if settings["console"]:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console)
+    if settings["file"]:
+        directory = os.path.dirname(settings["file"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        log_file = logging.handlers.RotatingFileHandler(
+            settings["file"],
+            maxBytes=int(settings["max_file_mb"] * 1024 * 1024),
+            backupCount=settings["backup_count"],
+            encoding="utf-8",
+            delay=True,
+        )
+        log_file.setFormatter(JsonFormatter())
+        handlers.append(log_file)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(parse_level(settings["level"]))
+    for name, level in settings["levels"].items():
+        logging.getLogger(name).setLevel(parse_level(level))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # drains the queue
+    return _listener
@@ -1,13 +1,34 @@
 # Flask server with simplified print_labels
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template, request, jsonify
+from warmup import Warmup  # first: its import time is the startup reference
+from flask import Flask, Response, render_template, request, jsonify, send_file
 from print_labels import LabelPrinter  # Используем упрощенную версию
-from hardware import RCDevicesClient
+from hardware import RCDevicesClient, create_backend
+from serial_ingest import ingest_stream, parse_column
+from production_stats import ProductionStats, StatsPoller
+from tracing import TraceStore, span
+from throughput import ThroughputLog
+from scan_events import PendingScans, ScanReconciler
+from profiling import RequestProfiler
+from label_archive import ArchiveError
+from batch_pipeline import BatchPipeline
+from readiness import (
+    ReadinessCache,
+    check_readiness,
+    create_source,
+    describe_failed,
+    readiness_rules,
+    split_by_readiness,
+)
 import requests
 import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import io
+import logging
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import toml
 import sys
@@ -24,6 +45,9 @@ INVENTREE_HEADERS = {
 }
 
 
+LABEL_TEMPLATE = "template51x25.pdf"
+
+
 # Configuration settings
 class Config:
     DEVICE_VALIDATION_ENABLED = True
@@ -32,15 +56,118 @@ class Config:
     REQUIRE_PROG_TIME = True
     REQUIRE_CALIB_TIME = True
     PHYSICAL_PRINT_ENABLED = True
-    WEBHOOK_API_BASE = "http://192.168.88.132:9000"
+    WEBHOOK_API_BASE = os.environ.get("WEBHOOK_API_BASE", "http://192.168.88.132:9000")
     WEBHOOK_TIMEOUT = 5
+    # Shared secret of POST /hooks/scanned (X-Webhook-Token), empty - no check
+    WEBHOOK_PUSH_TOKEN = os.environ.get("WEBHOOK_PUSH_TOKEN", "")
+    SCAN_RECONCILE_INTERVAL = 30
+    SCAN_WAIT_MAX = 25
+    PREVIEW_DPI = 150
+    STATS_POLL_INTERVAL = 15
 
 
 config = Config()
 
 # Create instances
 printer = LabelPrinter()
-rc_client = RCDevicesClient()
+settings = toml.load(printer.config_file)
+rc_client = RCDevicesClient(create_backend(settings["hardware"]))
+
+# Per-unit traces: device connect -> validation -> print -> scan
+traces = TraceStore(
+    settings["tracing"]["file"],
+    max_traces=settings["tracing"]["max_traces"],
+    max_file_bytes=settings["tracing"]["max_file_mb"] * 1024 * 1024,
+    enabled=settings["tracing"]["enabled"],
+)
+
+# Step timestamps per unit for cycle time / UPH analytics
+throughput = ThroughputLog(settings["analytics"]["database"], printer.station_id)
+
+# Readiness of serials without a connected device (CLI / batch printing),
+# checked with the same rules as /device_status
+readiness = ReadinessCache(
+    create_source(settings["database"], logging.getLogger("readiness")),
+    ttl=settings["database"]["cache_ttl"],
+)
+
+# Request profiling, switched on at runtime via /toggle_profiling
+profiler = RequestProfiler(
+    app,
+    settings["profiling"]["directory"],
+    max_profiles=settings["profiling"]["max_profiles"],
+    sample_interval=settings["profiling"]["sample_interval_ms"] / 1000.0,
+    logger=logging.getLogger("profiling"),
+)
+
+
+def fetch_recent_devices(limit: int, minutes: int):
+    """Recently scanned devices from the webhook API"""
+    response = requests.post(
+        f"{config.WEBHOOK_API_BASE}/hooks/get-devices",
+        json={"path": "/api/devices", "limit": limit, "minutes": minutes},
+        timeout=config.WEBHOOK_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json().get("devices", [])
+
+
+# Production statistics are aggregated here, the browser only gets deltas
+production_stats = ProductionStats()
+stats_poller = StatsPoller(
+    production_stats,
+    fetch_recent_devices,
+    interval=config.STATS_POLL_INTERVAL,
+    logger=logging.getLogger("production_stats"),
+)
+
+
+def scan_confirmed(device):
+    """Scan event from the webhook push or the reconciliation poll"""
+    production_stats.apply_events([device])
+    serial = pending_scans.confirm(device)
+    if serial is not None:
+        throughput.step(serial, "scan")
+        trace = traces.for_serial(serial)
+        if trace is not None and not trace.finished:
+            trace.event("scan confirmed", scanner_id=device.get("scanner_id"))
+            traces.finish(trace)
+    return serial
+
+
+# Printed labels waiting for the scan; the webhook service pushes scans to
+# /hooks/scanned, the reconciler only catches pushes that got lost
+pending_scans = PendingScans()
+scan_reconciler = ScanReconciler(
+    pending_scans,
+    fetch_recent_devices,
+    scan_confirmed,
+    interval=config.SCAN_RECONCILE_INTERVAL,
+    logger=logging.getLogger("scan_events"),
+)
+
+
+# Everything the first /print_label would otherwise initialize lazily
+warmup = Warmup(
+    [
+        ("device enumeration", rc_client.get_device_list),
+        ("data matrix encoder", lambda: printer.create_datamatrix_image("RC-110-000000")),
+    ]
+    + [
+        (f"label {model}", lambda model=model: printer.warm_up(model, LABEL_TEMPLATE))
+        for model in sorted(printer.layout.models)
+    ],
+    logger=logging.getLogger("warmup"),
+)
+
+
+def start_background_services():
+    """Threads of the web/desktop modes: warm-up, layout hot reload,
+    statistics polling, scan reconciliation"""
+    warmup.start()
+    printer.watch_layout()
+    stats_poller.start()
+    scan_reconciler.start()
 
 
 @app.route("/")
@@ -48,6 +175,19 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/splash")
+def splash():
+    """Shown by the desktop window until /ready reports the warm-up done"""
+    return render_template("splash.html")
+
+
+@app.route("/ready")
+def ready():
+    """Warm-up state and startup metrics; 503 until warm-up is done"""
+    status = warmup.status()
+    return jsonify({"success": status["ready"], **status}), 200 if status["ready"] else 503
+
+
 @app.route("/toggle_validation", methods=["POST"])
 def toggle_validation():
     try:
@@ -78,6 +218,45 @@ def toggle_print():
         return jsonify({"success": False, "message": f"Ошибка: {str(e)}"})
 
 
+@app.route("/toggle_profiling", methods=["POST"])
+def toggle_profiling():
+    """Profile the next `count` requests and requests with an X-Profile header.
+    JSON: {"count": 10, "mode": "cprofile" | "sampling", "header_only": false}"""
+    try:
+        if profiler.enabled:
+            profiler.disable()
+        else:
+            data = request.get_json(silent=True) or {}
+            profiler.enable(
+                count=data.get("count", 10),
+                mode=data.get("mode", "cprofile"),
+                header_only=bool(data.get("header_only", False)),
+            )
+        return jsonify(
+            {
+                "success": True,
+                **profiler.status(),
+                "message": f'Профилирование {"включено" if profiler.enabled else "отключено"}',
+            }
+        )
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Ошибка: {str(e)}"})
+
+
+@app.route("/profiles")
+def list_profiles():
+    """Saved profiles, newest first (.pstats - cProfile, .collapsed - sampled stacks)"""
+    return jsonify({"success": True, **profiler.status(), "profiles": profiler.profiles()})
+
+
+@app.route("/profiles/<name>")
+def download_profile(name):
+    path = profiler.path_of(name)
+    if path is None or not os.path.exists(path):
+        return jsonify({"success": False, "message": f"Профиль {name} не найден"}), 404
+    return send_file(path, as_attachment=True, download_name=name)
+
+
 @app.route("/get_config_status")
 def get_config_status():
     return jsonify(
@@ -85,6 +264,7 @@ def get_config_status():
             "success": True,
             "validation_enabled": config.DEVICE_VALIDATION_ENABLED,
             "print_enabled": config.PHYSICAL_PRINT_ENABLED,
+            "profiling_enabled": profiler.enabled,
         }
     )
 
@@ -93,9 +273,13 @@ def get_config_status():
 def device_status():
     try:
         # First check if any devices are actually connected
-        device_count = rc_client.get_device_count()
+        query_start = time.perf_counter()
+        devices = rc_client.get_device_list()
+        device_count = len(devices)
 
         if device_count == 0:
+            traces.release_handles()
+            printer.discard_prerendered()
             response_data = {
                 "success": False,
                 "message": "No devices connected",
@@ -109,7 +293,7 @@ def device_status():
             }
         else:
             # Exactly one device - get its data
-            device = rc_client.get_single_device()
+            device = rc_client.get_device_info(devices[0])
             handle = device["handle"]
             mcu_id = device["mcu_id"]
             serial = device["serial"]
@@ -117,20 +301,23 @@ def device_status():
 
             mcu_str = " ".join(f"{b:02X}" for b in mcu_id) if mcu_id else "Error"
 
-            tests_ok = db_info.get("tests_ok", 0) == 1
-            calibration_ok = db_info.get("calibration_ok", 0) == 1
-            prog_time_ok = db_info.get("prog_time", 0) > 0
-            calib_time_ok = db_info.get("calib_time", 0) > 0
-
-            if config.DEVICE_VALIDATION_ENABLED:
-                device_ready = (
-                    tests_ok and calibration_ok and prog_time_ok and calib_time_ok
-                )
-            else:
-                device_ready = tests_ok
+            device_ready, _failed = check_readiness(db_info, readiness_rules(config))
 
             status = "READY" if device_ready else "NOT READY"
 
+            if serial:
+                throughput.step(serial, "connect")
+                if device_ready:
+                    throughput.step(serial, "validate")
+                    # Render the label now, /print_label then only spools it
+                    printer.prerender(serial, LABEL_TEMPLATE)
+
+            trace, created = traces.begin(handle, serial, query_start)
+            if trace is not None:
+                if created:
+                    trace.add("device query", query_start, time.perf_counter())
+                trace.mark("validation", status=status, validation_enabled=config.DEVICE_VALIDATION_ENABLED)
+
             response_data = {
                 "success": True,
                 "handle": f"{handle:X}",
@@ -144,6 +331,7 @@ def device_status():
                 "device_ready": device_ready,
                 "validation_enabled": config.DEVICE_VALIDATION_ENABLED,
                 "device_count": 1,
+                "trace_id": trace.trace_id if trace is not None else None,
             }
 
         # Create response with no-cache headers for webview
@@ -189,20 +377,32 @@ def print_label():
             return jsonify(
                 {"success": False, "message": "Серийный номер не может быть пустым"}
             )
-
-        # Проверяем готовность устройства
-        device_status_response = device_status()
-        device_data = device_status_response.get_json()
-
-        # Создаем и печатаем этикетку
-        success = printer.create_and_print_label(
-            serial_number=serial_number,
-            template_pdf="template51x25.pdf",
-            add_datamatrix=True,
-            print_after_create=config.PHYSICAL_PRINT_ENABLED,
-        )
+        # Под batch_lock пакет не стартует, пока печатается эта этикетка;
+        # print_lock - одна печать за раз (общий временный файл и ошибка)
+        with batch_lock:
+            if active_batch() is not None:
+                return jsonify({"success": False, "message": "Идет пакетная печать, дождитесь ее окончания"})
+
+            # Проверяем готовность устройства
+            device_status_response = device_status()
+            device_data = device_status_response.get_json()
+
+            # Создаем и печатаем этикетку
+            with printer.print_lock:
+                with traces.activate(traces.for_serial(serial_number)):
+                    with span("print_label", physical=config.PHYSICAL_PRINT_ENABLED) as attrs:
+                        success = printer.create_and_print_label(
+                            serial_number=serial_number,
+                            template_pdf=LABEL_TEMPLATE,
+                            add_datamatrix=True,
+                            print_after_create=config.PHYSICAL_PRINT_ENABLED,
+                        )
+                        attrs["success"] = success
+                print_error = printer.last_print_error
 
         if success:
+            throughput.step(serial_number, "print")
+            pending_scans.add(serial_number)
             message = f'Этикетка "{serial_number}" '
             if config.PHYSICAL_PRINT_ENABLED:
                 message += "создана и напечатана!"
@@ -211,86 +411,104 @@ def print_label():
 
             return jsonify({"success": True, "message": message})
         else:
-            return jsonify(
-                {"success": False, "message": "Ошибка при создании этикетки"}
-            )
+            message = "Ошибка при создании этикетки"
+            if print_error:
+                message = f"Ошибка печати: {print_error}"
+            return jsonify({"success": False, "message": message})
 
     except Exception as e:
         return jsonify({"success": False, "message": f"Ошибка: {str(e)}"})
 
 
+@app.route("/label_preview")
+def label_preview():
+    """Reduced-DPI PNG of the label for a serial. Never touches the printer"""
+    serial_number = request.args.get("serial", "").strip()
+    dpi = min(max(request.args.get("dpi", config.PREVIEW_DPI, type=int), 50), 300)
+
+    try:
+        etag = printer.preview_etag(serial_number, LABEL_TEMPLATE, dpi)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    # Conditional GET - answer without rendering
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            etag, png = printer.render_preview_png(serial_number, LABEL_TEMPLATE, dpi)
+        except Exception as e:
+            return jsonify({"success": False, "message": f"Ошибка: {str(e)}"}), 500
+        response = Response(png, mimetype="image/png")
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/hooks/scanned", methods=["POST"])
+def hooks_scanned():
+    """Scan events pushed by the webhook service: one device, a list or {"devices": [...]}"""
+    if config.WEBHOOK_PUSH_TOKEN and request.headers.get("X-Webhook-Token") != config.WEBHOOK_PUSH_TOKEN:
+        return jsonify({"success": False, "message": "Неверный токен"}), 403
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        events = data.get("devices", [data])
+    else:
+        events = data
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
+        return jsonify({"success": False, "message": "Ожидается событие сканирования в JSON"}), 400
+
+    matched = [serial for serial in map(scan_confirmed, events) if serial is not None]
+    return jsonify({"success": True, "received": len(events), "matched": matched})
+
+
 @app.route("/check_scan_status", methods=["POST"])
 def check_scan_status():
     try:
         data = request.get_json()
         barcode = data.get("barcode", "").strip()
+        # Long poll: wait up to `wait` seconds for the scan instead of polling
+        wait = min(max(float(data.get("wait", 0) or 0), 0.0), config.SCAN_WAIT_MAX)
 
         if not barcode:
             return jsonify({"success": False, "message": "Штрихкод пустой"})
 
-        # Запрашиваем список недавних устройств
-        response = requests.post(
-            f"{config.WEBHOOK_API_BASE}/hooks/get-devices",
-            json={
-                "path": "/api/devices",
-                "limit": 10,  # Увеличиваем лимит для поиска
-                "minutes": 1,  # Ищем за последний час
-            },
-            timeout=config.WEBHOOK_TIMEOUT,
-        )
-
-        if response.status_code == 200:
-            result = response.json()
-
-            if result.get("success"):
-                devices = result.get("devices", [])
-
-                # Ищем устройство с нужным серийным номером
-                found_device = None
-                for device in devices:
-                    if (
-                        device.get("barcode") == barcode
-                        or device.get("serial") == barcode
-                    ):
-                        found_device = device
-                        break
-
-                if found_device:
-                    # Устройство найдено!
-                    return jsonify(
-                        {
-                            "success": True,
-                            "scanned": True,
-                            "status": found_device.get("status", "ready"),
-                            "manufacturing_date": found_device.get(
-                                "manufacturing_date"
-                            ),
-                            "sale_date": found_device.get("sale_date"),
-                            "age_minutes": found_device.get("age_minutes", 0),
-                            "scanner_id": found_device.get("scanner_id", "unknown"),
-                            "message": f"Устройство {found_device.get('status', 'ready')} (возраст: {found_device.get('age_minutes', 0)} минут)",
-                        }
-                    )
-                else:
-                    # Устройство не найдено в списке
-                    return jsonify(
-                        {
-                            "success": True,
-                            "scanned": False,
-                            "message": "Устройство не найдено в недавно отсканированных",
-                        }
-                    )
-            else:
-                return jsonify(
-                    {
-                        "success": False,
-                        "message": result.get("message", "Ошибка получения данных"),
-                    }
-                )
-        else:
+        trace = traces.for_serial(barcode)
+        if trace is not None:
+            trace.mark("waiting for scan")
+
+        known, found_device = pending_scans.get(barcode)
+        if not known:
+            # Printed before a restart or by another client: look it up once
+            pending_scans.add(barcode)
+            scan_reconciler.reconcile()
+            found_device = pending_scans.get(barcode)[1]
+        if wait > 0 and pending_scans.is_waiting(barcode):
+            found_device = pending_scans.wait(barcode, wait)
+
+        if found_device:
+            # Устройство найдено!
             return jsonify(
-                {"success": False, "message": f"Ошибка API: {response.status_code}"}
+                {
+                    "success": True,
+                    "scanned": True,
+                    "status": found_device.get("status", "ready"),
+                    "manufacturing_date": found_device.get("manufacturing_date"),
+                    "sale_date": found_device.get("sale_date"),
+                    "age_minutes": found_device.get("age_minutes", 0),
+                    "scanner_id": found_device.get("scanner_id", "unknown"),
+                    "message": f"Устройство {found_device.get('status', 'ready')} (возраст: {found_device.get('age_minutes', 0)} минут)",
+                }
             )
+        return jsonify(
+            {
+                "success": True,
+                "scanned": False,
+                "message": "Устройство не найдено в недавно отсканированных",
+            }
+        )
 
     except requests.exceptions.Timeout:
         return jsonify({"success": False, "message": "Timeout запроса"})
@@ -339,61 +557,266 @@ def get_scanned_items():
         return jsonify({"success": False, "message": f"Ошибка: {str(e)}", "items": []})
 
 
-# Print comand line
-import time
+@app.route("/archive/<serial>")
+def get_archived_label(serial):
+    """Exact bytes of a printed label: the latest print, ?print=<n> for the n-th (0 - first)"""
+    if printer.archive is None:
+        return jsonify({"success": False, "message": "Архив этикеток выключен"}), 404
+    try:
+        found = printer.archive.get(serial, request.args.get("print", -1, type=int))
+    except IndexError:
+        found = None
+    except (ValueError, ArchiveError) as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    if found is None:
+        return jsonify({"success": False, "message": f"Этикетка {serial} не найдена в архиве"}), 404
+    entry, data = found
+    mimetype = "application/pdf" if entry["kind"] == "pdf" else "application/octet-stream"
+    return send_file(io.BytesIO(data), mimetype=mimetype, download_name=f"{serial}.{entry['kind']}")
+
+
+@app.route("/archive/<serial>/history")
+def archived_label_history(serial):
+    """All archived prints of a serial"""
+    if printer.archive is None:
+        return jsonify({"success": False, "message": "Архив этикеток выключен"}), 404
+    try:
+        return jsonify({"success": True, "prints": printer.archive.history(serial)})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+
+@app.route("/trace/<serial>")
+def get_trace(serial):
+    """Waterfall of one unit: spans from device connect to scan confirmation"""
+    trace = traces.get(serial)
+    if trace is None:
+        return jsonify({"success": False, "message": f"Трассировка для {serial} не найдена"}), 404
+    return jsonify({"success": True, "trace": trace})
+
+
+@app.route("/analytics/throughput")
+def throughput_analytics():
+    """Cycle times, idle gaps, UPH per station/model and the slowest step"""
+    hours = request.args.get("hours", 24, type=float)
+    result = throughput.query(
+        hours, request.args.get("station"), request.args.get("model")
+    )
+    result["success"] = True
+    return jsonify(result)
 
 
-def inventree_delete_if_exists(serial: str) -> bool:
+@app.route("/get_production_stats")
+def get_production_stats():
+    """Aggregated counters; ?since=<version> returns only what changed"""
+    since = request.args.get("since", 0, type=int)
+    result = production_stats.delta(since)
+    result["success"] = True
+    return jsonify(result)
+
+
+@app.route("/scanned_history")
+def scanned_history():
+    """Older scanned items page by page: ?before=<seq>&limit=<n>, newest first"""
+    before = request.args.get("before", type=int)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 500)
+    result = production_stats.history(before, limit)
+    result["success"] = True
+    return jsonify(result)
+
+
+@app.route("/ingest_serials", methods=["POST"])
+def ingest_serials():
+    """Validate an uploaded serial list (CSV / newline file or raw body)"""
     try:
-        response = requests.get(
-            f"{INVENTREE_URL}/api/stock/",
-            params={"serial": serial, "limit": 1},
-            headers=INVENTREE_HEADERS,
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        if not data.get("results"):
-            print(f"ℹ️  InvenTree: {serial} не найден")
-            return True  # всё ок, просто нечего удалять
-
-        pk = data["results"][0]["pk"]
-        print(f"🔍 InvenTree: найден ID={pk}, удаляем...")
-        requests.delete(
-            f"{INVENTREE_URL}/api/stock/{pk}/",
-            headers=INVENTREE_HEADERS,
-            timeout=10,
-            verify=False,
-        ).raise_for_status()
-        print(f"🗑️  InvenTree: {serial} удалён")
-        return True
+        limit = request.args.get("limit", 10000, type=int)
+        column = parse_column(request.args.get("column"))
+        fmt = request.args.get("format", "auto")
+
+        upload = request.files.get("file")
+        if upload is not None:
+            name = upload.filename or "upload"
+            raw = upload.stream
+        else:
+            name = "body"
+            raw = request.stream
+        stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+        accepted = []
+
+        def sink(serial, model):
+            if len(accepted) < limit:
+                accepted.append(serial)
+
+        report = ingest_stream(stream, fmt, column, name, sink)
+        result = report.to_dict()
+        result["accepted_serials"] = accepted
+        result["accepted_truncated"] = report.accepted > len(accepted)
+        return jsonify({"success": True, "report": result})
 
     except Exception as e:
-        print(f"⚠️  InvenTree ошибка: {e}")
-        return True  # не блокируем печать даже при ошибке
-
-
-def cli_print_serial(serial: str):
-    print(f"🖨️ CLI-печать серийника: {serial}")
-    inventree_delete_if_exists(
-        serial
-    )  # Для возвратов с таможни.Если такой серийник есть удалим.
-    success = printer.create_and_print_label(
-        serial_number=serial,
-        template_pdf="template51x25.pdf",
-        add_datamatrix=True,
-        print_after_create=True,
+        return jsonify({"success": False, "message": f"Ошибка: {str(e)}"})
+
+
+def spool_label(serial, data):
+    with printer.print_lock:
+        if not printer.spool(serial, data):
+            raise RuntimeError(printer.last_print_error or "Ошибка печати")
+    return True
+
+
+def create_batch_pipeline(on_result=None, physical=True):
+    """Batch / queue printing: labels rendered ahead, one spooler owns the
+    printer, InvenTree requests run alongside. Without physical printing
+    nothing is deleted from InvenTree"""
+    batch = settings["batch"]
+    return BatchPipeline(
+        render=lambda serial: printer.render_for_backend(serial, LABEL_TEMPLATE),
+        spool=spool_label if physical else (lambda serial, data: True),
+        # Для возвратов с таможни: если такой серийник есть в InvenTree, удалим
+        # (только после успешной печати этикетки)
+        sync=inventree_delete_if_exists if physical else None,
+        render_ahead=batch["render_ahead"],
+        render_workers=batch["render_workers"],
+        sync_workers=batch["sync_workers"],
+        on_result=on_result,
+        logger=logging.getLogger("batch_pipeline"),
     )
 
-    if success:
-        print("⏳ Ожидание завершения отправки в печать...")
 
-        print("✅ Этикетка отправлена в принтер")
-        sys.exit(0)
-    else:
-        print("❌ Ошибка печати этикетки")
-        sys.exit(1)
+# Queue mode: one batch at a time owns the printer
+batch_jobs = OrderedDict()  # job id -> {"pipeline", "not_ready"}
+batch_lock = threading.Lock()
+
+
+def active_batch():
+    return next((job for job in list(batch_jobs.values()) if job["pipeline"].running), None)
+
+
+def batch_label_printed(result):
+    if result["printed"]:
+        throughput.step(result["serial"], "print")
+        pending_scans.add(result["serial"])
+
+
+@app.route("/print_batch", methods=["POST"])
+def print_batch():
+    """Queue serials for pipelined printing. JSON: {"serials": [...], "force": false}"""
+    data = request.get_json(silent=True) or {}
+    serials = data.get("serials")
+    if not isinstance(serials, list) or not all(isinstance(s, str) for s in serials):
+        return jsonify({"success": False, "message": "Ожидается список серийных номеров"}), 400
+    serials = list(dict.fromkeys(s.strip() for s in serials if s.strip()))
+
+    not_ready = []
+    if not data.get("force"):
+        try:
+            serials, not_ready = split_by_readiness(readiness, serials, readiness_rules(config))
+        except Exception as e:
+            return jsonify({"success": False, "message": f"Ошибка базы данных: {e}"}), 503
+
+    with batch_lock:
+        if active_batch() is not None:
+            return jsonify({"success": False, "message": "Пакетная печать уже идет"}), 409
+        job_id = f"{int(time.time() * 1000):x}"
+        pipeline = create_batch_pipeline(batch_label_printed, config.PHYSICAL_PRINT_ENABLED)
+        batch_jobs[job_id] = {
+            "pipeline": pipeline,
+            "not_ready": [{"serial": s, "reason": describe_failed(failed)} for s, failed in not_ready],
+        }
+        while len(batch_jobs) > 20:
+            batch_jobs.popitem(last=False)
+        pipeline.start()
+    for serial in serials:
+        pipeline.submit(serial)
+    pipeline.close()
+    return jsonify(
+        {"success": True, "job": job_id, "queued": len(serials), "not_ready": batch_jobs[job_id]["not_ready"]}
+    )
+
+
+@app.route("/print_batch/<job_id>")
+def print_batch_status(job_id):
+    """Progress of a queued batch, per-label results and stage utilization"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Пакет {job_id} не найден"}), 404
+    pipeline = job["pipeline"]
+    return jsonify(
+        {"success": True, **pipeline.report(), "results": pipeline.results, "not_ready": job["not_ready"]}
+    )
+
+
+# Print comand line
+import time
+
+
+inventree_logger = logging.getLogger("inventree")
+
+
+def inventree_delete_if_exists(serial: str) -> bool:
+    """Delete the stock item of serial. True if deleted, False if there was none;
+    request errors are raised (the batch sync stage counts them as failed)"""
+    response = requests.get(
+        f"{INVENTREE_URL}/api/stock/",
+        params={"serial": serial, "limit": 1},
+        headers=INVENTREE_HEADERS,
+        timeout=10,
+        verify=False,
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    if not data.get("results"):
+        inventree_logger.info("InvenTree: %s not found", serial)
+        return False  # всё ок, просто нечего удалять
+
+    pk = data["results"][0]["pk"]
+    inventree_logger.info("InvenTree: deleting stock item %s of %s", pk, serial)
+    requests.delete(
+        f"{INVENTREE_URL}/api/stock/{pk}/",
+        headers=INVENTREE_HEADERS,
+        timeout=10,
+        verify=False,
+    ).raise_for_status()
+    inventree_logger.info("InvenTree: %s deleted", serial)
+    return True
+
+
+def cli_print_serials(serials, force=False):
+    """Print labels of a serial list; readiness of all serials is fetched in
+    one database query and checked with the rules of the web flow"""
+    serials = list(dict.fromkeys(serials))
+    ready = serials
+    if not force:
+        try:
+            ready, not_ready = split_by_readiness(readiness, serials, readiness_rules(config))
+        except Exception as e:
+            print(f"❌ Ошибка базы данных: {e}")
+            sys.exit(1)
+        for serial, failed in not_ready:
+            print(f"⛔ {serial}: не готов ({describe_failed(failed)})")
+
+    def report_label(result):
+        if result["printed"]:
+            print(f"✅ {result['serial']}: этикетка отправлена в принтер")
+        else:
+            print(f"❌ {result['serial']}: ошибка печати этикетки ({result['error']})")
+
+    # Render, print and InvenTree sync overlap: the next labels are rendered
+    # while the printer works
+    print(f"🖨️ CLI-печать: {len(ready)} серийников")
+    report = create_batch_pipeline(report_label).run(ready)
+    for name, stage in report["stages"].items():
+        print(
+            f"   {name}: {stage['items']} шт., среднее {stage['avg_ms'] or 0:.0f} мс, "
+            f"загрузка {stage['utilization']:.0%}"
+        )
+    print(
+        f"Напечатано {report['printed']} из {len(serials)} за {report['wall_s']:.1f} с "
+        f"(узкое место: {report['bottleneck']})"
+    )
+    sys.exit(0 if report["printed"] == len(serials) else 1)
 
 
 if __name__ == "__main__":
@@ -404,18 +827,54 @@ if __name__ == "__main__":
         help="Серийный номер для печати (CLI режим)",
         type=str,
     )
+    parser.add_argument(
+        "--serials",
+        nargs="+",
+        help="Несколько серийных номеров (пакетная печать, одна проверка в БД)",
+    )
+    parser.add_argument(
+        "--serials-file",
+        help="Файл со списком серийных номеров (CSV или по одному в строке)",
+    )
+    parser.add_argument(
+        "--no-validation",
+        action="store_true",
+        help="Только tests_ok, как при выключенных проверках в веб-интерфейсе",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Печатать без проверки готовности в БД",
+    )
 
     args = parser.parse_args()
 
     # --- CLI MODE ---
-    if args.serial:
-        cli_print_serial(args.serial)
+    serials = [args.serial] if args.serial else []
+    serials += args.serials or []
+    if args.serials_file:
+        with open(args.serials_file, "r", encoding="utf-8-sig", newline="") as f:
+            report = ingest_stream(
+                f, "auto", None, args.serials_file, lambda serial, model: serials.append(serial)
+            )
+        for rejected in report.rejected_rows:
+            print(f"⚠️ Строка {rejected['row']}: {rejected['value']} - {rejected['reason']}")
+    if serials:
+        if args.no_validation:
+            config.DEVICE_VALIDATION_ENABLED = False
+        cli_print_serials(serials, force=args.force)
 
     # --- WEB MODE ---
+    # Hot reload of label positions from conf.toml, statistics polling
+    start_background_services()
+
     print("🚀 Запуск веб-сервера принтера этикеток...")
     print("📍 Адрес: http://localhost:5000")
     print(f"🔧 Проверки: {'ВКЛ' if config.DEVICE_VALIDATION_ENABLED else 'ВЫКЛ'}")
     print(f"🖨️ Печать: {'ВКЛ' if config.PHYSICAL_PRINT_ENABLED else 'ВЫКЛ'}")
     print("⏹️  Ctrl+C для остановки")
 
-    app.run(debug=True, host="0.0.0.0", port=5000, threaded=False)
+    # Threaded: /check_scan_status long polls must not hold up other requests
+    # (including the /hooks/scanned push that ends them). No reloader: it
+    # runs this block in a second process, starting every service twice
+    app.run(debug=True, host="0.0.0.0", port=5000, threaded=True, use_reloader=False)
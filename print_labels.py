@@ -1,32 +1,54 @@
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
 from PyPDF2 import PdfReader, PdfWriter
 import io
-import win32print
-import win32ui
-from PIL import Image, ImageWin
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 import fitz
+import numpy as np
 import logging
 import os
-import psycopg2
 import socket
-import re
 import subprocess
+import threading
+import time
 import toml
-
-# Data Matrix import
+from raster_compositor import RasterCompositor, pack_raster, raster_image, unpack_raster
+from label_cache import LabelCache, cache_key, file_digest
+from label_archive import ArchiveError, LabelArchive
+from logging_setup import setup_logging
+from layout import DEVICE_LABEL, FONT_NAME, LABEL_HEIGHT_MM, LABEL_WIDTH_MM, LayoutWatcher, compile_layout
+from serial_ingest import SERIAL_FORMAT_HINT, classify_serial
+from tspl_printer import PrinterStatusError, TsplPrinter, build_job
+from tracing import span
+from render_client import RenderClient
+
+from datamatrix import DataMatrixEncoder, LIBDMTX_AVAILABLE
+
+# Windows spooling only; rendering runs without it (render_service on Linux)
 try:
-    from pylibdmtx import pylibdmtx
+    import win32print
+    import win32ui
+    from PIL import ImageWin
 
-    DATAMATRIX_AVAILABLE = True
+    WIN32_AVAILABLE = True
 except ImportError:
-    print("Warning: Data Matrix not available")
-    DATAMATRIX_AVAILABLE = False
+    win32print = win32ui = ImageWin = None
+    WIN32_AVAILABLE = False
+
+if not LIBDMTX_AVAILABLE:
+    print("Warning: libdmtx not available, using pure Python Data Matrix encoder")
 
 
 class LabelPrinter:
-    def __init__(self, config_file="conf.toml"):
-        """Initialize LabelPrinter with settings from TOML config file"""
+    def __init__(self, config_file="conf.toml", archive=True):
+        """Initialize LabelPrinter with settings from TOML config file.
+
+        archive: True - store printed labels (only the printing process),
+        "read_only" - look labels up next to a running writer, False - none
+        """
 
         # Load configuration
         try:
@@ -41,42 +63,19 @@ class LabelPrinter:
 
         # General settings
         general = config["general"]
-        self.enable_logging = general["enable_logging"]
         self.temp_filename = general["temp_filename"]
 
-        # Label position settings
-        labels = config["label_positions"]
-
-        self.serial_number_prefix_x_mm = labels["serial_number_prefix_x_mm"]
-        self.serial_number_prefix_y_mm = labels["serial_number_prefix_y_mm"]
-        self.serialLabel_x_mm = labels["serialLabel_x_mm"]
-        self.serialLabel_y_mm = labels["serialLabel_y_mm"]
-        self.serialLabel_font_size = labels["serialLabel_font_size"]
-        self.typeLabel_x_mm = labels["typeLabel_x_mm"]
-        self.typeLabel_y_mm = labels["typeLabel_y_mm"]
-        self.typeLabel_font_size = labels["typeLabel_font_size"]
-        self.fccLabel_x_mm = labels["fccLabel_x_mm"]
-        self.fccLabel_y_mm = labels["fccLabel_y_mm"]
-        self.powerLabels_font_size = labels["powerLabels_font_size"]
-        self.powerULabel_x_mm = labels["powerULabel_x_mm"]
-        self.powerULabel_y_mm = labels["powerULabel_y_mm"]
-        self.powerALabel_x_mm = labels["powerALabel_x_mm"]
-        self.powerALabel_y_mm = labels["powerALabel_y_mm"]
-        self.powerWLabel_x_mm = labels["powerWLabel_x_mm"]
-        self.powerWLabel_y_mm = labels["powerWLabel_y_mm"]
-        self.powerILabel_x_mm = labels["powerILabel_x_mm"]
-        self.powerILabel_y_mm = labels["powerILabel_y_mm"]
-        self.powermAhLabel_x_mm = labels["powermAhLabel_x_mm"]
-        self.powermAhLabel_y_mm = labels["powermAhLabel_y_mm"]
-        self.powerWhLabel_x_mm = labels["powerWhLabel_x_mm"]
-        self.powerWhLabel_y_mm = labels["powerWhLabel_y_mm"]
-
-        # Data Matrix settings
-        dm = config["datamatrix"]
-        self.dm_x_mm = dm["dm_x_mm"]
-        self.dm_y_mm = dm["dm_y_mm"]
-        self.dm_size_mm = dm["dm_size_mm"]
-        self.dm_pixels = dm["dm_pixels"]
+        # Label layout: [label_positions], [datamatrix] and [model_offsets]
+        # compiled to points; swapped atomically on conf.toml changes
+        self.config_file = config_file
+        self.layout = compile_layout(
+            config, config_file, os.path.getmtime(config_file)
+        )
+        self.layout_watcher = None
+        self._layout_listeners = []
+
+        # Data Matrix encoder: "auto" | "libdmtx" | "python"
+        self.dm_encoder = DataMatrixEncoder(config["datamatrix"]["encoder"])
 
         # Print settings
         printing = config["printing"]
@@ -87,338 +86,440 @@ class LabelPrinter:
         self.print_offset_y = printing["print_offset_y"]
         self.print_width = printing["print_width"]
         self.print_height = printing["print_height"]
+        # Native printer resolution for the raster path (TSC TE300 - 300 dpi)
+        self.device_dpi = printing["device_dpi"]
+
+        # "acrobat" - PDF through Acrobat, "tspl" - raw raster over TCP with status feedback
+        self.print_backend = printing["backend"]
+        self.last_print_error = None
+        # Held for a whole create / spool / print: temp_filename and
+        # last_print_error are shared; callers read last_print_error under it
+        self.print_lock = threading.RLock()
+
+        tspl = config["tspl"]
+        self.tspl_gap_mm = tspl["gap_mm"]
+        self.tspl = TsplPrinter(
+            tspl["host"],
+            tspl["port"],
+            timeout=tspl["status_timeout"],
+            poll_interval=tspl["status_poll_interval"],
+        )
 
         # Path to printer executable (Adobe Acrobat)
         acrobat = config["acrobat"]
         self.acrobat_path = acrobat["path"]
+        # Acrobat never exits after /t: wait for the spool, then terminate it
+        self.acrobat_print_wait = acrobat["print_wait"]
+        self.acrobat_kill_wait = acrobat["kill_wait"]
 
         # Get computer name for station_id
         self.station_id = socket.gethostname()
 
-        # Configure logging
-        if self.enable_logging:
-            logging.basicConfig(
-                level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+        # Configure logging: [logging] in conf.toml, written by a background thread
+        setup_logging(config["logging"])
+        self.logger = logging.getLogger(__name__)
+        self.logger.info("LabelPrinter initialized from %s (Station: %s)", config_file, self.station_id)
+
+        self.tspl.logger = logging.getLogger("tspl_printer")
+
+        # Static layer raster cache for render_label_raster
+        self.compositor = RasterCompositor(self)
+
+        # Rendered label cache for reprints and repeated previews
+        cache = config["cache"]
+        self.label_cache = None
+        self.preview_cache_size = cache["preview_entries"]
+        self._preview_cache = OrderedDict()
+        self._preview_lock = threading.Lock()
+        if cache["enabled"]:
+            self.label_cache = LabelCache(
+                cache["directory"], int(cache["max_size_mb"] * 1024 * 1024), logging.getLogger("label_cache")
             )
-            self.logger = logging.getLogger(__name__)
-            self.logger.info(
-                f"LabelPrinter initialized from {config_file} (Station: {self.station_id})"
-            )
-        else:
-
-            class NullLogger:
-                def debug(self, msg):
-                    pass
-
-                def info(self, msg):
-                    pass
-
-                def warning(self, msg):
-                    pass
-
-                def error(self, msg):
-                    pass
 
-            self.logger = NullLogger()
+        # Shared render service; empty url - render locally
+        render_service = config["render_service"]
+        self.render_client = None
+        if render_service["url"]:
+            self.render_client = RenderClient(
+                render_service["url"], render_service["timeout"], logging.getLogger("render_client")
+            )
 
-    def create_datamatrix_image(self, data: str, size_pixels: int = None):
-        """Create Data Matrix image"""
-        if not DATAMATRIX_AVAILABLE:
-            self.logger.warning("Data Matrix not available")
-            return None
+        # Speculative renders for connected devices: (kind, serial, template, dm) -> (layout fingerprint, Future);
+        # Future None - already printed, kept so that status polls of the still
+        # connected device do not render it again
+        self.prerender_entries = cache["prerender_entries"]
+        self._prerendered = OrderedDict()
+        self._prerender_lock = threading.Lock()
+        self._prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prerender")
+
+        # Template PDF bytes by path, re-read only when the file changes
+        self._templates = {}
+
+        # Every printed label for audits (python label_archive.py get <serial>).
+        # One writer: a second one would cut off the running writer's record
+        # as a torn write and replace its index on close
+        archive_config = config["archive"]
+        self.archive = None
+        if archive and archive_config["enabled"]:
+            self.archive = LabelArchive(
+                archive_config["directory"],
+                int(archive_config["max_segment_mb"] * 1024 * 1024),
+                archive_config["rotate_daily"],
+                archive_config["fsync"],
+                logging.getLogger("label_archive"),
+                read_only=archive == "read_only",
+            )
 
+    def create_datamatrix_image(self, data: str, size_pixels: int = None, modules=None):
+        """Create Data Matrix image (modules - data already encoded)"""
         if size_pixels is None:
-            size_pixels = self.dm_pixels
+            size_pixels = self.layout.dm_pixels
 
         try:
-            # Generate Data Matrix
-            encoded = pylibdmtx.encode(data.encode("utf-8"))
-
-            if encoded:
-                # Convert to image
-                dm_img = Image.frombytes(
-                    "RGB", (encoded.width, encoded.height), encoded.pixels
-                )
-
-                # Scale to required size
-                dm_img = dm_img.resize((size_pixels, size_pixels), Image.NEAREST)
-
-                return dm_img
-            else:
-                print("Error creating Data Matrix")
-                return None
+            # Generate Data Matrix and expand modules to required size
+            if modules is None:
+                modules = self.dm_encoder.encode(data)
+            bitmap = self.dm_encoder.to_bitmap(modules, size_pixels)
+            return Image.fromarray(np.where(bitmap, 0, 255).astype(np.uint8), "L")
 
         except Exception as e:
-            self.logger.error(f"Data Matrix creation error: {e}")
+            self.logger.error("Data Matrix creation error: %s", e)
             return None
 
     def add_datamatrix_to_canvas(
-        self, canvas_obj, data: str, x_mm: float, y_mm: float, size_mm: float
+        self, canvas_obj, data: str, x: float, y: float, size: float, modules=None
     ):
-        """Add Data Matrix to canvas"""
+        """Add Data Matrix to canvas (position and size in points)"""
         try:
             # Create Data Matrix image
-            pixels_per_mm = self.print_dpi / 25.4  # Convert DPI to pixels per mm
-            size_pixels = int(size_mm * pixels_per_mm)
+            size_pixels = int(size / 72 * self.print_dpi)
 
-            dm_img = self.create_datamatrix_image(data, size_pixels)
+            dm_img = self.create_datamatrix_image(data, size_pixels, modules)
             if dm_img is None:
                 return False
 
-            # Save temporary image
-            temp_dm_path = "temp_datamatrix.png"
-            dm_img.save(temp_dm_path)
-
-            # Add to canvas
+            # Add to canvas straight from memory (no temporary file)
             canvas_obj.drawImage(
-                temp_dm_path,
-                x_mm * mm,
-                y_mm * mm,
-                width=size_mm * mm,
-                height=size_mm * mm,
+                ImageReader(dm_img),
+                x,
+                y,
+                width=size,
+                height=size,
                 preserveAspectRatio=True,
             )
 
-            # Remove temporary file
-            try:
-                os.remove(temp_dm_path)
-            except:
-                pass
-
-            self.logger.info(f"Data Matrix added at position ({x_mm}, {y_mm})")
+            self.logger.info("Data Matrix added at position (%.2f, %.2f)", x / mm, y / mm)
             return True
 
         except Exception as e:
-            self.logger.error(f"Error adding Data Matrix: {e}")
+            self.logger.error("Error adding Data Matrix: %s", e)
             return False
 
-    def _Create102Label(self, c, serial_number):
-        # Add serial number
-        c.setFont("Helvetica-Bold", self.serialLabel_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serialLabel_x_mm * mm, self.serialLabel_y_mm * mm, serial_number
-        )
+    def apply_layout(self, layout):
+        """Atomically switch to a new compiled layout and drop dependent caches.
 
-        # Add serial perfix number
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
+        Jobs already running keep the layout object they started with.
+        """
+        self.layout = layout
+        self.compositor.invalidate()
+        with self._preview_lock:
+            self._preview_cache.clear()
+        for listener in self._layout_listeners:
+            try:
+                listener(layout)
+            except Exception as e:
+                self.logger.error("Layout listener error: %s", e)
+        self.logger.info("Layout reloaded: %s", layout)
+
+    def add_layout_listener(self, listener):
+        """Register callback(layout) invoked after each layout swap"""
+        self._layout_listeners.append(listener)
+
+    def watch_layout(self, interval: float = 1.0):
+        """Start background hot reload of the layout from config_file"""
+        if self.layout_watcher is None:
+            self.layout_watcher = LayoutWatcher(
+                self.config_file, self.apply_layout, logging.getLogger("layout"), interval
+            ).start()
+        return self.layout_watcher
+
+    def _draw_label(self, c, model_layout, serial_number):
+        """Draw model label content (serial_number=None - static part only)"""
         c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serial_number_prefix_x_mm * mm,
-            self.serial_number_prefix_y_mm * mm,
-            "Ser.No.",
-        )
+        font_size = None
+        for item in model_layout.static_items:
+            if item.size != font_size:
+                font_size = item.size
+                c.setFont(FONT_NAME, font_size)
+            c.drawString(item.x, item.y, item.text)
+
+        if serial_number is not None:
+            c.setFont(FONT_NAME, model_layout.serial_font_size)
+            for x, y, text in model_layout.serial_text_runs(serial_number):
+                c.drawString(x, y, text)
 
-        # Add type label
-        c.setFont("Helvetica-Bold", self.typeLabel_font_size)
-        c.drawString(
-            self.typeLabel_x_mm * mm, self.typeLabel_y_mm * mm, "Type RADIACODE-102"
-        )
+    def _validate_serial_number(self, serial_number: str) -> str:
+        device_type = classify_serial(serial_number)
+        if device_type is not None:
+            return device_type
 
-        # Add FCC label
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.drawString(
-            self.fccLabel_x_mm * mm, self.fccLabel_y_mm * mm, "FCC ID: 2BDDP-102"
+        raise ValueError(
+            f"Неверный формат серийного номера: {serial_number}. {SERIAL_FORMAT_HINT}"
         )
 
-        # Add power labels
-        c.drawString(self.powerULabel_x_mm * mm, self.powerULabel_y_mm * mm, "5.0 V")
-        c.drawString(self.powerILabel_x_mm * mm, self.powerILabel_y_mm * mm, "3.7 V")
-        c.drawString(self.powerALabel_x_mm * mm, self.powerALabel_y_mm * mm, "0.5 A")
-        c.drawString(self.powerWLabel_x_mm * mm, self.powerWLabel_y_mm * mm, "2.5 W")
-        c.drawString(
-            self.powermAhLabel_x_mm * mm, self.powermAhLabel_y_mm * mm, "1000 mAh"
-        )
-        c.drawString(self.powerWhLabel_x_mm * mm, self.powerWhLabel_y_mm * mm, "3.7 Wh")
+    def render_static_layer_pdf(self, layout, device_type: str, template_pdf: str) -> bytes:
+        """Render template merged with per-model static text (no serial, no Data Matrix)"""
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=(layout.width, layout.height))
+        self._draw_label(c, layout.model(device_type), None)
+        c.save()
+        return self._merge_template(packet, template_pdf)
 
-    def _Create103Label(self, c, serial_number):
-        # Add serial number
-        c.setFont("Helvetica-Bold", self.serialLabel_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serialLabel_x_mm * mm, self.serialLabel_y_mm * mm, serial_number
-        )
+    def _merge_template(self, packet, template_pdf: str) -> bytes:
+        """Single page PDF: first template page with the page in packet on top"""
+        packet.seek(0)
+        template = PdfReader(self._template_stream(template_pdf))
+        page = template.pages[0]
+        page.merge_page(PdfReader(packet).pages[0])
+
+        writer = PdfWriter()
+        writer.add_page(page)
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def _template_stream(self, template_pdf: str):
+        """In-memory template PDF (merge_page changes the page, so each render
+        parses its own copy, but the file is only read when it changes)"""
+        st = os.stat(template_pdf)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self._templates.get(template_pdf)
+        if entry is None or entry[0] != stamp:
+            with open(template_pdf, "rb") as f:
+                entry = self._templates[template_pdf] = (stamp, f.read())
+        return io.BytesIO(entry[1])
+
+    def render_label_raster(
+        self, serial_number: str, template_pdf: str, dpi: int = None, add_datamatrix=True, modules=None,
+        layout=None, device_type=None,
+    ):
+        """Render 1-bit label image at device DPI from cached static layer
+        (modules - Data Matrix already encoded for serial_number; layout and
+        device_type - snapshot and lookup of a caller rendering several labels)"""
+        try:
+            if device_type is None:
+                device_type = self._validate_serial_number(serial_number)
+            if layout is None:
+                layout = self.layout
+            if dpi is None:
+                dpi = self.device_dpi
+
+            key = None
+            if self.label_cache is not None:
+                key = self._label_cache_key(
+                    "raw", serial_number, device_type, layout, template_pdf,
+                    add_datamatrix, dpi,
+                )
+                cached = self.label_cache.get(key, "raw")
+                if cached is not None:
+                    return unpack_raster(cached)
 
-        # Add serial perfix number
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serial_number_prefix_x_mm * mm,
-            self.serial_number_prefix_y_mm * mm,
-            "Ser.No.",
-        )
+            bits, layer = self.compositor.render_bits(
+                layout, device_type, serial_number, template_pdf, dpi, add_datamatrix, modules
+            )
+            if key is not None:
+                self.label_cache.put(key, "raw", pack_raster(bits, layer))
+            return raster_image(bits, layer.width, layer.height)
+        except Exception as e:
+            self.logger.error("Raster render error for %s: %s", serial_number, e)
+            return None
 
-        # Add type label
-        c.setFont("Helvetica-Bold", self.typeLabel_font_size)
-        c.drawString(
-            self.typeLabel_x_mm * mm, self.typeLabel_y_mm * mm, "Type RADIACODE-103"
-        )
+    def preview_etag(self, serial_number: str, template_pdf: str, dpi: int) -> str:
+        """Strong ETag of a preview: serial, layout hash, template hash and DPI.
 
-        # Add FCC label
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.drawString(
-            self.fccLabel_x_mm * mm, self.fccLabel_y_mm * mm, "FCC ID: 2BDDP-103"
+        Raises ValueError for an invalid serial number.
+        """
+        device_type = self._validate_serial_number(serial_number)
+        return self._label_cache_key(
+            "png", serial_number, device_type, self.layout, template_pdf, dpi
         )
 
-        # Add power labels
-        c.drawString(self.powerULabel_x_mm * mm, self.powerULabel_y_mm * mm, "5.0 V")
-        c.drawString(self.powerILabel_x_mm * mm, self.powerILabel_y_mm * mm, "3.7 V")
-        c.drawString(self.powerALabel_x_mm * mm, self.powerALabel_y_mm * mm, "0.5 A")
-        c.drawString(self.powerWLabel_x_mm * mm, self.powerWLabel_y_mm * mm, "2.5 W")
-        c.drawString(
-            self.powermAhLabel_x_mm * mm, self.powermAhLabel_y_mm * mm, "1000 mAh"
+    def render_preview_png(self, serial_number: str, template_pdf: str, dpi: int):
+        """Render reduced-DPI PNG preview (never prints). Returns (etag, png_bytes)"""
+        device_type = self._validate_serial_number(serial_number)
+        layout = self.layout
+        etag = self._label_cache_key(
+            "png", serial_number, device_type, layout, template_pdf, dpi
         )
-        c.drawString(self.powerWhLabel_x_mm * mm, self.powerWhLabel_y_mm * mm, "3.7 Wh")
-        # ...
 
-    def _Create103GLabel(self, c, serial_number):
-        """Создание этикетки для RC-103G"""
-        # Add serial number
-        c.setFont("Helvetica-Bold", self.serialLabel_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            (self.serialLabel_x_mm - 1.5) * mm,
-            self.serialLabel_y_mm * mm,
-            serial_number,
-        )
+        with self._preview_lock:
+            png = self._preview_cache.get(etag)
+            if png is not None:
+                self._preview_cache.move_to_end(etag)
+                return etag, png
 
-        # Add serial perfix number
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            (self.serial_number_prefix_x_mm - 1.5) * mm,
-            self.serial_number_prefix_y_mm * mm,
-            "Ser.No.",
+        png = self.label_cache.get(etag, "png") if self.label_cache else None
+        if png is None:
+            bits, layer = self.compositor.render_bits(
+                layout, device_type, serial_number, template_pdf, dpi
+            )
+            output = io.BytesIO()
+            raster_image(bits, layer.width, layer.height).save(output, "PNG")
+            png = output.getvalue()
+            if self.label_cache is not None:
+                self.label_cache.put(etag, "png", png)
+
+        with self._preview_lock:
+            self._preview_cache[etag] = png
+            while len(self._preview_cache) > self.preview_cache_size:
+                self._preview_cache.popitem(last=False)
+        return etag, png
+
+    def _label_cache_key(self, kind, serial_number, device_type, layout, template_pdf, *extra):
+        return cache_key(
+            kind,
+            serial_number,
+            layout.model(device_type).fingerprint,
+            file_digest(template_pdf),
+            self.dm_encoder.backend,
+            *extra,
         )
 
-        # Add type label
-        c.setFont("Helvetica-Bold", self.typeLabel_font_size)
-        c.drawString(
-            self.typeLabel_x_mm * mm, self.typeLabel_y_mm * mm, "Type RADIACODE-103G"
-        )
+    def render_label_pdf(
+        self, serial_number: str, template_pdf: str, add_datamatrix=True, use_cache=True, modules=None,
+        layout=None, device_type=None,
+    ) -> bytes:
+        """Return label PDF bytes, from the label cache when possible.
+        modules - Data Matrix already encoded for serial_number; layout and
+        device_type - snapshot and lookup of a caller rendering several labels.
+
+        Raises ValueError for an invalid serial number.
+        """
+        if device_type is None:
+            device_type = self._validate_serial_number(serial_number)
 
-        # Add FCC label
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.drawString(
-            self.fccLabel_x_mm * mm, self.fccLabel_y_mm * mm, "FCC ID: 2BDDP-103"
-        )
+        # Layout snapshot for this job (hot reload may swap self.layout)
+        if layout is None:
+            layout = self.layout
 
-        # Add power labels
-        c.drawString(self.powerULabel_x_mm * mm, self.powerULabel_y_mm * mm, "5.0 V")
-        c.drawString(self.powerILabel_x_mm * mm, self.powerILabel_y_mm * mm, "3.7 V")
-        c.drawString(self.powerALabel_x_mm * mm, self.powerALabel_y_mm * mm, "0.5 A")
-        c.drawString(self.powerWLabel_x_mm * mm, self.powerWLabel_y_mm * mm, "2.5 W")
-        c.drawString(
-            self.powermAhLabel_x_mm * mm, self.powermAhLabel_y_mm * mm, "1000 mAh"
-        )
-        c.drawString(self.powerWhLabel_x_mm * mm, self.powerWhLabel_y_mm * mm, "3.7 Wh")
-        # ...
+        key = None
+        if self.label_cache is not None and use_cache:
+            key = self._label_cache_key(
+                "pdf", serial_number, device_type, layout, template_pdf,
+                add_datamatrix, self.print_dpi,
+            )
+            cached = self.label_cache.get(key, "pdf")
+            if cached is not None:
+                self.logger.info("Label %s taken from cache", serial_number)
+                return cached
 
-    def _Create110Label(self, c, serial_number):
-        """Создание этикетки для RC-110"""
-        # Add serial number
-        c.setFont("Helvetica-Bold", self.serialLabel_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serialLabel_x_mm * mm, self.serialLabel_y_mm * mm, serial_number
-        )
+        # Create PDF in memory; invariant mode - no timestamps or random IDs
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=(layout.width, layout.height), invariant=1)
 
-        # Add serial perfix number
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            self.serial_number_prefix_x_mm * mm,
-            self.serial_number_prefix_y_mm * mm,
-            "Ser.No.",
-        )
+        # Draw compiled layout of the device type
+        self._draw_label(c, layout.model(device_type), serial_number)
 
-        # Add type label
-        c.setFont("Helvetica-Bold", self.typeLabel_font_size)
-        c.drawString(
-            self.typeLabel_x_mm * mm, self.typeLabel_y_mm * mm, "Type RADIACODE-110"
-        )
+        # Add Data Matrix
+        if add_datamatrix:
+            if self.add_datamatrix_to_canvas(
+                c, serial_number, layout.dm_x, layout.dm_y, layout.dm_size, modules
+            ):
+                self.logger.info("Data Matrix added to label")
+            else:
+                self.logger.warning("Data Matrix not created")
 
-        # Add FCC label
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.drawString(
-            self.fccLabel_x_mm * mm, self.fccLabel_y_mm * mm, "FCC ID: 2BDDP-110"
-        )
+        c.save()
 
-        # Add power labels
-        c.drawString(self.powerULabel_x_mm * mm, self.powerULabel_y_mm * mm, "5.0 V")
-        c.drawString(self.powerILabel_x_mm * mm, self.powerILabel_y_mm * mm, "3.7 V")
-        c.drawString(self.powerALabel_x_mm * mm, self.powerALabel_y_mm * mm, "0.8 A")
-        c.drawString(self.powerWLabel_x_mm * mm, self.powerWLabel_y_mm * mm, "4.0 W")
-        c.drawString(
-            self.powermAhLabel_x_mm * mm, self.powermAhLabel_y_mm * mm, "1500 mAh"
-        )
-        c.drawString(
-            (self.powerWhLabel_x_mm - 0.7) * mm, self.powerWhLabel_y_mm * mm, "5.55 Wh"
-        )
+        # Merge with template
+        pdf_bytes = self._merge_template(packet, template_pdf)
 
-    def _Create410Label(self, c, serial_number):
-        """Создание этикетки для RC-410"""
-        c.setFont("Helvetica-Bold", self.serialLabel_font_size)
-        c.setFillColorRGB(0, 0, 0)
-        # "RC-"
-        c.drawString((self.serialLabel_x_mm) * mm, self.serialLabel_y_mm * mm, "RC-")
-        # "410-000000" с микро отступом
-        c.drawString(
-            (self.serialLabel_x_mm + 3.8) * mm,
-            self.serialLabel_y_mm * mm,
-            serial_number[3:],
-        )
+        if key is not None:
+            self.label_cache.put(key, "pdf", pdf_bytes)
+        return pdf_bytes
 
-        # Add serial prefix number
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
+    def render_extra_label_pdf(self, label, serial_number: str, device_type: str, modules=None) -> bytes:
+        """PDF page of a [labels.<name>] label; the Data Matrix is drawn when
+        modules (the encoded serial) are given and the label has one"""
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=(label.width, label.height), invariant=1)
         c.setFillColorRGB(0, 0, 0)
-        c.drawString(
-            (self.serial_number_prefix_x_mm) * mm,
-            self.serial_number_prefix_y_mm * mm,
-            "Ser.No.",
-        )
+        for x, y, size, text in label.field_texts(serial_number, device_type):
+            c.setFont(FONT_NAME, size)
+            c.drawString(x, y, text)
+        if modules is not None and label.dm_size:
+            if not self.add_datamatrix_to_canvas(
+                c, serial_number, label.dm_x, label.dm_y, label.dm_size, modules
+            ):
+                raise ValueError(f"Data Matrix not created for {label.name} label")
+        c.save()
 
-        # Add type label
-        c.setFont("Helvetica-Bold", self.typeLabel_font_size)
-        c.drawString(
-            self.typeLabel_x_mm * mm, self.typeLabel_y_mm * mm, "Type RADIACODE ZERO"
-        )
+        if not label.template:
+            return packet.getvalue()
+        return self._merge_template(packet, label.template)
 
-        # Add FCC label
-        c.setFont("Helvetica-Bold", self.powerLabels_font_size)
-        c.drawString(
-            self.fccLabel_x_mm * mm, self.fccLabel_y_mm * mm, "FCC ID: 2BDDP-ZERO"
+    def render_extra_label_raster(self, label, serial_number: str, device_type: str, modules=None):
+        """1-bit image of a [labels.<name>] label at device DPI"""
+        layer = self.compositor.rasterize_pdf(
+            self.render_extra_label_pdf(label, serial_number, device_type), self.device_dpi
         )
+        if modules is not None and label.dm_size:
+            if not self.compositor.overlay_datamatrix(
+                layer.bits, layer, serial_number, label.dm_x, label.dm_y, label.dm_size, modules
+            ):
+                raise ValueError(f"Data Matrix not created for {label.name} label")
+        return raster_image(layer.bits, layer.width, layer.height)
+
+    def render_label_set(self, kind, serial_number: str, template_pdf: str, add_datamatrix=True, layout=None):
+        """All labels of the unit's [label_sets] entry as one print job: TSPL
+        jobs back to back, or a PDF with a page per label copy. The serial is
+        validated, the Data Matrix encoded and the layout taken once for the
+        whole set. Returns None on error"""
+        try:
+            device_type = self._validate_serial_number(serial_number)
+            if layout is None:
+                layout = self.layout
+            modules = self.dm_encoder.encode(serial_number) if add_datamatrix else None
+
+            parts = []
+            for name in layout.label_set(device_type):
+                label = layout.labels.get(name)
+                if kind == "tspl":
+                    if label is None:
+                        image = self.render_label_raster(
+                            serial_number, template_pdf, add_datamatrix=add_datamatrix, modules=modules,
+                            layout=layout, device_type=device_type,
+                        )
+                        if image is None:
+                            return None
+                        parts.append(build_job(image, LABEL_WIDTH_MM, LABEL_HEIGHT_MM, self.tspl_gap_mm))
+                    else:
+                        image = self.render_extra_label_raster(label, serial_number, device_type, modules)
+                        parts.append(
+                            build_job(image, label.width_mm, label.height_mm, self.tspl_gap_mm, label.copies)
+                        )
+                elif label is None:
+                    parts.append(
+                        self.render_label_pdf(
+                            serial_number, template_pdf, add_datamatrix, modules=modules,
+                            layout=layout, device_type=device_type,
+                        )
+                    )
+                else:
+                    page = self.render_extra_label_pdf(label, serial_number, device_type, modules)
+                    parts.extend([page] * label.copies)
 
-        # Add power labels (same as RC-110)
-        c.drawString(self.powerULabel_x_mm * mm, self.powerULabel_y_mm * mm, "5.0 V")
-        c.drawString(self.powerILabel_x_mm * mm, self.powerILabel_y_mm * mm, "3.7 V")
-        c.drawString(self.powerALabel_x_mm * mm, self.powerALabel_y_mm * mm, "0.8 A")
-        c.drawString(self.powerWLabel_x_mm * mm, self.powerWLabel_y_mm * mm, "4.0 W")
-        c.drawString(
-            self.powermAhLabel_x_mm * mm, self.powermAhLabel_y_mm * mm, "1500 mAh"
-        )
-        c.drawString(
-            (self.powerWhLabel_x_mm - 0.7) * mm, self.powerWhLabel_y_mm * mm, "5.55 Wh"
-        )
-
-    def _validate_serial_number(self, serial_number: str) -> str:
-        patterns = {
-            "RC-102": r"^RC-102-\d{6}$",
-            "RC-103": r"^RC-103-\d{6}$",
-            "RC-103G": r"^RC-103G-\d{6}$",
-            "RC-110": r"^RC-110-\d{6}$",
-            "RC-410": r"^RC-410-\d{6}$",
-        }
-
-        for device_type, pattern in patterns.items():
-            if re.match(pattern, serial_number):
-                return device_type
-
-        raise ValueError(
-            f"Неверный формат серийного номера: {serial_number}. "
-            f"Ожидается формат: RC-XXX-XXXXXX или RC-XXXG-XXXXXX"
-        )
+            if kind == "tspl":
+                return b"".join(parts)
+            writer = PdfWriter()
+            for part in parts:
+                writer.add_page(PdfReader(io.BytesIO(part)).pages[0])
+            output = io.BytesIO()
+            writer.write(output)
+            return output.getvalue()
+        except Exception as e:
+            self.logger.error("Label set render error for %s: %s", serial_number, e)
+            return None
 
     def create_label(
         self,
@@ -428,104 +529,57 @@ class LabelPrinter:
         add_datamatrix=True,
     ):
         """Create label with serial number and Data Matrix"""
-        if output_pdf is None:
-            output_pdf = self.temp_filename
+        with self.print_lock:
+            if output_pdf is None:
+                output_pdf = self.temp_filename
 
-        self.logger.info(f"Creating label: {serial_number}")
+            self.logger.info("Creating label: %s", serial_number)
 
-        # Remove existing file
-        if os.path.exists(output_pdf):
+            # Remove existing file
+            if os.path.exists(output_pdf):
+                try:
+                    os.remove(output_pdf)
+                except Exception as e:
+                    self.logger.error("Could not delete file %s: %s", output_pdf, e)
+
+            # Validate serial number, render (or take from cache) and save
             try:
-                os.remove(output_pdf)
+                with span("render pdf") as attrs:
+                    pdf_bytes = self._take_prerendered("pdf", serial_number, template_pdf, add_datamatrix)
+                    attrs["prerendered"] = pdf_bytes is not None
+                    if pdf_bytes is None:
+                        pdf_bytes = self.render_for_print("pdf", serial_number, template_pdf, add_datamatrix)
+                if pdf_bytes is None:
+                    raise ValueError(f"Label render failed for {serial_number}")
+            except ValueError as e:
+                self.logger.error(str(e))
+                return False
             except Exception as e:
-                self.logger.error(f"Could not delete file {output_pdf}: {e}")
-
-        # Template dimensions
-        template_width = 51 * mm
-        template_height = 25 * mm
-
-        # Validate serial number and get device type
-        try:
-            device_type = self._validate_serial_number(serial_number)
-        except ValueError as e:
-            self.logger.error(str(e))
-            return False
-
-        # Create PDF in memory
-        packet = io.BytesIO()
-        c = canvas.Canvas(packet, pagesize=(template_width, template_height))
-
-        # Select label creation function based on device type
-        try:
-            if device_type == "RC-102":
-                self._Create102Label(c, serial_number)
-            elif device_type == "RC-103":
-                self._Create103Label(c, serial_number)
-            elif device_type == "RC-103G":
-                self._Create103GLabel(c, serial_number)
-            elif device_type == "RC-110":
-                self._Create110Label(c, serial_number)
-            elif device_type == "RC-410":
-                self._Create410Label(c, serial_number)
-        except Exception as e:
-            self.logger.error(f"Error creating label for {device_type}: {e}")
-            return False
-
-        # Add Data Matrix
-        if add_datamatrix:
-            if self.add_datamatrix_to_canvas(
-                c, serial_number, self.dm_x_mm, self.dm_y_mm, self.dm_size_mm
-            ):
-                self.logger.info("Data Matrix added to label")
-            else:
-                self.logger.warning("Data Matrix not created")
-
-        c.save()
-        packet.seek(0)
-
-        # Merge with template
-        try:
-            new_pdf = PdfReader(packet)
-            template = PdfReader(template_pdf)
-            page = template.pages[0]
-            page.merge_page(new_pdf.pages[0])
+                self.logger.error("Label creation error: %s", e)
+                return False
 
-            writer = PdfWriter()
-            writer.add_page(page)
-            with open(output_pdf, "wb") as f:
-                writer.write(f)
+            try:
+                with open(output_pdf, "wb") as f:
+                    f.write(pdf_bytes)
 
-            self.logger.info(f"Label created: {output_pdf}")
-            return True
-        except Exception as e:
-            self.logger.error(f"Label creation error: {e}")
-            return False
+                self.logger.info("Label created: %s", output_pdf)
+                return True
+            except Exception as e:
+                self.logger.error("Label creation error: %s", e)
+                return False
 
     def pdf_to_image(self, pdf_path: str):
         """Convert PDF to image"""
         try:
-            pdf_document = fitz.open(pdf_path)
-            page = pdf_document[0]
-            mat = fitz.Matrix(self.print_dpi / 72, self.print_dpi / 72)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img_data = pix.tobytes("png")
-            image = Image.open(io.BytesIO(img_data))
-
-            # Сохраняем в BMP (без сжатия)
-            temp_bmp = "temp_uncompressed.bmp"
-            image.save(temp_bmp, "BMP")
-            image = Image.open(temp_bmp)
-
-            # Удаляем временный файл
-            try:
-                os.remove(temp_bmp)
-            except:
-                pass
-
-            pdf_document.close()
-            return image
+            # Document closed on errors too; the image owns its pixel data
+            # (no PNG/BMP round trip, no file handle left open)
+            with fitz.open(pdf_path) as pdf_document:
+                page = pdf_document[0]
+                mat = fitz.Matrix(self.print_dpi / 72, self.print_dpi / 72)
+                pix = page.get_pixmap(matrix=mat, alpha=False)
+                return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
         except Exception as e:
-            self.logger.error(f"PDF conversion error: {e}")
+            self.logger.error("PDF conversion error: %s", e)
             return None
 
     def print_label(
@@ -544,42 +598,184 @@ class LabelPrinter:
             # Direct call without PowerShell
             cmd = [acrobat_path, "/t", full_pdf_path, printer_name]
 
-            self.logger.info(f"Running command: {' '.join(cmd)}")
-
-            # Use Popen to control the process
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # Wait for printing to complete (give it time to send to printer)
-            import time
-
-            time.sleep(7)  # Wait 5 seconds for printing to start
+            self.logger.info("Running command: %s", " ".join(cmd))
 
-            # Force terminate the Acrobat process
+            # Use Popen to control the process. Output is never read: DEVNULL,
+            # not PIPE, so no pipe handles are left behind per label
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
             try:
-                if proc.poll() is None:  # Process still running
-                    self.logger.info("Terminating Acrobat process...")
-                    proc.terminate()
+                # Wait for printing to complete (give it time to send to printer)
+                time.sleep(self.acrobat_print_wait)
+            finally:
+                # Force terminate the Acrobat process, always reaped
+                try:
+                    if proc.poll() is None:  # Process still running
+                        self.logger.info("Terminating Acrobat process...")
+                        proc.terminate()
+                        try:
+                            proc.wait(timeout=self.acrobat_kill_wait)
+                        except subprocess.TimeoutExpired:
+                            self.logger.info("Force killing Acrobat process...")
+                            proc.kill()
+                            proc.wait()
+
+                    self.logger.info("Acrobat process ended with code: %s", proc.returncode)
+
+                except Exception as term_error:
+                    self.logger.warning("Error terminating process: %s", term_error)
 
-                    # Wait a bit for graceful termination
-                    time.sleep(1)
+            self.logger.info("Print command completed and Acrobat closed")
+            return True
 
-                    # If still running, force kill
-                    if proc.poll() is None:
-                        self.logger.info("Force killing Acrobat process...")
-                        proc.kill()
+        except Exception as e:
+            self.logger.error("Printing error: %s", e)
+            return False
 
-                    proc.wait()  # Wait for process to fully terminate
+    def archive_label(self, serial_number: str, kind: str, data: bytes):
+        """Keep the printed bytes; an archive failure does not fail the print"""
+        if self.archive is None:
+            return
+        try:
+            with span("archive", bytes=len(data)):
+                self.archive.store(serial_number, kind, data)
+        except (OSError, ValueError, ArchiveError) as e:
+            self.logger.error("Label archive write failed for %s: %s", serial_number, e)
+
+    def warm_up(self, device_type: str, template_pdf: str):
+        """Render a throwaway label of a model past the label cache: loads
+        fonts, the template and fitz, and caches the model's static layer"""
+        serial_number = f"{device_type}-000000"
+        self.render_label_pdf(serial_number, template_pdf, use_cache=False)
+        self.compositor.render_bits(
+            self.layout, device_type, serial_number, template_pdf, self.device_dpi, True
+        )
 
-                self.logger.info(f"Acrobat process ended with code: {proc.returncode}")
+    def _print_kind(self):
+        return "tspl" if self.print_backend == "tspl" else "pdf"
+
+    def render_for_print(self, kind, serial_number, template_pdf, add_datamatrix):
+        """What the print path needs: TSPL job bytes or label PDF bytes of the
+        unit's whole label set (None on error)"""
+        if self.render_client is not None:
+            data = self.render_client.render(serial_number, kind, template_pdf, add_datamatrix)
+            if data is not None:
+                return data
+            # service unavailable: render locally
+        device_type = classify_serial(serial_number)
+        layout = self.layout
+        if device_type is not None and layout.label_set(device_type) != (DEVICE_LABEL,):
+            return self.render_label_set(kind, serial_number, template_pdf, add_datamatrix, layout)
+        if kind == "tspl":
+            image = self.render_label_raster(
+                serial_number, template_pdf, add_datamatrix=add_datamatrix, layout=layout, device_type=device_type
+            )
+            if image is None:
+                return None
+            return build_job(image, LABEL_WIDTH_MM, LABEL_HEIGHT_MM, self.tspl_gap_mm)
+        return self.render_label_pdf(
+            serial_number, template_pdf, add_datamatrix, layout=layout, device_type=device_type
+        )
 
-            except Exception as term_error:
-                self.logger.warning(f"Error terminating process: {term_error}")
+    def prerender(self, serial_number: str, template_pdf: str, add_datamatrix=True):
+        """Render the label of a just detected device in the background, so that
+        the print request only has to spool it"""
+        if classify_serial(serial_number) is None:
+            return
+        kind = self._print_kind()
+        key = (kind, serial_number, template_pdf, add_datamatrix)
+        fingerprint = self.layout.fingerprint
+        with self._prerender_lock:
+            entry = self._prerendered.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._prerendered.move_to_end(key)
+                return
+            future = self._prerender_pool.submit(
+                self.render_for_print, kind, serial_number, template_pdf, add_datamatrix
+            )
+            self._prerendered[key] = (fingerprint, future)
+            while len(self._prerendered) > self.prerender_entries:
+                _key, (_fp, old) = self._prerendered.popitem(last=False)
+                if old is not None:
+                    old.cancel()
+
+    def discard_prerendered(self, serial_number: str = None):
+        """Drop speculative renders (of one serial or all), e.g. when the device is removed"""
+        with self._prerender_lock:
+            for key in list(self._prerendered):
+                if serial_number is None or key[1] == serial_number:
+                    future = self._prerendered.pop(key)[1]
+                    if future is not None:
+                        future.cancel()
+
+    def _take_prerendered(self, kind, serial_number, template_pdf, add_datamatrix):
+        """Result of a matching speculative render (waits if still running), else None.
+        The entry stays, marked used, until discard_prerendered"""
+        key = (kind, serial_number, template_pdf, add_datamatrix)
+        with self._prerender_lock:
+            entry = self._prerendered.get(key)
+            if entry is not None:
+                self._prerendered[key] = (entry[0], None)
+        if entry is None or entry[1] is None or entry[0] != self.layout.fingerprint:
+            return None
+        try:
+            return entry[1].result()
+        except Exception as e:
+            self.logger.warning("Speculative render of %s failed: %s", serial_number, e)
+            return None
 
-            self.logger.info("Print command completed and Acrobat closed")
-            return True
+    def print_label_raw(self, serial_number: str, template_pdf: str, add_datamatrix=True):
+        """Print raster label as a TSPL job and wait for the printer to confirm it"""
+        with self.print_lock:
+            self.last_print_error = None
+            with span("render raster") as attrs:
+                job = self._take_prerendered("tspl", serial_number, template_pdf, add_datamatrix)
+                attrs["prerendered"] = job is not None
+                if job is None:
+                    job = self.render_for_print("tspl", serial_number, template_pdf, add_datamatrix)
+            if job is None:
+                self.last_print_error = "label render failed"
+                return False
+            return self.spool(serial_number, job)
+
+    def render_for_backend(self, serial_number: str, template_pdf: str, add_datamatrix=True):
+        """Label bytes for the configured print backend (None on error), a
+        speculative render if there is one"""
+        kind = self._print_kind()
+        with span(f"render {kind}") as attrs:
+            data = self._take_prerendered(kind, serial_number, template_pdf, add_datamatrix)
+            attrs["prerendered"] = data is not None
+            if data is None:
+                data = self.render_for_print(kind, serial_number, template_pdf, add_datamatrix)
+        return data
+
+    def spool(self, serial_number: str, data: bytes):
+        """Print label bytes from render_for_backend and archive them.
+        On failure last_print_error says why"""
+        with self.print_lock:
+            self.last_print_error = None
+            if self.print_backend != "tspl":
+                with open(self.temp_filename, "wb") as f:
+                    f.write(data)
+                with span("printer", backend="acrobat"):
+                    printed = self.print_label(self.temp_filename)
+                if not printed:
+                    self.last_print_error = "Acrobat printing failed"
+                    return False
+                self.archive_label(serial_number, "pdf", data)
+                return True
 
-        except Exception as e:
-            self.logger.error(f"Printing error: {e}")
+            try:
+                with span("printer", backend="tspl", bytes=len(data)):
+                    self.tspl.print_job(data)
+                self.archive_label(serial_number, "tspl", data)
+                return True
+            except PrinterStatusError as e:
+                self.last_print_error = str(e)
+            except OSError as e:
+                self.last_print_error = f"printer connection failed: {e}"
+            self.logger.error("TSPL printing error for %s: %s", serial_number, self.last_print_error)
             return False
 
     def create_and_print_label(
@@ -593,35 +789,47 @@ class LabelPrinter:
         scale: float = None,
     ):
         """Create and print label with Data Matrix and save to database"""
-        if output_pdf is None:
-            output_pdf = self.temp_filename
+        with self.print_lock:
+            if output_pdf is None:
+                output_pdf = self.temp_filename
 
-        self.logger.info(f"Processing label: {serial_number}")
+            self.logger.info("Processing label: %s", serial_number)
+            self.last_print_error = None
 
-        try:
-            # Create label
-            if not self.create_label(
-                serial_number, template_pdf, output_pdf, add_datamatrix
-            ):
-                raise Exception("Label creation error")
+            try:
+                # Raw path: no PDF, returns once the printer reports the label done
+                if print_after_create and self.print_backend == "tspl":
+                    if self.print_label_raw(serial_number, template_pdf, add_datamatrix):
+                        self.logger.info("Label %s printed", serial_number)
+                        return True
+                    self.logger.error("Printing error for %s", serial_number)
+                    return False
 
-            # Print if needed
-            if print_after_create:
-                if self.print_label(output_pdf, printer_name, scale):  # print_label
-                    self.logger.info(
-                        f"Label {serial_number} printed and saved to database"
-                    )
-                    return True
+                # Create label
+                if not self.create_label(
+                    serial_number, template_pdf, output_pdf, add_datamatrix
+                ):
+                    raise Exception("Label creation error")
+
+                # Print if needed
+                if print_after_create:
+                    with span("printer", backend="acrobat"):
+                        printed = self.print_label(output_pdf, printer_name, scale)
+                    if printed:
+                        with open(output_pdf, "rb") as f:
+                            self.archive_label(serial_number, "pdf", f.read())
+                        self.logger.info("Label %s printed and saved to database", serial_number)
+                        return True
+                    else:
+                        self.logger.error("Printing error for %s", serial_number)
+                        return False
                 else:
-                    self.logger.error(f"Printing error for {serial_number}")
-                    return False
-            else:
-                self.logger.info(f"Label {serial_number} created and saved to database")
-                return True
+                    self.logger.info("Label %s created and saved to database", serial_number)
+                    return True
 
-        except Exception as e:
-            self.logger.error(f"Processing error for {serial_number}: {e}")
-            return False
+            except Exception as e:
+                self.logger.error("Processing error for %s: %s", serial_number, e)
+                return False
 
 
 # Simple test
@@ -0,0 +1,232 @@
+# Incremental production statistics from scan events
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+
+def parse_scan_time(value):
+    """Webhook timestamps are naive UTC ISO strings. Returns local datetime or None"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone()
+
+
+def model_of(barcode: str) -> str:
+    """"RC-102" from "RC-102-012385" """
+    return barcode.rsplit("-", 1)[0] if "-" in barcode else barcode
+
+
+class ProductionStats:
+    """Counts per model, hour, day and station, updated incrementally.
+
+    Every counter change bumps a version and goes to a bounded change log, so
+    clients can ask for the delta since the version they already have.
+    Counter keys: "day|<date>", "model|<date>|<model>",
+    "hour|<date>T<HH>|<model>", "station|<date>|<station>".
+
+    Scanned items are kept per barcode with a "seq" (the version they were
+    added at); a repeated scan with a new status patches the item in place.
+    A full snapshot carries only the newest snapshot_items, older ones are
+    paged with history().
+    """
+
+    def __init__(
+        self,
+        retention_days=31,
+        hour_retention_days=2,
+        max_changes=20000,
+        max_items=5000,
+        snapshot_items=100,
+    ):
+        self.retention_days = retention_days
+        self.hour_retention_days = hour_retention_days
+        self.max_items = max_items
+        self.snapshot_items = snapshot_items
+        self.version = 0
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._seen = {}  # barcode -> day (dedup of repeated scan events)
+        self._changes = deque(maxlen=max_changes)  # (version, key)
+        self._items = OrderedDict()  # barcode -> item, oldest seq first
+        self._item_changes = deque(maxlen=max_changes)  # (version, barcode)
+        self._last_prune_day = None
+
+    def _bump(self, key, version):
+        self._counters[key] = self._counters.get(key, 0) + 1
+        self._changes.append((version, key))
+
+    def apply_events(self, devices):
+        """Apply scan events (webhook device dicts). Returns number of new units"""
+        added = 0
+        with self._lock:
+            for device in devices:
+                barcode = device.get("barcode") or device.get("serial")
+                if not barcode:
+                    continue
+                moment = parse_scan_time(device.get("manufacturing_date") or device.get("timestamp"))
+                if moment is None:
+                    moment = datetime.now().astimezone()
+                day = moment.strftime("%Y-%m-%d")
+                status = device.get("status", "unknown")
+
+                if self._seen.get(barcode) == day:
+                    item = self._items.get(barcode)
+                    if item is not None and item["status"] != status:
+                        self.version += 1
+                        item["status"] = status
+                        self._item_changes.append((self.version, barcode))
+                    continue
+                self._seen[barcode] = day
+
+                self.version += 1
+                version = self.version
+                model = model_of(barcode)
+                station = device.get("scanner_id") or "manufacturing"
+                self._bump(f"day|{day}", version)
+                self._bump(f"model|{day}|{model}", version)
+                self._bump(f"hour|{moment.strftime('%Y-%m-%dT%H')}|{model}", version)
+                self._bump(f"station|{day}|{station}", version)
+                self._items.pop(barcode, None)
+                self._items[barcode] = {
+                    "seq": version,
+                    "barcode": barcode,
+                    "status": status,
+                    "timestamp": device.get("manufacturing_date"),
+                    "scanner_id": station,
+                }
+                self._item_changes.append((version, barcode))
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+                added += 1
+            self._prune()
+        return added
+
+    def _prune(self):
+        today = datetime.now().date()
+        if self._last_prune_day == today:
+            return
+        self._last_prune_day = today
+
+        day_limit = (today - timedelta(days=self.retention_days)).isoformat()
+        hour_limit = (today - timedelta(days=self.hour_retention_days)).isoformat()
+        for key in list(self._counters):
+            group, stamp = key.split("|", 2)[:2]
+            if stamp[:10] < (hour_limit if group == "hour" else day_limit):
+                del self._counters[key]
+        for barcode, day in list(self._seen.items()):
+            if day < day_limit:
+                del self._seen[barcode]
+
+    def delta(self, since: int = 0):
+        """Counters and items changed after `since` (snapshot when since is too old).
+
+        Items are newest first; "history" is the seq to page older items
+        from, None when the client has them all.
+        """
+        with self._lock:
+            # A delta needs both logs complete after `since`; a full log may
+            # have dropped entries older than its head
+            oldest = max(self._log_floor(self._changes), self._log_floor(self._item_changes))
+            reset = since <= 0 or since > self.version or since < oldest
+            history = None
+            if reset:
+                counters = dict(self._counters)
+                items = self._newest(self.snapshot_items)
+                if len(items) < len(self._items):
+                    history = items[-1]["seq"]
+            else:
+                changed = set()
+                for version, key in reversed(self._changes):
+                    if version <= since:
+                        break
+                    changed.add(key)
+                counters = {key: self._counters[key] for key in changed if key in self._counters}
+                barcodes = []
+                for version, barcode in reversed(self._item_changes):
+                    if version <= since:
+                        break
+                    barcodes.append(barcode)
+                items = [dict(self._items[b]) for b in dict.fromkeys(barcodes) if b in self._items]
+                items.sort(key=lambda item: item["seq"], reverse=True)
+            return {
+                "version": self.version,
+                "reset": reset,
+                "counters": counters,
+                "items": items,
+                "items_total": len(self._items),
+                "history": history,
+            }
+
+    @staticmethod
+    def _log_floor(log):
+        """Oldest version the change log still covers completely"""
+        return log[0][0] if len(log) == log.maxlen else 0
+
+    def _newest(self, limit, before=None):
+        items = []
+        for item in reversed(self._items.values()):
+            if len(items) >= limit:
+                break
+            if before is None or item["seq"] < before:
+                items.append(dict(item))
+        return items
+
+    def history(self, before=None, limit=100):
+        """One page of items older than seq `before`, newest first.
+        "next" is the cursor of the following page, None at the end"""
+        with self._lock:
+            items = self._newest(limit, before)
+            more = bool(items) and next(iter(self._items.values()))["seq"] < items[-1]["seq"]
+            return {
+                "items": items,
+                "next": items[-1]["seq"] if more else None,
+                "items_total": len(self._items),
+            }
+
+
+class StatsPoller:
+    """Feed ProductionStats from the webhook API: one backfill, then short windows"""
+
+    def __init__(self, stats, fetch, interval=15.0, backfill_minutes=600, window_minutes=5, logger=None):
+        self.stats = stats
+        self.fetch = fetch  # fetch(limit, minutes) -> list of device dicts
+        self.interval = interval
+        self.backfill_minutes = backfill_minutes
+        self.window_minutes = window_minutes
+        self.logger = logger
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="StatsPoller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self, minutes, limit):
+        devices = self.fetch(limit, minutes)
+        return self.stats.apply_events(devices)
+
+    def _run(self):
+        minutes, limit = self.backfill_minutes, 10000
+        while not self._stop.is_set():
+            try:
+                self.poll(minutes, limit)
+                minutes, limit = self.window_minutes, 1000
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning("Stats poll failed: %s", e)
+            self._stop.wait(self.interval)
@@ -0,0 +1,191 @@
+# On-demand request profiling for the Flask app
+# -*- coding: utf-8 -*-
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Requests carrying this header are profiled while profiling is on
+PROFILE_HEADER = "HTTP_X_PROFILE"
+MODES = ("cprofile", "sampling")
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stack of one thread into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="ProfileSampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class RequestProfiler:
+    """Profiles the next N requests and/or requests with an X-Profile header.
+
+    enable() wraps app.wsgi_app, disable() puts the original back, so a
+    switched off profiler costs nothing per request. cprofile results are
+    saved as .pstats, sampling results as .collapsed (flamegraph.pl /
+    speedscope input).
+    """
+
+    def __init__(self, app, directory="profiles", max_profiles=50, sample_interval=0.001, logger=None):
+        self.app = app
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sample_interval = sample_interval
+        self.logger = logger
+        self.mode = "cprofile"
+        self.remaining = 0
+        self.header_only = False
+        self.skip_prefixes = ("/toggle_profiling", "/profiles", "/static/")
+        self._original = None
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()  # one cProfile at a time
+        self._profiles = deque()  # newest last: name, request, ms, created
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith((".pstats", ".collapsed")):
+                self._profiles.append({"name": name, "request": None, "ms": None, "created": None})
+
+    @property
+    def enabled(self):
+        return self._original is not None
+
+    def enable(self, count=10, mode="cprofile", header_only=False):
+        """Profile the next count requests (0 - only requests with X-Profile)"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        with self._lock:
+            self.mode = mode
+            self.remaining = 0 if header_only else max(int(count), 0)
+            self.header_only = header_only or not self.remaining
+            if self._original is None:
+                self._original = self.app.wsgi_app
+                self.app.wsgi_app = self._wsgi_app
+
+    def disable(self):
+        with self._lock:
+            if self._original is not None:
+                self.app.wsgi_app = self._original
+                self._original = None
+            self.remaining = 0
+
+    def _claim(self, environ):
+        """Should this request be profiled? Counts down the next-N budget"""
+        path = environ.get("PATH_INFO", "")
+        if path.startswith(self.skip_prefixes):
+            return False
+        if environ.get(PROFILE_HEADER):
+            return True
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            if self.remaining == 0 and not self.header_only and self._original is not None:
+                # Budget used up: unwrap, later requests go straight to the app
+                self.app.wsgi_app = self._original
+                self._original = None
+            return True
+
+    def _wsgi_app(self, environ, start_response):
+        original = self._original
+        if original is None:  # switched off while this request came in
+            return self.app.wsgi_app(environ, start_response)
+        if not self._claim(environ):
+            return original(environ, start_response)
+        return self._profile(original, environ, start_response)
+
+    def _profile(self, wsgi_app, environ, start_response):
+        request = f"{environ.get('REQUEST_METHOD', 'GET')} {environ.get('PATH_INFO', '')}"
+        mode = self.mode
+        started = time.perf_counter()
+        if mode == "cprofile":
+            if not self._cprofile_lock.acquire(blocking=False):
+                return wsgi_app(environ, start_response)  # another request is being profiled
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                try:
+                    # Materialize the body so the whole response is inside the profile
+                    body = list(wsgi_app(environ, start_response))
+                finally:
+                    profile.disable()
+            finally:
+                self._cprofile_lock.release()
+            self._save(request, started, "pstats", profile.dump_stats)
+        else:
+            sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            try:
+                body = list(wsgi_app(environ, start_response))
+            finally:
+                sampler.stop()
+            self._save(request, started, "collapsed", lambda path: self._write_collapsed(path, sampler.counts))
+        return body
+
+    @staticmethod
+    def _write_collapsed(path, counts):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _save(self, request, started, extension, write):
+        ms = (time.perf_counter() - started) * 1000
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", request).strip("_")[:60]
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}-{ms:.0f}ms.{extension}"
+        try:
+            write(os.path.join(self.directory, name))
+        except OSError as e:
+            if self.logger:
+                self.logger.warning("Profile not saved: %s", e)
+            return
+        with self._lock:
+            self._profiles.append({"name": name, "request": request, "ms": round(ms, 1), "created": time.time()})
+            while len(self._profiles) > self.max_profiles:
+                old = self._profiles.popleft()
+                try:
+                    os.remove(os.path.join(self.directory, old["name"]))
+                except OSError:
+                    pass
+        if self.logger:
+            self.logger.info("Profiled %s (%.1f ms): %s", request, ms, name)
+
+    def profiles(self):
+        """Saved profiles, newest first"""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def path_of(self, name):
+        """File of a saved profile, None for unknown names"""
+        with self._lock:
+            if any(p["name"] == name for p in self._profiles):
+                return os.path.join(os.path.abspath(self.directory), name)
+        return None
+
+    def status(self):
+        return {
+            "profiling_enabled": self.enabled,
+            "mode": self.mode,
+            "remaining": self.remaining,
+            "header_only": self.header_only,
+        }
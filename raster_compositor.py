@@ -0,0 +1,241 @@
+# Incremental label rasterizer: cached static layer + per-label overlay
+# -*- coding: utf-8 -*-
+import math
+import struct
+import threading
+
+import fitz
+import numpy as np
+from PIL import Image
+
+POINTS_PER_INCH = 72.0
+INK_THRESHOLD = 128  # grayscale value below which a pixel is printed
+RASTER_MAGIC = b"RLB1"
+RASTER_HEADER = struct.Struct("<4sHHH")
+
+
+class StaticLayer:
+    """Packed 1-bit raster of a model's static label content"""
+
+    __slots__ = ("bits", "width", "height", "page_width_pt", "page_height_pt", "dpi")
+
+    def __init__(self, bits, width, height, page_width_pt, page_height_pt, dpi):
+        self.bits = bits  # uint8 array (height, ceil(width / 8)), 1 = ink
+        self.width = width
+        self.height = height
+        self.page_width_pt = page_width_pt
+        self.page_height_pt = page_height_pt
+        self.dpi = dpi
+
+
+def _pixmap_to_ink(pix):
+    """Convert grayscale fitz pixmap to boolean ink mask"""
+    samples = np.frombuffer(pix.samples, dtype=np.uint8)
+    samples = samples.reshape(pix.height, pix.stride)[:, : pix.width]
+    return samples < INK_THRESHOLD
+
+
+class RasterCompositor:
+    """Rasterize each model's static layer once, then OR per-label overlays into it.
+
+    The static layer (template, type/FCC/power text) is rendered at the device
+    DPI and kept as a packed 1-bit buffer. For each label only the serial text
+    box and the Data Matrix region are rendered.
+    """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    def device_dpi(self):
+        """Native printer resolution ([printing] device_dpi)"""
+        return self.printer.device_dpi
+
+    def invalidate(self):
+        """Drop all cached static layers (layout or template changed)"""
+        with self._lock:
+            self._layers.clear()
+
+    def get_static_layer(self, layout, device_type: str, template_pdf: str, dpi: int):
+        """Return cached static layer, rasterizing it on first use"""
+        key = (layout.model(device_type).fingerprint, device_type, template_pdf, dpi)
+        layer = self._layers.get(key)
+        if layer is not None:
+            return layer
+
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is None:
+                layer = self._rasterize_static(layout, device_type, template_pdf, dpi)
+                self._layers[key] = layer
+                self.printer.logger.info(
+                    "Static layer cached: %s @ %s dpi (%sx%s, %s bytes)",
+                    device_type,
+                    dpi,
+                    layer.width,
+                    layer.height,
+                    layer.bits.nbytes,
+                )
+        return layer
+
+    def _rasterize_static(self, layout, device_type, template_pdf, dpi):
+        pdf_bytes = self.printer.render_static_layer_pdf(layout, device_type, template_pdf)
+        return self.rasterize_pdf(pdf_bytes, dpi)
+
+    @staticmethod
+    def rasterize_pdf(pdf_bytes, dpi):
+        """Packed 1-bit raster of the first page of a PDF"""
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page = doc[0]
+            zoom = dpi / POINTS_PER_INCH
+            pix = page.get_pixmap(
+                matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False
+            )
+            ink = _pixmap_to_ink(pix)
+            return StaticLayer(
+                np.packbits(ink, axis=1),
+                pix.width,
+                pix.height,
+                page.rect.width,
+                page.rect.height,
+                dpi,
+            )
+
+    def _render_text_runs(self, layer, runs, font_size):
+        """Render serial text runs; returns (x0, y0, ink_mask) in device pixels"""
+        zoom = layer.dpi / POINTS_PER_INCH
+        height = layer.page_height_pt
+        ascender = font_size * 0.75
+        descender = font_size * 0.25
+
+        x_min, y_min, x_max, y_max = None, None, None, None
+        with fitz.open() as doc:
+            page = doc.new_page(width=layer.page_width_pt, height=height)
+            for x_pt, y_pt, text in runs:
+                # reportlab y is from the bottom, fitz y is from the top
+                baseline = height - y_pt
+                page.insert_text(
+                    (x_pt, baseline), text, fontname="hebo", fontsize=font_size
+                )
+                width = fitz.get_text_length(text, fontname="hebo", fontsize=font_size)
+                box = (x_pt, baseline - ascender, x_pt + width, baseline + descender)
+                x_min = box[0] if x_min is None else min(x_min, box[0])
+                y_min = box[1] if y_min is None else min(y_min, box[1])
+                x_max = box[2] if x_max is None else max(x_max, box[2])
+                y_max = box[3] if y_max is None else max(y_max, box[3])
+
+            clip = fitz.Rect(
+                int(x_min * zoom) / zoom,
+                int(y_min * zoom) / zoom,
+                x_max + 1 / zoom,
+                y_max + 1 / zoom,
+            ) & page.rect
+            pix = page.get_pixmap(
+                matrix=fitz.Matrix(zoom, zoom),
+                clip=clip,
+                colorspace=fitz.csGRAY,
+                alpha=False,
+            )
+            return pix.x, pix.y, _pixmap_to_ink(pix)
+
+    def _render_datamatrix(self, layer, serial_number, x, y, size, modules=None):
+        """Render Data Matrix region at (x, y, size) points; returns
+        (x0, y0, ink_mask) in device pixels. modules - already encoded symbol"""
+        p = self.printer
+        zoom = layer.dpi / POINTS_PER_INCH
+        # reportlab y is from the bottom, raster rows from the top. The symbol
+        # covers every pixel it touches, as MuPDF grid-fits images, so the
+        # PDF print path puts it on the same dots
+        top = layer.page_height_pt - y - size
+        x0, y0 = math.floor(x * zoom), math.floor(top * zoom)
+        size_pixels = max(math.ceil((x + size) * zoom) - x0, math.ceil((top + size) * zoom) - y0)
+        try:
+            if modules is None:
+                ink = p.dm_encoder.render(serial_number, size_pixels)
+            else:
+                ink = p.dm_encoder.to_bitmap(modules, size_pixels)
+        except Exception as e:
+            p.logger.error("Data Matrix creation error: %s", e)
+            return None
+        return x0, y0, ink
+
+    def overlay_datamatrix(self, bits, layer, serial_number, x, y, size, modules=None):
+        """OR a Data Matrix into bits; False if it could not be created"""
+        region = self._render_datamatrix(layer, serial_number, x, y, size, modules)
+        if region is None:
+            self.printer.logger.warning("Data Matrix not created")
+            return False
+        self._or_region(bits, layer, *region)
+        return True
+
+    @staticmethod
+    def _or_region(bits, layer, x0, y0, ink):
+        """OR a boolean ink mask into the packed buffer at (x0, y0)"""
+        h, w = ink.shape
+        # Clip to label bounds
+        sx0, sy0 = max(0, -x0), max(0, -y0)
+        x0, y0 = max(0, x0), max(0, y0)
+        w = min(w - sx0, layer.width - x0)
+        h = min(h - sy0, layer.height - y0)
+        if w <= 0 or h <= 0:
+            return
+
+        # Full-width band keeps byte alignment of the packed rows
+        band = np.zeros((h, layer.width), dtype=bool)
+        band[:, x0 : x0 + w] = ink[sy0 : sy0 + h, sx0 : sx0 + w]
+        bits[y0 : y0 + h] |= np.packbits(band, axis=1)
+
+    def render_bits(
+        self, layout, device_type, serial_number, template_pdf, dpi=None, add_datamatrix=True, modules=None
+    ):
+        """Compose label; returns (packed uint8 array, StaticLayer).
+        modules - Data Matrix already encoded for serial_number"""
+        if dpi is None:
+            dpi = self.device_dpi()
+        layer = self.get_static_layer(layout, device_type, template_pdf, dpi)
+        bits = layer.bits.copy()
+
+        model_layout = layout.model(device_type)
+        runs = model_layout.serial_text_runs(serial_number)
+        self._or_region(
+            bits,
+            layer,
+            *self._render_text_runs(layer, runs, model_layout.serial_font_size),
+        )
+
+        if add_datamatrix:
+            self.overlay_datamatrix(
+                bits, layer, serial_number, layout.dm_x, layout.dm_y, layout.dm_size, modules
+            )
+
+        return bits, layer
+
+    def render(
+        self, layout, device_type, serial_number, template_pdf, dpi=None, add_datamatrix=True
+    ):
+        """Compose label and return 1-bit PIL image"""
+        bits, layer = self.render_bits(
+            layout, device_type, serial_number, template_pdf, dpi, add_datamatrix
+        )
+        return raster_image(bits, layer.width, layer.height)
+
+
+def raster_image(bits, width, height):
+    """1-bit PIL image from packed rows ("1;I" - bit set = black)"""
+    return Image.frombytes("1", (width, height), bits.tobytes(), "raw", "1;I")
+
+
+def pack_raster(bits, layer):
+    """Serialize packed raster: header (magic, width, height, dpi) + rows"""
+    return RASTER_HEADER.pack(RASTER_MAGIC, layer.width, layer.height, layer.dpi) + bits.tobytes()
+
+
+def unpack_raster(data):
+    """Inverse of pack_raster, returns 1-bit PIL image"""
+    magic, width, height, _dpi = RASTER_HEADER.unpack_from(data)
+    if magic != RASTER_MAGIC:
+        raise ValueError("Not a packed label raster")
+    return Image.frombytes(
+        "1", (width, height), data[RASTER_HEADER.size :], "raw", "1;I"
+    )
@@ -0,0 +1,275 @@
+# Device readiness: shared validation rules, bulk prefetch from the production database
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import time
+
+from hardware import ERR_DB_OK
+
+# Check name -> Config flag that requires it (validation on)
+CHECKS = (
+    ("tests_ok", "REQUIRE_TESTS_OK"),
+    ("calibration_ok", "REQUIRE_CALIBRATION_OK"),
+    ("prog_time", "REQUIRE_PROG_TIME"),
+    ("calib_time", "REQUIRE_CALIB_TIME"),
+)
+CHECK_LABELS = {
+    "tests_ok": "тесты не пройдены",
+    "calibration_ok": "калибровка не пройдена",
+    "prog_time": "нет времени программирования",
+    "calib_time": "нет времени калибровки",
+    "not_found": "нет в базе данных",
+}
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    serial         TEXT PRIMARY KEY,
+    tests_ok       INTEGER NOT NULL DEFAULT 0,
+    calibration_ok INTEGER NOT NULL DEFAULT 0,
+    prog_time      INTEGER NOT NULL DEFAULT 0,
+    calib_time     INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def readiness_rules(config):
+    """Checks the web flow enforces: the REQUIRE_* ones with validation on,
+    only tests_ok with validation off"""
+    if not config.DEVICE_VALIDATION_ENABLED:
+        return ("tests_ok",)
+    return tuple(name for name, flag in CHECKS if getattr(config, flag))
+
+
+def check_readiness(db_info, rules):
+    """(ready, failed check names) of a GetDeviceDatabaseInfo-shaped dict"""
+    if db_info is None or db_info.get("result", ERR_DB_OK) != ERR_DB_OK:
+        return False, ["not_found"]
+    passed = {
+        "tests_ok": db_info.get("tests_ok", 0) == 1,
+        "calibration_ok": db_info.get("calibration_ok", 0) == 1,
+        "prog_time": db_info.get("prog_time", 0) > 0,
+        "calib_time": db_info.get("calib_time", 0) > 0,
+    }
+    failed = [name for name in rules if not passed[name]]
+    return not failed, failed
+
+
+def split_by_readiness(cache, serials, rules):
+    """(ready serials, [(serial, failed checks)]) from one cache prefetch"""
+    ready, not_ready = [], []
+    for serial, db_info in cache.prefetch(serials).items():
+        ok, failed = check_readiness(db_info, rules)
+        if ok:
+            ready.append(serial)
+        else:
+            not_ready.append((serial, failed))
+    return ready, not_ready
+
+
+def describe_failed(failed):
+    return ", ".join(CHECK_LABELS.get(name, name) for name in failed)
+
+
+def _db_info(row):
+    _serial, tests_ok, calibration_ok, prog_time, calib_time = row
+    return {
+        "result": ERR_DB_OK,
+        "tests_ok": int(tests_ok or 0),
+        "calibration_ok": int(calibration_ok or 0),
+        "prog_time": int(prog_time or 0),
+        "calib_time": int(calib_time or 0),
+    }
+
+
+class PostgresReadinessSource:
+    """Readiness rows of many serials in one query over a pooled connection"""
+
+    def __init__(self, settings, logger=None):
+        self.settings = settings
+        self.query = settings["readiness_query"]
+        self.pool_max = settings["pool_max"]
+        self.logger = logger
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                s = self.settings
+                self._pool = ThreadedConnectionPool(
+                    0,
+                    self.pool_max,
+                    host=s["host"],
+                    port=s["port"],
+                    dbname=s["name"],
+                    user=s["user"],
+                    password=s["password"],
+                    connect_timeout=s["connect_timeout"],
+                )
+            return self._pool
+
+    def fetch(self, serials):
+        """serial -> db_info for the serials found"""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(self.query, {"serials": list(serials)})
+                rows = cursor.fetchall()
+            conn.rollback()  # read only: end the transaction, keep the connection idle
+        except Exception:
+            broken = conn.closed != 0
+            raise
+        finally:
+            pool.putconn(conn, close=broken)
+        return {row[0]: _db_info(row) for row in rows}
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+class LocalReadinessSource:
+    """SQLite stand-in of the production database (development, load tests)"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(LOCAL_SCHEMA)
+        self._lock = threading.Lock()
+
+    def seed(self, serials, ready=True):
+        value = 1 if ready else 0
+        stamp = int(time.time()) if ready else 0
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?, ?)",
+                [(serial, 1, value, stamp, stamp) for serial in serials],
+            )
+            self._db.commit()
+
+    def fetch(self, serials):
+        serials = list(serials)
+        found = {}
+        with self._lock:
+            # SQLite caps host parameters per statement
+            for start in range(0, len(serials), 900):
+                chunk = serials[start : start + 900]
+                rows = self._db.execute(
+                    "SELECT serial, tests_ok, calibration_ok, prog_time, calib_time FROM devices "
+                    f"WHERE serial IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((row[0], _db_info(row)) for row in rows)
+        return found
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_source(settings, logger=None):
+    """Source from the [database] section of conf.toml.
+    READINESS_BACKEND environment variable overrides the configured backend"""
+    backend = os.environ.get("READINESS_BACKEND") or settings["backend"]
+    if backend == "postgres":
+        return PostgresReadinessSource(settings, logger)
+    if backend == "local":
+        return LocalReadinessSource(settings["local_path"])
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+class ReadinessCache:
+    """db_info per serial with a TTL; prefetch() loads all misses in one query.
+
+    Serials not found in the database are not cached (they may appear
+    once their tests are recorded).
+    """
+
+    def __init__(self, source, ttl=60.0, max_entries=100000):
+        self.source = source
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.queries = 0
+        self.hits = 0
+        self._entries = {}  # serial -> (expires, db_info)
+        self._lock = threading.Lock()
+
+    def prefetch(self, serials):
+        """serial -> db_info (None when not in the database) for all serials"""
+        now = time.monotonic()
+        serials = list(serials)
+        result, missing = {}, []
+        with self._lock:
+            for serial in dict.fromkeys(serials):
+                entry = self._entries.get(serial)
+                if entry is not None and entry[0] > now:
+                    result[serial] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(serial)
+        if missing:
+            found = self.source.fetch(missing)
+            expires = time.monotonic() + self.ttl
+            with self._lock:
+                self.queries += 1
+                if len(self._entries) + len(found) > self.max_entries:
+                    self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                for serial in missing:
+                    info = found.get(serial)
+                    result[serial] = info
+                    if info is not None:
+                        self._entries[serial] = (expires, info)
+        return {serial: result[serial] for serial in dict.fromkeys(serials)}
+
+    def get(self, serial):
+        return self.prefetch([serial])[serial]
+
+    def invalidate(self, serial=None):
+        with self._lock:
+            if serial is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(serial, None)
+
+
+def main():
+    import argparse
+
+    import toml
+
+    parser = argparse.ArgumentParser(description="Device readiness from the production database")
+    parser.add_argument("serials", nargs="+")
+    parser.add_argument("--seed-ready", action="store_true", help="local stand-in: add serials as ready")
+    parser.add_argument("--seed-not-ready", action="store_true", help="local stand-in: add serials as not ready")
+    args = parser.parse_args()
+
+    settings = toml.load("conf.toml")["database"]
+    source = create_source(settings)
+    if args.seed_ready or args.seed_not_ready:
+        if not isinstance(source, LocalReadinessSource):
+            parser.error("seeding is only possible with the local stand-in (READINESS_BACKEND=local)")
+        source.seed(args.serials, ready=args.seed_ready)
+
+    class AllRules:
+        DEVICE_VALIDATION_ENABLED = True
+        REQUIRE_TESTS_OK = REQUIRE_CALIBRATION_OK = REQUIRE_PROG_TIME = REQUIRE_CALIB_TIME = True
+
+    started = time.perf_counter()
+    infos = ReadinessCache(source).prefetch(args.serials)
+    print(f"{len(infos)} serials in {(time.perf_counter() - started) * 1000:.1f} ms (one query)")
+    for serial, info in infos.items():
+        ready, failed = check_readiness(info, readiness_rules(AllRules))
+        print(f"{serial}: {'READY' if ready else 'NOT READY - ' + describe_failed(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Client of the shared label render service (render_service.py)
+# -*- coding: utf-8 -*-
+import json
+
+import requests
+
+# Batch stream record: b"<serial> <ok|error> <length>\n" followed by <length> bytes
+RECORD_HEADER_LIMIT = 256
+
+
+def read_records(stream):
+    """Parse a batch stream (file-like with read/readline) into (serial, ok, data)"""
+    while True:
+        header = stream.readline(RECORD_HEADER_LIMIT)
+        if not header:
+            return
+        serial, status, length = header.decode("ascii").split()
+        data = stream.read(int(length))
+        yield serial, status == "ok", data
+
+
+class RenderClient:
+    """Renders labels on a remote render service over a keep-alive session"""
+
+    def __init__(self, url, timeout=5.0, logger=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.logger = logger
+        self.session = requests.Session()
+
+    def render(self, serial_number, fmt="pdf", template_pdf=None, add_datamatrix=True, dpi=None):
+        """Bytes of one label or None if the service failed"""
+        params = {"format": fmt, "datamatrix": int(bool(add_datamatrix))}
+        if template_pdf:
+            params["template"] = template_pdf
+        if dpi:
+            params["dpi"] = dpi
+        try:
+            response = self.session.get(
+                f"{self.url}/render/{serial_number}", params=params, timeout=self.timeout
+            )
+            if response.status_code == 200:
+                return response.content
+            message = response.text[:200]
+        except requests.RequestException as e:
+            message = str(e)
+        if self.logger:
+            self.logger.warning("Render service failed for %s: %s", serial_number, message)
+        return None
+
+    def render_batch(self, serials, fmt="pdf", template_pdf=None, add_datamatrix=True):
+        """Stream (serial, ok, data) for many labels; data is the error text when not ok"""
+        payload = {"serials": list(serials), "format": fmt, "datamatrix": bool(add_datamatrix)}
+        if template_pdf:
+            payload["template"] = template_pdf
+        with self.session.post(
+            f"{self.url}/render/batch",
+            data=json.dumps(payload),
+            headers={"Content-Type": "application/json"},
+            stream=True,
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield from read_records(response.raw)
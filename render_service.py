@@ -0,0 +1,204 @@
+# Headless label render service (Linux/Windows), shared by all stations
+# -*- coding: utf-8 -*-
+"""Stations ask for label bytes instead of rendering locally.
+
+GET  /render/<serial>?format=pdf|tspl|png|raw&dpi=&template=&datamatrix=0|1
+POST /render/batch   JSON {"serials": [...], "format": ..., ...} or text/plain
+                     one serial per line; chunked stream of records
+                     b"<serial> <ok|error> <length>\\n" + <length> bytes
+GET  /health
+
+Formats: pdf - label PDF, tspl - TSPL print job, png - 1-bit PNG,
+raw - packed raster (RLB1 header + rows, see raster_compositor).
+HTTP/1.1 keep-alive; with --workers N labels are rendered in N processes.
+"""
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import WSGIRequestHandler
+
+from print_labels import LabelPrinter
+from raster_compositor import pack_raster
+from serial_ingest import SERIAL_FORMAT_HINT, classify_serial
+
+LABEL_TEMPLATE = "template51x25.pdf"
+MAX_BATCH = 10000
+BATCH_SLICE = 256
+FORMATS = {
+    "pdf": "application/pdf",
+    "tspl": "application/octet-stream",
+    "png": "image/png",
+    "raw": "application/octet-stream",
+}
+
+app = Flask(__name__)
+_printer = None
+_pool = None
+_worker_printer = None
+
+
+def get_printer():
+    global _printer
+    if _printer is None:
+        _printer = LabelPrinter(archive=False)  # renders only, never prints
+        _printer.render_client = None  # never forward to ourselves
+    return _printer
+
+
+def render_label(printer, serial_number, fmt, template_pdf, add_datamatrix, dpi=None):
+    """Label bytes in the requested format. Raises ValueError for bad input"""
+    device_type = classify_serial(serial_number)
+    if device_type is None:
+        raise ValueError(f"Неверный формат серийного номера: {serial_number}. {SERIAL_FORMAT_HINT}")
+    if fmt in ("pdf", "tspl"):
+        # print formats: the whole label set of the unit
+        data = printer.render_for_print(fmt, serial_number, template_pdf, add_datamatrix)
+    elif fmt == "raw":
+        bits, layer = printer.compositor.render_bits(
+            printer.layout, device_type, serial_number, template_pdf, dpi, add_datamatrix
+        )
+        data = pack_raster(bits, layer)
+    elif fmt == "png":
+        image = printer.render_label_raster(serial_number, template_pdf, dpi, add_datamatrix)
+        data = None
+        if image is not None:
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", optimize=True)
+            data = buffer.getvalue()
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    if data is None:
+        raise ValueError(f"Render failed for {serial_number}")
+    return data
+
+
+def _init_worker():
+    global _worker_printer
+    _worker_printer = LabelPrinter(archive=False)
+    _worker_printer.render_client = None
+    _worker_printer.watch_layout()
+
+
+def _render_in_worker(job):
+    """(serial, ok, data) - runs in a worker process"""
+    serial_number = job[0]
+    try:
+        return serial_number, True, render_label(_worker_printer, *job)
+    except Exception as e:
+        return serial_number, False, str(e).encode("utf-8")
+
+
+def _render_local(job):
+    serial_number = job[0]
+    try:
+        return serial_number, True, render_label(get_printer(), *job)
+    except Exception as e:
+        return serial_number, False, str(e).encode("utf-8")
+
+
+def _options(source):
+    fmt = source.get("format", "pdf")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    template_pdf = source.get("template") or LABEL_TEMPLATE
+    # Only template files next to the service, no paths
+    if os.path.basename(template_pdf) != template_pdf or not template_pdf.endswith(".pdf") \
+            or not os.path.exists(template_pdf):
+        raise ValueError(f"Unknown template: {template_pdf}")
+    add_datamatrix = str(source.get("datamatrix", "1")).lower() not in ("0", "false", "no")
+    dpi = source.get("dpi")
+    dpi = int(dpi) if dpi else None
+    if dpi is not None and not 50 <= dpi <= 1200:
+        raise ValueError("dpi must be 50..1200")
+    return fmt, template_pdf, add_datamatrix, dpi
+
+
+@app.route("/health")
+def health():
+    printer = get_printer()
+    return jsonify(
+        {
+            "success": True,
+            "layout": printer.layout.fingerprint[:12],
+            "workers": _pool._max_workers if _pool else 0,
+        }
+    )
+
+
+@app.route("/render/<serial_number>")
+def render_single(serial_number):
+    try:
+        fmt, template_pdf, add_datamatrix, dpi = _options(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    started = time.perf_counter()
+    job = (serial_number, fmt, template_pdf, add_datamatrix, dpi)
+    _serial, ok, data = _pool.submit(_render_in_worker, job).result() if _pool else _render_local(job)
+    if not ok:
+        return jsonify({"success": False, "message": data.decode("utf-8")}), 400
+
+    response = Response(data, mimetype=FORMATS[fmt])
+    response.headers["X-Render-Time-Ms"] = f"{(time.perf_counter() - started) * 1000:.1f}"
+    return response
+
+
+@app.route("/render/batch", methods=["POST"])
+def render_batch():
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"success": False, "message": 'JSON body: {"serials": [...], ...}'}), 400
+        serials = body.get("serials", [])
+        options = body
+    else:
+        serials = [line.strip() for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        options = request.args
+    try:
+        fmt, template_pdf, add_datamatrix, dpi = _options(options)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    if not isinstance(serials, list) or len(serials) > MAX_BATCH:
+        return jsonify({"success": False, "message": f"serials: list of up to {MAX_BATCH}"}), 400
+
+    jobs = [(str(serial), fmt, template_pdf, add_datamatrix, dpi) for serial in serials]
+
+    def generate():
+        # Slices keep at most BATCH_SLICE rendered labels in memory
+        for start in range(0, len(jobs), BATCH_SLICE):
+            chunk = jobs[start : start + BATCH_SLICE]
+            results = _pool.map(_render_in_worker, chunk, chunksize=8) if _pool else map(_render_local, chunk)
+            for serial_number, ok, data in results:
+                status = "ok" if ok else "error"
+                # Header token: no whitespace, ASCII only
+                token = "".join(c if c.isascii() and c.isprintable() and not c.isspace() else "?" for c in serial_number)
+                yield f"{token or '?'} {status} {len(data)}\n".encode("ascii") + data
+
+    return Response(generate(), mimetype="application/x-label-stream")
+
+
+def main():
+    global _pool
+    parser = argparse.ArgumentParser(description="Label render service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="render processes (0 - render in the request thread)")
+    args = parser.parse_args()
+
+    get_printer().watch_layout()
+    if args.workers > 0:
+        _pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker)
+
+    # HTTP/1.1: keep-alive connections and chunked batch responses
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    print(f"Render service on http://{args.host}:{args.port} ({args.workers} workers)")
+    app.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
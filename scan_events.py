@@ -0,0 +1,156 @@
+# Scan confirmations: printed serials waiting for the operator's scan
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+
+def scan_keys(device):
+    """Serials a scan event may refer to (barcode and/or serial field)"""
+    keys = []
+    for field in ("barcode", "serial"):
+        value = device.get(field)
+        if isinstance(value, str) and value.strip() and value.strip() not in keys:
+            keys.append(value.strip())
+    return keys
+
+
+class _Pending:
+    __slots__ = ("serial", "added", "device", "confirmed_at")
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.added = time.time()
+        self.device = None  # latest scan event for this serial
+        self.confirmed_at = None  # set once a "ready" scan arrived
+
+    @property
+    def waiting(self):
+        return self.confirmed_at is None
+
+
+class PendingScans:
+    """Index of printed serials; scan events are matched by dict lookup.
+
+    Requests waiting in wait() are woken as soon as the matching event is
+    confirmed. Confirmed entries stay for keep_seconds so a late UI check
+    still sees the scan.
+    """
+
+    def __init__(self, max_entries=1000, keep_seconds=300):
+        self.max_entries = max_entries
+        self.keep_seconds = keep_seconds
+        self._entries = OrderedDict()  # serial -> _Pending
+        self._changed = threading.Condition()
+
+    def add(self, serial):
+        """Label printed for serial: start waiting for its scan"""
+        now = time.time()
+        with self._changed:
+            entry = self._entries.get(serial)
+            if entry is None:
+                entry = self._entries[serial] = _Pending(serial)
+            self._entries.move_to_end(serial)
+            # Oldest first: drop confirmed entries past keep_seconds, cap the size
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                expired = not oldest.waiting and now - oldest.confirmed_at > self.keep_seconds
+                if not expired and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+            return entry
+
+    def confirm(self, device):
+        """Apply a scan event. Returns the serial it matched or None"""
+        with self._changed:
+            for key in scan_keys(device):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry.waiting:
+                    # A confirmed entry keeps its "ready" event: later events
+                    # (status changes, rescans) must not turn it back
+                    entry.device = device
+                    if device.get("status", "ready") == "ready":
+                        entry.confirmed_at = time.time()
+                    self._changed.notify_all()
+                return key
+        return None
+
+    def get(self, serial):
+        """(known, latest scan event) of a serial"""
+        with self._changed:
+            entry = self._entries.get(serial)
+            return (entry is not None, entry.device if entry is not None else None)
+
+    def is_waiting(self, serial):
+        with self._changed:
+            entry = self._entries.get(serial)
+            return entry is not None and entry.waiting
+
+    def wait(self, serial, timeout):
+        """Block up to timeout for a ready scan of serial; latest event or None"""
+        with self._changed:
+            entry = self._entries.get(serial)
+            if entry is None:
+                return None
+            self._changed.wait_for(lambda: not entry.waiting, timeout)
+            return entry.device
+
+    def waiting(self):
+        """Serials still waiting, oldest first, with the time they were printed"""
+        with self._changed:
+            return [(e.serial, e.added) for e in self._entries.values() if e.waiting]
+
+
+class ScanReconciler:
+    """Low-rate fallback for lost pushes: polls the webhook API only while
+    labels are waiting and hands matching devices to on_scan"""
+
+    def __init__(self, pending, fetch, on_scan, interval=30.0, logger=None):
+        self.pending = pending
+        self.fetch = fetch  # fetch(limit, minutes) -> list of device dicts
+        self.on_scan = on_scan
+        self.interval = interval
+        self.logger = logger
+        self.polls = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ScanReconciler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reconcile(self):
+        """One poll; returns the number of scans confirmed by it"""
+        waiting = self.pending.waiting()
+        if not waiting:
+            return 0
+        oldest = waiting[0][1]
+        minutes = min(int((time.time() - oldest) / 60) + 2, 600)
+        self.polls += 1
+        devices = self.fetch(max(100, 2 * len(waiting)), minutes)
+        confirmed = 0
+        for device in devices:
+            if any(self.pending.is_waiting(key) for key in scan_keys(device)):
+                self.on_scan(device)
+                confirmed += 1
+        if confirmed and self.logger:
+            self.logger.info("Scan reconciliation confirmed %s label(s) missed by the webhook", confirmed)
+        return confirmed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning("Scan reconciliation failed: %s", e)
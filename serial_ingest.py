@@ -0,0 +1,259 @@
+# Streaming serial number ingest and validation for batch jobs
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+import re
+import sys
+
+# One precompiled pattern for all models: group 1 - model, group 2 - number
+SERIAL_PATTERN = re.compile(r"(RC-(?:102|103G?|110|410))-(\d{6})")
+# Range: RC-110-000100..RC-110-000150 or RC-110-000100..000150
+RANGE_PATTERN = re.compile(
+    r"(RC-(?:102|103G?|110|410))-(\d{6})\s*\.\.\s*(?:(RC-(?:102|103G?|110|410))-)?(\d{6})"
+)
+SERIAL_FORMAT_HINT = "Ожидается формат: RC-XXX-XXXXXX или RC-XXXG-XXXXXX"
+MODELS = ("RC-102", "RC-103", "RC-103G", "RC-110", "RC-410")
+SERIAL_SPACE = 1_000_000  # six digit serial part
+
+
+def classify_serial(serial_number: str):
+    """Return device model for a valid serial number, None otherwise"""
+    match = SERIAL_PATTERN.fullmatch(serial_number)
+    return match.group(1) if match else None
+
+
+class _SerialBitset:
+    """Seen-set over the fixed serial space: 125 KB per model, any number of rows"""
+
+    __slots__ = ("_bits",)
+
+    def __init__(self):
+        self._bits = {}
+
+    def add(self, model: str, number: int) -> bool:
+        """Mark serial as seen. Returns False if it was already seen"""
+        bits = self._bits.get(model)
+        if bits is None:
+            bits = self._bits[model] = bytearray(SERIAL_SPACE // 8)
+        byte, mask = number >> 3, 1 << (number & 7)
+        if bits[byte] & mask:
+            return False
+        bits[byte] |= mask
+        return True
+
+
+class IngestReport:
+    """Counters plus bounded samples of rejected and duplicate rows"""
+
+    def __init__(self, source: str = "", max_samples: int = 100):
+        self.source = source
+        self.max_samples = max_samples
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.ranges = 0
+        self.per_model = dict.fromkeys(MODELS, 0)
+        self.rejected_rows = []
+        self.duplicate_rows = []
+
+    def reject(self, row: int, value: str, reason: str):
+        self.rejected += 1
+        if len(self.rejected_rows) < self.max_samples:
+            self.rejected_rows.append({"row": row, "value": value, "reason": reason})
+
+    def duplicate(self, row: int, serial: str):
+        self.duplicates += 1
+        if len(self.duplicate_rows) < self.max_samples:
+            self.duplicate_rows.append({"row": row, "value": serial})
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "rows": self.rows,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "ranges": self.ranges,
+            "per_model": self.per_model,
+            "rejected_rows": self.rejected_rows,
+            "duplicate_rows": self.duplicate_rows,
+            "samples_truncated": self.rejected > len(self.rejected_rows)
+            or self.duplicates > len(self.duplicate_rows),
+        }
+
+
+class SerialIngest:
+    """Validate, classify, expand ranges and deduplicate a stream of serial rows.
+
+    Accepted serials are yielded as (serial, model) while the report is built,
+    so memory stays bounded regardless of input size.
+    """
+
+    def __init__(self, source: str = "", max_samples: int = 100, max_range: int = SERIAL_SPACE):
+        self.report = IngestReport(source, max_samples)
+        self.max_range = max_range
+        self._seen = _SerialBitset()
+
+    def _accept(self, row, model, number):
+        serial = f"{model}-{number:06d}"
+        if not self._seen.add(model, number):
+            self.report.duplicate(row, serial)
+            return None
+        self.report.accepted += 1
+        self.report.per_model[model] += 1
+        return serial
+
+    def process(self, values):
+        """values: iterable of (row_number, raw_value). Yields (serial, model)"""
+        report = self.report
+        fullmatch = SERIAL_PATTERN.fullmatch
+        for row, raw in values:
+            report.rows += 1
+            value = raw.strip()
+
+            match = fullmatch(value)
+            if match:
+                serial = self._accept(row, match.group(1), int(match.group(2)))
+                if serial:
+                    yield serial, match.group(1)
+                continue
+
+            match = RANGE_PATTERN.fullmatch(value)
+            if match:
+                model, first, end_model, last = match.groups()
+                first, last = int(first), int(last)
+                if end_model and end_model != model:
+                    report.reject(row, raw, "range spans different models")
+                elif last < first:
+                    report.reject(row, raw, "range end before start")
+                elif last - first + 1 > self.max_range:
+                    report.reject(row, raw, f"range larger than {self.max_range}")
+                else:
+                    report.ranges += 1
+                    for number in range(first, last + 1):
+                        serial = self._accept(row, model, number)
+                        if serial:
+                            yield serial, model
+                continue
+
+            report.reject(row, raw, "invalid format")
+
+
+def iter_lines(stream):
+    """Newline separated serials; blank lines and # comments are skipped"""
+    for row, line in enumerate(stream, start=1):
+        value = line.strip()
+        if value and not value.startswith("#"):
+            yield row, value
+
+
+def iter_csv(stream, column=None, delimiter=","):
+    """Serials from a CSV column (header name or index).
+
+    Without column the header is searched for "serial"/"serial_number"/"sn",
+    a file without such header is read from its first column.
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    index = column if isinstance(column, int) else None
+
+    for row, cells in enumerate(reader, start=1):
+        if not cells:
+            continue
+        if index is None:
+            header = [cell.strip().lower() for cell in cells]
+            names = [column.lower()] if column else ["serial", "serial_number", "sn"]
+            found = next((header.index(name) for name in names if name in header), None)
+            if found is not None:
+                index = found
+                continue  # header row
+            if column:
+                raise ValueError(f"CSV column not found: {column}")
+            index = 0
+        if index < len(cells) and cells[index].strip():
+            yield row, cells[index]
+
+
+def parse_column(value):
+    """CSV column from a CLI / query string value: digits - 0-based index,
+    anything else - header name, empty - auto"""
+    if not value:
+        return None
+    value = value.strip()
+    return int(value) if value.isdigit() else value
+
+
+def open_source(path: str, encoding: str = "utf-8-sig"):
+    """Open file path or '-' (stdin) as a text stream"""
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding=encoding, newline="")
+    return open(path, "r", encoding=encoding, newline="")
+
+
+def iter_source(stream, fmt: str = "auto", column=None, name: str = ""):
+    """Pick CSV or newline parser (auto: .csv extension or a delimiter in the first line)"""
+    first = stream.readline()
+    delimiter = ";" if ";" in first and "," not in first else ","
+    if fmt == "auto":
+        csv_like = name.lower().endswith(".csv") or delimiter in first
+        fmt = "csv" if csv_like else "lines"
+    stream = _Prepend(first, stream)
+    if fmt == "csv":
+        return iter_csv(stream, column, delimiter)
+    return iter_lines(stream)
+
+
+class _Prepend:
+    """Line iterator that yields an already consumed first line again"""
+
+    def __init__(self, first, stream):
+        self.first = first
+        self.stream = stream
+
+    def __iter__(self):
+        if self.first:
+            yield self.first
+        yield from self.stream
+
+
+def ingest_stream(stream, fmt="auto", column=None, name="", sink=None, max_samples=100):
+    """Run a whole stream through SerialIngest. sink(serial, model) gets accepted rows"""
+    ingest = SerialIngest(name, max_samples)
+    for serial, model in ingest.process(iter_source(stream, fmt, column, name)):
+        if sink is not None:
+            sink(serial, model)
+    return ingest.report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Validate serial number lists")
+    parser.add_argument("source", help="CSV / text file or - for stdin")
+    parser.add_argument("--format", choices=["auto", "csv", "lines"], default="auto")
+    parser.add_argument("--column", help="CSV column name or index")
+    parser.add_argument("--out", help="Write accepted serials to this file")
+    args = parser.parse_args()
+
+    column = parse_column(args.column)
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    try:
+        with open_source(args.source) as stream:
+            report = ingest_stream(
+                stream,
+                args.format,
+                column,
+                args.source,
+                (lambda serial, model: out.write(serial + "\n")) if out else None,
+            )
+    finally:
+        if out:
+            out.close()
+
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    return 0 if report.rejected == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
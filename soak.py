@@ -0,0 +1,278 @@
+# Soak test: render and print tens of thousands of labels, watch for leaks
+# -*- coding: utf-8 -*-
+"""Run LabelPrinter for a whole shift's worth of labels in one process.
+
+Every label goes the production way: optional speculative pre-render, then
+create_and_print_label. Printing goes to stand-ins:
+  acrobat - a stub executable in place of Acrobat (started and terminated per label)
+  tspl    - the TSPL printer emulator over TCP
+  both    - alternate per label
+
+Every --sample-every labels (after gc) the process is sampled: RSS, Python
+heap (tracemalloc), open file handles, child processes and threads. After
+--warmup labels the growth per 1,000 labels is fitted over the samples; the
+run fails if it exceeds the thresholds. The top tracemalloc growth since the
+end of the warm-up is printed to find the allocating line.
+
+psutil is used when installed; without it Linux /proc is read.
+"""
+import argparse
+import gc
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from station_load import MODELS
+from tspl_printer import PrinterEmulator
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LABEL_TEMPLATE = "template51x25.pdf"
+
+
+class ProcessProbe:
+    """RSS, open handles and live child processes of this process"""
+
+    def __init__(self):
+        self.process = psutil.Process() if psutil else None
+
+    def rss_mb(self):
+        if self.process is not None:
+            return self.process.memory_info().rss / 1048576
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576
+
+    def handles(self):
+        """Open file descriptors (handles on Windows)"""
+        if self.process is not None:
+            if hasattr(self.process, "num_handles"):
+                return self.process.num_handles()
+            return self.process.num_fds()
+        return len(os.listdir("/proc/self/fd"))
+
+    def children(self):
+        if self.process is not None:
+            return len(self.process.children(recursive=True))
+        count = 0
+        for task in os.listdir("/proc/self/task"):
+            try:
+                with open(f"/proc/self/task/{task}/children") as f:
+                    count += len(f.read().split())
+            except OSError:
+                pass
+        return count
+
+
+def make_acrobat_stub(directory):
+    """Executable that, like Acrobat after /t, stays running until terminated"""
+    if os.name == "nt":
+        path = os.path.join(directory, "acrobat_stub.cmd")
+        body = f'@"{sys.executable}" -c "import time; time.sleep(60)"\r\n'
+    else:
+        path = os.path.join(directory, "acrobat_stub.sh")
+        body = "#!/bin/sh\nexec sleep 60\n"
+    with open(path, "w") as f:
+        f.write(body)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def slope_per_1000(samples, field):
+    """Least-squares growth of a sampled value per 1,000 labels"""
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    xs = [s["labels"] for s in samples]
+    ys = [s[field] for s in samples]
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var * 1000
+
+
+def top_growth(baseline, snapshot, limit):
+    stats = snapshot.compare_to(baseline, "lineno")
+    return [
+        {
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "growth_kb": round(stat.size_diff / 1024, 1),
+            "blocks": stat.count_diff,
+        }
+        for stat in stats[:limit]
+        if stat.size_diff > 0
+    ]
+
+
+def setup_printer(args, workdir):
+    from label_archive import LabelArchive
+    from print_labels import LabelPrinter
+
+    # Archive path still exercised, but in the work directory: the station's
+    # archive has one writer and no place for soak serials
+    printer = LabelPrinter(archive=False)
+    printer.archive = LabelArchive(os.path.join(workdir, "archive"), fsync=False)
+    if not args.cache:
+        printer.label_cache = None  # render every label from scratch
+    printer.render_client = None
+    printer.acrobat_path = make_acrobat_stub(workdir)
+    printer.acrobat_print_wait = args.acrobat_wait
+    printer.acrobat_kill_wait = 1.0
+
+    emulator = PrinterEmulator(print_time=0.0).start()
+    printer.tspl.host, printer.tspl.port = emulator.host, emulator.port
+    printer.tspl.poll_interval = 0.001
+    if args.quiet:
+        printer.logger.disabled = True
+    return printer, emulator
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="soak-")
+    printer, emulator = setup_printer(args, workdir)
+    output_pdf = os.path.join(workdir, "label.pdf")
+    probe = ProcessProbe()
+    if args.tracemalloc:
+        tracemalloc.start(args.tracemalloc)
+
+    samples, failures = [], 0
+    baseline = None
+    started = time.monotonic()
+
+    def sample(labels):
+        gc.collect()
+        s = {
+            "labels": labels,
+            "elapsed_s": round(time.monotonic() - started, 1),
+            "rss_mb": round(probe.rss_mb(), 2),
+            "handles": probe.handles(),
+            "children": probe.children(),
+            "threads": threading.active_count(),
+            "heap_mb": round(tracemalloc.get_traced_memory()[0] / 1048576, 2) if args.tracemalloc else 0.0,
+        }
+        samples.append(s)
+        if not args.json:
+            print(
+                f"{labels:>8} labels {s['elapsed_s']:>8} s  rss {s['rss_mb']:>8.1f} MB  heap {s['heap_mb']:>7.2f} MB  "
+                f"handles {s['handles']:>5}  children {s['children']:>3}  threads {s['threads']:>3}  failed {failures}",
+                flush=True,
+            )
+
+    sample(0)
+    for i in range(1, args.labels + 1):
+        serial = f"{MODELS[i % len(MODELS)]}-{i % 1000000:06d}"
+        if args.backend == "both":
+            printer.print_backend = "tspl" if i % 2 else "acrobat"
+        else:
+            printer.print_backend = args.backend
+        if args.prerender:
+            printer.prerender(serial, LABEL_TEMPLATE)
+        if not printer.create_and_print_label(serial, LABEL_TEMPLATE, output_pdf, print_after_create=True):
+            failures += 1
+        if args.preview:
+            printer.render_preview_png(serial, LABEL_TEMPLATE, 150)
+        if i % args.sample_every == 0:
+            sample(i)
+            if i == args.warmup and args.tracemalloc:
+                baseline = tracemalloc.take_snapshot()
+    if samples[-1]["labels"] != args.labels:
+        sample(args.labels)
+
+    growth = []
+    if baseline is not None:
+        growth = top_growth(baseline, tracemalloc.take_snapshot(), args.top)
+        tracemalloc.stop()
+    emulator.stop()
+    printer.archive.close()
+
+    steady = [s for s in samples if s["labels"] >= args.warmup]
+    result = {
+        "labels": args.labels,
+        "failed_labels": failures,
+        "printed_by_emulator": emulator.labels,
+        "labels_per_s": round(args.labels / (time.monotonic() - started), 1),
+        "per_1000_labels": {
+            "rss_mb": round(slope_per_1000(steady, "rss_mb"), 3),
+            "heap_mb": round(slope_per_1000(steady, "heap_mb"), 3),
+            "handles": round(slope_per_1000(steady, "handles"), 3),
+            "threads": round(slope_per_1000(steady, "threads"), 3),
+        },
+        "children_at_end": samples[-1]["children"],
+        "top_growth": growth,
+        "samples": samples,
+    }
+    problems = []
+    per_1000 = result["per_1000_labels"]
+    if len(steady) < 3:
+        problems.append(f"not enough samples after the warm-up ({len(steady)}), run more labels")
+    if per_1000["rss_mb"] > args.max_rss_mb:
+        problems.append(f"RSS grows {per_1000['rss_mb']} MB per 1000 labels (limit {args.max_rss_mb})")
+    if per_1000["handles"] > args.max_handles:
+        problems.append(f"open handles grow {per_1000['handles']} per 1000 labels (limit {args.max_handles})")
+    if per_1000["threads"] > 0.5:
+        problems.append(f"threads grow {per_1000['threads']} per 1000 labels")
+    if result["children_at_end"] > 0:
+        problems.append(f"{result['children_at_end']} child process(es) still running")
+    if failures > args.labels * args.max_failure_rate:
+        problems.append(f"{failures} labels failed")
+    result["problems"] = problems
+    return result
+
+
+def print_report(result):
+    per_1000 = result["per_1000_labels"]
+    print(
+        f"\n{result['labels']} labels ({result['failed_labels']} failed), {result['labels_per_s']} labels/s; "
+        f"per 1000 labels: RSS {per_1000['rss_mb']:+.3f} MB, heap {per_1000['heap_mb']:+.3f} MB, "
+        f"handles {per_1000['handles']:+.3f}, threads {per_1000['threads']:+.3f}; "
+        f"children at end: {result['children_at_end']}"
+    )
+    if result["top_growth"]:
+        print("Top heap growth since the warm-up:")
+        for entry in result["top_growth"]:
+            print(f"  {entry['growth_kb']:>10.1f} KB {entry['blocks']:>7} blocks  {entry['where']}")
+    for problem in result["problems"]:
+        print(f"FAIL: {problem}")
+    if not result["problems"]:
+        print("OK: no growth above the limits")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of LabelPrinter with leak tracking")
+    parser.add_argument("--labels", type=int, default=20000)
+    parser.add_argument("--sample-every", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=2000, help="labels before growth is measured")
+    parser.add_argument("--backend", choices=("acrobat", "tspl", "both"), default="both")
+    parser.add_argument("--acrobat-wait", type=float, default=0.005, help="stub Acrobat spool time, s")
+    parser.add_argument("--prerender", action="store_true", help="pre-render each label first, as main.py does")
+    parser.add_argument("--preview", action="store_true", help="render a preview PNG per label too")
+    parser.add_argument("--cache", action="store_true", help="keep the on-disk label cache enabled")
+    parser.add_argument("--tracemalloc", type=int, default=1, help="traceback frames, 0 - off")
+    parser.add_argument("--top", type=int, default=10, help="allocation sites to report")
+    parser.add_argument("--max-rss-mb", type=float, default=2.0, help="limit per 1000 labels")
+    parser.add_argument("--max-handles", type=float, default=1.0, help="limit per 1000 labels")
+    parser.add_argument("--max-failure-rate", type=float, default=0.0)
+    parser.add_argument("--quiet", action="store_true", help="no per-label log lines")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    if args.warmup % args.sample_every:
+        parser.error("--warmup must be a multiple of --sample-every")
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    return 1 if result["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 // Global variables
 let currentStep = 0;
 let currentPrintedBarcode = '';
-let scanCheckInterval = null;
+let scanCheckController = null;
 let deviceValidationEnabled = true;
 let physicalPrintEnabled = true;
 let deviceSerial = '';
@@ -58,6 +58,22 @@ function checkModelMatch(deviceSerial) {
     return serialPrefix === selectedModel;
 }
 
+// Label preview (rendered on the server, never printed)
+function showLabelPreview(serial) {
+    const box = document.getElementById('labelPreviewBox');
+    if (!serial || serial === 'Error') {
+        box.style.display = 'none';
+        return;
+    }
+    document.getElementById('labelPreview').src = `/label_preview?serial=${encodeURIComponent(serial)}`;
+    box.style.display = 'block';
+}
+
+function hideLabelPreview() {
+    document.getElementById('labelPreviewBox').style.display = 'none';
+    document.getElementById('labelPreview').removeAttribute('src');
+}
+
 // Scroll functions
 function scrollToElement(elementId, offset = 0) {
     const element = document.getElementById(elementId);
@@ -344,6 +360,7 @@ async function autoValidateDevice(deviceData) {
     
     // Show device status information box
     document.getElementById('deviceStatusBox').style.display = 'block';
+    showLabelPreview(deviceData.serial);
     
     // Update status display with device data
     document.getElementById('serialValue').textContent = deviceData.serial || 'Error';
@@ -533,20 +550,31 @@ function updateStepState(stepId, state) {
     }
 }
 
+// Scan confirmation: long poll - the server answers as soon as the scan
+// is pushed to it (/hooks/scanned), or after SCAN_WAIT_SECONDS
+const SCAN_WAIT_SECONDS = 20;
+let scanCheckGeneration = 0;
+
 function startScanChecking() {
-    stopScanChecking(); // Clear any existing interval
-    
-    scanCheckInterval = setInterval(async () => {
-        if (!currentPrintedBarcode) return;
-        
+    stopScanChecking(); // Cancel any running wait
+    const generation = ++scanCheckGeneration;
+    scanCheckController = new AbortController();
+    waitForScan(generation, scanCheckController.signal);
+}
+
+async function waitForScan(generation, signal) {
+    while (generation === scanCheckGeneration && currentPrintedBarcode) {
+        const started = Date.now();
         try {
             const response = await fetch('/check_scan_status', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ barcode: currentPrintedBarcode })
+                body: JSON.stringify({ barcode: currentPrintedBarcode, wait: SCAN_WAIT_SECONDS }),
+                signal: signal
             });
             
             const result = await response.json();
+            if (generation !== scanCheckGeneration) return;
             
             if (result.success && result.scanned && result.status === 'ready') {
                 document.getElementById('scanBarcode').innerHTML = `
@@ -555,17 +583,17 @@ function startScanChecking() {
                     <small>Статус: ${result.status}</small>
                 `;
                 stopScanChecking();
-                
+            
                 // Complete step 4 
                 updateStepState('step4', 'completed');
                 document.querySelector('#step4 .step-description').textContent = 'Этикетка отсканирована, процесс завершен';
-                
+            
                 showStatus('✅ Процесс обработки устройства завершен успешно!', 'success');
                 loadScannedItems(); // Refresh scanned items
-                
+            
                 // Remember this device as processed
                 lastProcessedSerial = deviceSerial;
-                
+            
                 // Auto reset based on mode
                 if (autoModeEnabled) {
                     // In auto mode, reset after 3 seconds and continue checking for new devices
@@ -584,16 +612,24 @@ function startScanChecking() {
                     }, 5000);
                 }
             }
+            if (!result.success || Date.now() - started < 1000) {
+                // Server-side error, or the server answered without waiting
+                // (e.g. a non-ready scan): back off before the next wait
+                await new Promise(resolve => setTimeout(resolve, 2000));
+            }
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error('Error checking scan status:', error);
+            await new Promise(resolve => setTimeout(resolve, 2000));
         }
-    }, 2000); // Check every 2 seconds
+    }
 }
 
 function stopScanChecking() {
-    if (scanCheckInterval) {
-        clearInterval(scanCheckInterval);
-        scanCheckInterval = null;
+    scanCheckGeneration++;
+    if (scanCheckController) {
+        scanCheckController.abort();
+        scanCheckController = null;
     }
 }
 
@@ -632,6 +668,7 @@ function resetProcess() {
     // Hide elements
     document.getElementById('deviceStatusBox').style.display = 'none';
     document.getElementById('scanContent').style.display = 'none';
+    hideLabelPreview();
     
     // Reset status values
     document.getElementById('serialValue').textContent = '-';
@@ -698,6 +735,7 @@ async function connectDevice() {
             
             // Show device status information
             document.getElementById('deviceStatusBox').style.display = 'block';
+            showLabelPreview(result.serial);
             
             // Update device status display
             document.getElementById('serialValue').textContent = result.serial || 'Error';
@@ -871,122 +909,287 @@ async function checkScanStatus() {
     }
 }
 
+// Production statistics are aggregated on the server; only changes since
+// statsVersion are transferred and merged here
+let statsVersion = 0;
+let statsCounters = {};
+
+// Scanned items keyed by barcode, newest first (by seq). Only the rows in
+// view are in the DOM; older items are paged from /scanned_history on scroll
+const scannedItemsByBarcode = new Map();
+let scannedOrder = []; // barcodes, newest first
+let historyCursor = null; // seq to page older items from, null - all loaded
+let historyLoading = false;
+const renderedRows = new Map(); // barcode -> row element
+const SCANNED_ITEMS_MAX = 5000;
+const ITEM_ROW_HEIGHT = 68; // .scanned-item height + gap, see styles.css
+const ITEM_ROWS_OVERSCAN = 5;
+let scannedRenderPending = false;
+
+function localDateKey(date) {
+    const pad = n => String(n).padStart(2, '0');
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+}
+
+function renderProductionStats() {
+    const statsContainer = document.getElementById('scanStats');
+    const statsBlock = document.getElementById('statsBlock');
+    if (!statsContainer || !statsBlock) return;
+
+    const today = localDateKey(new Date());
+    const todayCount = statsCounters[`day|${today}`] || 0;
+    const todayByModel = {};
+    const prefix = `model|${today}|`;
+    Object.keys(statsCounters).forEach(key => {
+        if (key.startsWith(prefix)) {
+            todayByModel[key.substring(prefix.length)] = statsCounters[key];
+        }
+    });
+
+    // Day rollover changes the key too; unchanged numbers leave the DOM alone
+    const sortedTodayModels = Object.keys(todayByModel).sort();
+    const signature = JSON.stringify([today, todayCount, sortedTodayModels.map(m => [m, todayByModel[m]])]);
+    if (renderProductionStats.signature === signature) return;
+    renderProductionStats.signature = signature;
+
+    // Build statistics HTML - only today
+    let statsHTML = '<div style="margin-top: 12px;">';
+    
+    statsHTML += '<div style="background: rgba(0, 212, 255, 0.1); border: 1px solid rgba(0, 212, 255, 0.25); border-radius: 12px; padding: 16px;">';
+    statsHTML += '<div style="font-weight: bold; font-size: 16px; margin-bottom: 12px; color: #00d4ff;">🗓️ Сегодня изготовлено:</div>';
+    
+    if (todayCount > 0) {
+        statsHTML += `<div style="display: flex; justify-content: space-between; padding: 10px; background: rgba(255, 215, 0, 0.15); border-radius: 8px; margin-bottom: 8px; font-weight: bold; font-size: 18px;">
+            <span>Всего:</span><span style="color: #ffd700;">${todayCount}</span>
+        </div>`;
+        
+        sortedTodayModels.forEach(model => {
+            const count = todayByModel[model];
+            statsHTML += `<div style="display: flex; justify-content: space-between; padding: 8px 10px; background: rgba(255, 255, 255, 0.05); border-radius: 8px; margin-bottom: 5px;">
+                <span>${model}:</span><span style="color: #00d4ff; font-weight: bold;">${count}</span>
+            </div>`;
+        });
+    } else {
+        statsHTML += '<div style="text-align: center; color: #8899aa;">Нет записей за сегодня</div>';
+    }
+    statsHTML += '</div>';
+    statsHTML += '</div>';
+    
+    statsContainer.innerHTML = statsHTML;
+    statsBlock.style.display = 'flex';
+}
+
+function formatScanTime(timestamp) {
+    if (!timestamp) return 'Unknown';
+    try {
+        // get local time from UTC ISO string
+        const date = new Date(timestamp + 'Z'); // Append 'Z' to indicate UTC
+        if (!isNaN(date.getTime())) {
+            return date.toLocaleString('ru-RU', {
+                day: '2-digit',
+                month: '2-digit',
+                year: 'numeric',
+                hour: '2-digit',
+                minute: '2-digit'
+            });
+        }
+    } catch (e) {
+        console.error('Error parsing timestamp:', e);
+    }
+    return 'Unknown';
+}
+
+function clearScannedItems() {
+    scannedItemsByBarcode.clear();
+    scannedOrder = [];
+    renderedRows.forEach(row => row.remove());
+    renderedRows.clear();
+}
+
+// Merge items (delta, snapshot or history page) by barcode: known items are
+// patched in place, new ones are prepended or appended by seq
+function mergeScannedItems(items) {
+    const added = [];
+    items.forEach(item => {
+        const known = scannedItemsByBarcode.get(item.barcode);
+        if (known && known.seq === item.seq) {
+            known.status = item.status;
+            return;
+        }
+        if (known) {
+            // Scanned again on another day: moves to its new place
+            scannedOrder = scannedOrder.filter(barcode => barcode !== item.barcode);
+        }
+        scannedItemsByBarcode.set(item.barcode, item);
+        added.push(item);
+    });
+    if (added.length === 0) return 0;
+
+    added.sort((a, b) => b.seq - a.seq);
+    const newest = scannedOrder.length ? scannedItemsByBarcode.get(scannedOrder[0]).seq : 0;
+    const oldest = scannedOrder.length ? scannedItemsByBarcode.get(scannedOrder[scannedOrder.length - 1]).seq : Infinity;
+    const barcodes = added.map(item => item.barcode);
+    let prepended = 0;
+    if (added[added.length - 1].seq > newest) {
+        scannedOrder = barcodes.concat(scannedOrder);
+        prepended = barcodes.length;
+    } else if (added[0].seq < oldest) {
+        scannedOrder = scannedOrder.concat(barcodes);
+    } else {
+        scannedOrder = scannedOrder.concat(barcodes)
+            .sort((a, b) => scannedItemsByBarcode.get(b).seq - scannedItemsByBarcode.get(a).seq);
+    }
+
+    if (scannedOrder.length > SCANNED_ITEMS_MAX) {
+        // Oldest rows go; scrolling down pages them in again
+        scannedOrder.splice(SCANNED_ITEMS_MAX).forEach(barcode => scannedItemsByBarcode.delete(barcode));
+        historyCursor = scannedItemsByBarcode.get(scannedOrder[scannedOrder.length - 1]).seq;
+    }
+    return prepended;
+}
+
+function scheduleScannedRender() {
+    if (scannedRenderPending) return;
+    scannedRenderPending = true;
+    requestAnimationFrame(() => {
+        scannedRenderPending = false;
+        renderScannedItems();
+    });
+}
+
+function createItemRow() {
+    const row = document.createElement('div');
+    row.className = 'scanned-item';
+    row.innerHTML = `
+        <div style="display: flex; align-items: center; gap: 12px;">
+            <div class="item-number" style="min-width: 30px; height: 30px; background: rgba(0, 212, 255, 0.2); border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; color: #00d4ff; font-size: 14px;"></div>
+            <div>
+                <div class="barcode-text"></div>
+                <div class="timestamp"></div>
+            </div>
+        </div>
+        <div class="status-badge"></div>
+    `;
+    return row;
+}
+
+// Touch only what changed: position, number, status
+function updateItemRow(row, item, index) {
+    if (row.dataset.index !== String(index)) {
+        row.dataset.index = index;
+        row.style.transform = `translateY(${index * ITEM_ROW_HEIGHT}px)`;
+        row.querySelector('.item-number').textContent = index + 1;
+    }
+    if (row.dataset.barcode !== item.barcode) {
+        row.dataset.barcode = item.barcode;
+        row.querySelector('.barcode-text').textContent = item.barcode;
+        row.querySelector('.timestamp').textContent = formatScanTime(item.timestamp);
+    }
+    if (row.dataset.status !== item.status) {
+        row.dataset.status = item.status;
+        const badge = row.querySelector('.status-badge');
+        badge.className = `status-badge status-${item.status}`;
+        badge.textContent = item.status.toUpperCase();
+    }
+}
+
+function renderScannedItems() {
+    const itemsList = document.getElementById('itemsList');
+    const scannedItems = document.getElementById('scannedItems');
+
+    if (scannedOrder.length === 0) {
+        scannedItems.style.display = 'none';
+        return;
+    }
+    scannedItems.style.display = 'block';
+
+    let spacer = itemsList.firstElementChild;
+    if (!spacer) {
+        spacer = document.createElement('div');
+        spacer.className = 'items-spacer';
+        itemsList.appendChild(spacer);
+        itemsList.addEventListener('scroll', scheduleScannedRender, { passive: true });
+    }
+    spacer.style.height = `${scannedOrder.length * ITEM_ROW_HEIGHT}px`;
+
+    const first = Math.max(0, Math.floor(itemsList.scrollTop / ITEM_ROW_HEIGHT) - ITEM_ROWS_OVERSCAN);
+    const last = Math.min(
+        scannedOrder.length,
+        Math.ceil((itemsList.scrollTop + itemsList.clientHeight) / ITEM_ROW_HEIGHT) + ITEM_ROWS_OVERSCAN
+    );
+    const visible = new Set(scannedOrder.slice(first, last));
+
+    // Rows scrolled out of view are reused for the ones scrolled in
+    const spare = [];
+    renderedRows.forEach((row, barcode) => {
+        if (!visible.has(barcode)) {
+            renderedRows.delete(barcode);
+            spare.push(row);
+        }
+    });
+    for (let index = first; index < last; index++) {
+        const item = scannedItemsByBarcode.get(scannedOrder[index]);
+        let row = renderedRows.get(item.barcode);
+        if (!row) {
+            row = spare.pop() || spacer.appendChild(createItemRow());
+            renderedRows.set(item.barcode, row);
+        }
+        updateItemRow(row, item, index);
+    }
+    spare.forEach(row => row.remove());
+
+    if (historyCursor !== null && last >= scannedOrder.length - ITEM_ROWS_OVERSCAN) {
+        loadScannedHistory();
+    }
+}
+
+async function loadScannedHistory() {
+    if (historyLoading || historyCursor === null) return;
+    historyLoading = true;
+    const cursor = historyCursor;
+    try {
+        const response = await fetch(`/scanned_history?before=${cursor}&limit=100`);
+        const result = await response.json();
+        // A snapshot reset meanwhile has its own cursor
+        if (result.success && historyCursor === cursor) {
+            mergeScannedItems(result.items);
+            historyCursor = result.next;
+            scheduleScannedRender();
+        }
+    } catch (error) {
+        console.error('Error loading scanned history:', error);
+    } finally {
+        historyLoading = false;
+    }
+}
+
 async function loadScannedItems() {
     try {
-        const response = await fetch('/get_scanned_items');
+        const response = await fetch(`/get_production_stats?since=${statsVersion}`);
         const result = await response.json();
-        
-        if (result.success && result.items.length > 0) {
+        if (!result.success) return;
+
+        if (result.reset) {
+            statsCounters = {};
+            clearScannedItems();
+            historyCursor = result.history;
+        }
+        Object.assign(statsCounters, result.counters);
+        statsVersion = result.version;
+
+        if (result.items.length > 0) {
+            const prepended = mergeScannedItems(result.items);
+            // Keep the rows the operator is looking at in place
             const itemsList = document.getElementById('itemsList');
-            const scannedItems = document.getElementById('scannedItems');
-            const statsContainer = document.getElementById('scanStats');
-            const statsBlock = document.getElementById('statsBlock');
-            
-            // Calculate statistics
-            const now = new Date();
-            const todayStart = new Date(now.getFullYear(), now.getMonth(), now.getDate());
-            
-            let todayCount = 0;
-            let todayByModel = {};
-            
-            result.items.forEach(item => {
-                // Extract model from barcode (e.g., "RC-102" from "RC-102-012385")
-                const model = item.barcode.substring(0, item.barcode.lastIndexOf('-'));
-                
-                // Check if item is from today
-                if (item.timestamp) {
-                    try {
-                        const itemDate = new Date(item.timestamp + 'Z');
-                        if (itemDate >= todayStart) {
-                            todayCount++;
-                            
-                            if (!todayByModel[model]) {
-                                todayByModel[model] = 0;
-                            }
-                            todayByModel[model]++;
-                        }
-                    } catch (e) {
-                        console.error('Error parsing timestamp:', e);
-                    }
-                }
-            });
-            
-            // Build statistics HTML - only today
-            let statsHTML = '<div style="margin-top: 12px;">';
-            
-            statsHTML += '<div style="background: rgba(0, 212, 255, 0.1); border: 1px solid rgba(0, 212, 255, 0.25); border-radius: 12px; padding: 16px;">';
-            statsHTML += '<div style="font-weight: bold; font-size: 16px; margin-bottom: 12px; color: #00d4ff;">🗓️ Сегодня изготовлено:</div>';
-            
-            if (todayCount > 0) {
-                statsHTML += `<div style="display: flex; justify-content: space-between; padding: 10px; background: rgba(255, 215, 0, 0.15); border-radius: 8px; margin-bottom: 8px; font-weight: bold; font-size: 18px;">
-                    <span>Всего:</span><span style="color: #ffd700;">${todayCount}</span>
-                </div>`;
-                
-                const sortedTodayModels = Object.keys(todayByModel).sort();
-                sortedTodayModels.forEach(model => {
-                    const count = todayByModel[model];
-                    statsHTML += `<div style="display: flex; justify-content: space-between; padding: 8px 10px; background: rgba(255, 255, 255, 0.05); border-radius: 8px; margin-bottom: 5px;">
-                        <span>${model}:</span><span style="color: #00d4ff; font-weight: bold;">${count}</span>
-                    </div>`;
-                });
-            } else {
-                statsHTML += '<div style="text-align: center; color: #8899aa;">Нет записей за сегодня</div>';
-            }
-            statsHTML += '</div>';
-            statsHTML += '</div>';
-            
-            // Display statistics
-            if (statsContainer && statsBlock) {
-                statsContainer.innerHTML = statsHTML;
-                statsBlock.style.display = 'flex';
-            }
-            
-            // Build numbered items list
-            itemsList.innerHTML = result.items.map((item, index) => {
-                let localTime = 'Unknown';
-                
-                if (item.timestamp) {
-                    try {
-                        // get local time from UTC ISO string
-                        const date = new Date(item.timestamp + 'Z'); // Append 'Z' to indicate UTC
-                        if (!isNaN(date.getTime())) {
-                            localTime = date.toLocaleString('ru-RU', {
-                                day: '2-digit',
-                                month: '2-digit',
-                                year: 'numeric',
-                                hour: '2-digit',
-                                minute: '2-digit'
-                            });
-                        }
-                    } catch (e) {
-                        console.error('Error parsing timestamp:', e);
-                    }
-                }
-                
-                return `
-                    <div class="scanned-item">
-                        <div style="display: flex; align-items: center; gap: 12px;">
-                            <div style="min-width: 30px; height: 30px; background: rgba(0, 212, 255, 0.2); border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; color: #00d4ff; font-size: 14px;">
-                                ${index + 1}
-                            </div>
-                            <div>
-                                <div class="barcode-text">${item.barcode}</div>
-                                <div class="timestamp">${localTime}</div>
-                            </div>
-                        </div>
-                        <div class="status-badge status-${item.status}">${item.status.toUpperCase()}</div>
-                    </div>
-                `;
-            }).join('');
-            
-            scannedItems.style.display = 'block';
-        } else {
-            document.getElementById('scannedItems').style.display = 'none';
-            const statsBlock = document.getElementById('statsBlock');
-            if (statsBlock) {
-                statsBlock.style.display = 'none';
+            if (prepended && itemsList.scrollTop > 0) {
+                itemsList.scrollTop += prepended * ITEM_ROW_HEIGHT;
             }
         }
+
+        renderProductionStats();
+        if (result.reset || result.items.length > 0) {
+            scheduleScannedRender();
+        }
     } catch (error) {
         console.error('Error loading scanned items:', error);
     }
@@ -1005,5 +1208,5 @@ function showStatus(message, type) {
     }
 }
 
-// Auto-refresh scanned items every 5 minutes
-setInterval(loadScannedItems, 300000); // 300,000 ms = 5 minutes
\ No newline at end of file
+// Refresh scanned items every 15 seconds (only the delta is transferred)
+setInterval(loadScannedItems, 15000);
\ No newline at end of file
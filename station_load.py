@@ -0,0 +1,497 @@
+# End-to-end station load generator for the label printer server
+# -*- coding: utf-8 -*-
+"""Drive main.py the way static/script.js does, from many simulated stations.
+
+Per unit every station runs: /device_status until READY, /print_label,
+/check_scan_status until the label is scanned, /get_production_stats.
+
+Stand-ins replace everything outside the server:
+  webhook API  - local HTTP server, printed labels are "scanned" after --scan-delay
+                 and pushed to /hooks/scanned (--scan-mode push) or only found
+                 by the server's reconciliation poll (--scan-mode poll)
+  InvenTree    - same server, /api/stock/ always empty
+  RCDevices    - one SimulatedBackend per station (in-process mode)
+  printer      - TSPL printer emulator, --print-ms per label
+
+In-process mode (default) imports main and uses Flask's test client.
+HTTP mode targets a running server started with RCDEVICES_BACKEND=simulator
+and WEBHOOK_API_BASE pointing at this script's webhook stand-in
+(--webhook-port); physical printing is switched off there via /toggle_print.
+All stations then share the server's simulated device and its serial, so
+HTTP mode measures request handling rather than realistic unit cycles.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hardware import DeviceBackend, SimulatedBackend
+from tspl_printer import PrinterEmulator
+
+MODELS = ("RC-102", "RC-103", "RC-103G", "RC-110", "RC-410")
+
+
+class FakeWebhookServer:
+    """Webhook API and InvenTree stand-in on a local port"""
+
+    def __init__(self, port=0, push=None):
+        self.push = push  # push(device) - deliver scans to the station server
+        self.pushed = 0
+        self._lock = threading.Lock()
+        self._pending = []  # (due, device)
+        self._scanned = []  # newest last
+        self.requests = 0
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/hooks/get-devices":
+                    devices = owner.recent(params.get("limit", 10), params.get("minutes", 1))
+                    self._reply({"success": True, "devices": devices})
+                else:
+                    self._reply({"success": False, "message": "not found"}, 404)
+
+            def do_GET(self):
+                if self.path.startswith("/api/stock/"):
+                    self._reply({"count": 0, "results": []})
+                else:
+                    self._reply({"success": False, "message": "not found"}, 404)
+
+            def do_DELETE(self):
+                self._reply({}, 204)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="FakeWebhook", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def schedule_scan(self, barcode, delay, scanner_id):
+        """The operator scans the printed label after `delay` seconds. Returns the due time"""
+        due = time.monotonic() + delay
+        with self._lock:
+            self._pending.append((due, barcode, scanner_id))
+        if self.push is not None:
+            threading.Timer(delay, self._deliver).start()
+        return due
+
+    def _deliver(self):
+        """Push due scans to the server, as the real webhook service does"""
+        for device in self._take_due():
+            try:
+                self.push(device)
+                with self._lock:
+                    self.pushed += 1
+            except Exception:
+                pass  # lost push: left to the reconciliation poll
+
+    def _take_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [p for p in self._pending if p[0] <= now]
+            if not due:
+                return []
+            self._pending = [p for p in self._pending if p[0] > now]
+            devices = []
+            for _due, barcode, scanner_id in due:
+                device = {
+                    "barcode": barcode,
+                    "status": "ready",
+                    "manufacturing_date": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+                    "scanner_id": scanner_id,
+                }
+                self._scanned.append((time.time(), device))
+                devices.append(device)
+            return devices
+
+    def recent(self, limit, minutes):
+        self._take_due()
+        with self._lock:
+            self.requests += 1
+            horizon = time.time() - minutes * 60
+            result = []
+            for stamp, device in reversed(self._scanned):
+                if stamp < horizon or len(result) >= limit:
+                    break
+                result.append(dict(device, age_minutes=int((time.time() - stamp) / 60)))
+            return result
+
+
+class StationBackends(DeviceBackend):
+    """Routes device calls to the simulator of the station running in this thread"""
+
+    mode = "Simulator (stations)"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def bind(self, backend):
+        self._local.backend = backend
+
+    def get_device_list(self):
+        return self._local.backend.get_device_list()
+
+    def get_device_mcu_id(self, handle):
+        return self._local.backend.get_device_mcu_id(handle)
+
+    def get_device_serial(self, handle):
+        return self._local.backend.get_device_serial(handle)
+
+    def get_device_database_info(self, handle):
+        return self._local.backend.get_device_database_info(handle)
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json(silent=True)
+
+    def post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url, timeout=30):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get(self, path):
+        response = self.session.get(self.base_url + path, timeout=self.timeout)
+        return response.status_code, _json(response)
+
+    def post(self, path, payload):
+        response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        return response.status_code, _json(response)
+
+
+def _json(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+class Metrics:
+    """Latencies and errors per endpoint, completed units"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.units = 0
+        self.failed_units = 0
+        self.confirmations = []  # scan -> confirmation seen by the station, s
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def unit(self, ok):
+        with self._lock:
+            if ok:
+                self.units += 1
+            else:
+                self.failed_units += 1
+
+    def scan_confirmed(self, seconds):
+        with self._lock:
+            self.confirmations.append(seconds)
+
+    def report(self, elapsed):
+        endpoints = {}
+        total = 0
+        confirmations = sorted(self.confirmations)
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "error_rate": round(self.errors.get(endpoint, 0) / len(values), 4),
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "units": self.units,
+            "failed_units": self.failed_units,
+            "units_per_hour": round(self.units / elapsed * 3600, 1),
+            "requests": total,
+            "rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+            "scan_confirmation_ms": {
+                f"p{p}": round(percentile(confirmations, p) * 1000, 2) for p in (50, 95, 99)
+            } if confirmations else {},
+        }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Station:
+    """One operator station repeating the script.js device workflow"""
+
+    def __init__(self, index, client, webhook, metrics, args, backend=None, routing=None):
+        self.index = index
+        self.name = f"station-{index:02d}"
+        self.client = client
+        self.webhook = webhook
+        self.metrics = metrics
+        self.args = args
+        self.backend = backend
+        self.routing = routing
+        self.stats_version = 0
+        self._random = random.Random(args.seed + index if args.seed is not None else None)
+        self._number = index * 100000
+
+    def _call(self, endpoint, method, path, payload=None, check=lambda body: body.get("success")):
+        started = time.perf_counter()
+        try:
+            if method == "GET":
+                status, body = self.client.get(path)
+            else:
+                status, body = self.client.post(path, payload)
+            ok = status == 200 and body is not None and bool(check(body))
+        except Exception:
+            body, ok = None, False
+        self.metrics.record(endpoint, time.perf_counter() - started, ok)
+        return body if ok else None
+
+    def next_device(self):
+        """Operator connects the next unit"""
+        if self.backend is None:
+            return
+        self.backend.unplug()
+        self._number += 1
+        self.backend.plug(f"{self._random.choice(MODELS)}-{self._number:06d}")
+
+    def run_unit(self, deadline):
+        """True - unit labeled and scanned, False - failed, None - cut off by the deadline"""
+        args = self.args
+        # 1. Wait for a READY device (the UI polls /device_status)
+        serial = None
+        while time.monotonic() < deadline:
+            body = self._call("device_status", "GET", "/device_status")
+            if body and body.get("device_ready"):
+                serial = body["serial"]
+                break
+            if body:
+                return False  # NOT READY: the operator puts the unit aside
+            time.sleep(args.poll_interval)
+        if serial is None:
+            return None  # cut off by the deadline
+
+        # 2. Print
+        if not self._call("print_label", "POST", "/print_label", {"serial_number": serial}):
+            return False
+        due = self.webhook.schedule_scan(serial, args.scan_delay, self.name)
+
+        # 3. Wait for the scan confirmation (long poll, as script.js does)
+        scanned = False
+        while time.monotonic() < deadline:
+            wait = max(0.0, min(args.scan_wait, deadline - time.monotonic()))
+            body = self._call("check_scan_status", "POST", "/check_scan_status", {"barcode": serial, "wait": wait})
+            if body and body.get("scanned"):
+                scanned = True
+                break
+            if not wait:
+                time.sleep(args.poll_interval)
+        if not scanned:
+            return None
+        # Scan to confirmation seen by the station
+        self.metrics.scan_confirmed(max(0.0, time.monotonic() - due))
+
+        # 4. Refresh the scanned items panel
+        body = self._call("get_production_stats", "GET", f"/get_production_stats?since={self.stats_version}")
+        if body:
+            self.stats_version = body.get("version", 0)
+        return True
+
+    def run(self, deadline, units):
+        if self.routing is not None:
+            self.routing.bind(self.backend)
+        done = 0
+        while time.monotonic() < deadline and (units is None or done < units):
+            result = self.run_unit(deadline)
+            if result is not None:
+                self.metrics.unit(result)
+            done += 1
+            self.next_device()
+            time.sleep(self.args.think_time)
+
+
+def setup_in_process(args, webhook):
+    """Import main with all external dependencies replaced by stand-ins"""
+    os.environ.setdefault("RCDEVICES_BACKEND", "simulator")
+    import main
+
+    main.config.WEBHOOK_API_BASE = webhook.url
+    if args.scan_mode == "poll":
+        # No pushes: scans are only found by the reconciliation poll
+        main.scan_reconciler.interval = args.reconcile_interval
+        main.scan_reconciler.start()
+    else:
+        client = InProcessClient(main.app)
+        webhook.push = lambda device: client.post("/hooks/scanned", device)
+    main.INVENTREE_URL = webhook.url
+    main.config.PHYSICAL_PRINT_ENABLED = True
+
+    # Raw TSPL path against the local printer emulator
+    emulator = PrinterEmulator(print_time=args.print_ms / 1000.0).start()
+    main.printer.print_backend = "tspl"
+    main.printer.tspl.host, main.printer.tspl.port = emulator.host, emulator.port
+    routing = StationBackends()
+    main.rc_client.backend = routing
+    if args.stats_poller:
+        main.stats_poller.interval = args.stats_interval
+        main.stats_poller.start()
+    return main.app, routing
+
+
+def run(args):
+    webhook = FakeWebhookServer(args.webhook_port).start()
+    metrics = Metrics()
+    stations = []
+    if args.url:
+        if args.scan_mode == "push":
+            pusher = HttpClient(args.url)
+            webhook.push = lambda device: pusher.post("/hooks/scanned", device)
+        print(f"Webhook stand-in: {webhook.url} (set WEBHOOK_API_BASE of the server to it)", file=sys.stderr)
+        # No real printer behind a remote server: switch it to simulated printing
+        control = HttpClient(args.url)
+        _status, config = control.get("/get_config_status")
+        if config and config.get("print_enabled"):
+            control.post("/toggle_print", {})
+            print("Physical printing switched off on the server", file=sys.stderr)
+        for i in range(args.stations):
+            stations.append(Station(i, HttpClient(args.url), webhook, metrics, args))
+    else:
+        app, routing = setup_in_process(args, webhook)
+        for i in range(args.stations):
+            backend = SimulatedBackend(
+                device_count=0,
+                latency_ms=args.dll_latency_ms,
+                failure_rate=args.failure_rate,
+                not_ready_rate=args.not_ready_rate,
+                seed=None if args.seed is None else args.seed + i,
+            )
+            station = Station(i, InProcessClient(app), webhook, metrics, args, backend, routing)
+            station.next_device()
+            stations.append(station)
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=s.run, args=(deadline, args.units), name=s.name, daemon=True)
+        for s in stations
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    webhook.stop()
+
+    report = metrics.report(elapsed)
+    report["stations"] = args.stations
+    report["webhook_requests"] = webhook.requests
+    report["scans_pushed"] = webhook.pushed
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['stations']} stations, {report['elapsed_s']} s: {report['units']} units "
+        f"({report['failed_units']} failed), {report['units_per_hour']} units/h, {report['rps']} req/s"
+    )
+    print(f"{'endpoint':<24}{'req':>8}{'err%':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, s in report["endpoints"].items():
+        print(
+            f"{endpoint:<24}{s['requests']:>8}{s['error_rate'] * 100:>8.2f}{s['rps']:>9.2f}"
+            f"{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}"
+        )
+    confirmation = report["scan_confirmation_ms"]
+    if confirmation:
+        print(
+            f"scan confirmation: p50 {confirmation['p50']} ms, p95 {confirmation['p95']} ms, "
+            f"p99 {confirmation['p99']} ms; webhook API queries: {report['webhook_requests']}, "
+            f"scans pushed: {report['scans_pushed']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Station load test for the label printer server")
+    parser.add_argument("--stations", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--units", type=int, help="units per station (default: until --duration)")
+    parser.add_argument("--url", help="server URL for HTTP mode (default: in-process)")
+    parser.add_argument("--webhook-port", type=int, default=0)
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="UI polling interval, s (script.js: 2)")
+    parser.add_argument("--scan-delay", type=float, default=0.5, help="print to scan, s")
+    parser.add_argument("--scan-mode", choices=("push", "poll"), default="push",
+                        help="scans pushed to /hooks/scanned or only found by reconciliation")
+    parser.add_argument("--scan-wait", type=float, default=20.0, help="/check_scan_status long poll, s")
+    parser.add_argument("--reconcile-interval", type=float, default=1.0, help="poll mode reconciliation, s")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between units, s")
+    parser.add_argument("--print-ms", type=float, default=50.0, help="printer stand-in job time")
+    parser.add_argument("--dll-latency-ms", type=float, default=2.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="device call failure probability")
+    parser.add_argument("--not-ready-rate", type=float, default=0.0)
+    parser.add_argument("--stats-poller", action="store_true", help="run the statistics poller too")
+    parser.add_argument("--stats-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if report["failed_units"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
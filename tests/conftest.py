@@ -0,0 +1,42 @@
+# Tests import the flat root-level modules
+import os
+import sys
+
+import pytest
+import toml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def write_label_config(tmp_path):
+    """conf.toml of the repo with every file LabelPrinter writes under tmp_path"""
+    with open(os.path.join(ROOT, "conf.toml"), encoding="utf-8") as f:
+        config = toml.load(f)
+    config["general"]["temp_filename"] = str(tmp_path / "temp_label.pdf")
+    config["logging"].update(console=False, file="")
+    config["cache"]["directory"] = str(tmp_path / "label_cache")
+    config["archive"].update(directory=str(tmp_path / "archive"), fsync=False)
+    path = tmp_path / "conf.toml"
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return str(path)
+
+
+@pytest.fixture
+def label_config(tmp_path):
+    return write_label_config(tmp_path)
+
+
+@pytest.fixture(scope="session")
+def decode_datamatrix():
+    """decode(PIL image) -> list of strings: pylibdmtx if present, else zxing-cpp"""
+    from datamatrix import LIBDMTX_AVAILABLE
+
+    if LIBDMTX_AVAILABLE:
+        from pylibdmtx import pylibdmtx
+
+        return lambda image: [result.data.decode("utf-8") for result in pylibdmtx.decode(image)]
+    zxingcpp = pytest.importorskip("zxingcpp", reason="no Data Matrix decoder (pylibdmtx or zxing-cpp)")
+    return lambda image: [result.text for result in zxingcpp.read_barcodes(image)]
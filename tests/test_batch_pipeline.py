@@ -0,0 +1,63 @@
+# BatchPipeline: ordering, sync only after a printed label, stage failures reported
+# -*- coding: utf-8 -*-
+import threading
+
+from batch_pipeline import BatchPipeline
+
+SERIALS = [f"RC-110-{n:06d}" for n in range(8)]
+
+
+def _render(serial):
+    return None if serial.endswith("3") else serial.encode()
+
+
+def test_prints_in_order_and_syncs_printed_labels_only():
+    printed, synced = [], []
+    lock = threading.Lock()
+
+    def spool(serial, data):
+        if serial.endswith("5"):
+            raise RuntimeError("paper out")
+        printed.append(serial)
+        return True
+
+    def sync(serial):
+        with lock:
+            assert serial in printed
+            synced.append(serial)
+
+    pipeline = BatchPipeline(_render, spool, sync, render_ahead=2, sync_workers=3)
+    report = pipeline.run(SERIALS)
+
+    failed = {"RC-110-000003", "RC-110-000005"}
+    assert printed == [s for s in SERIALS if s not in failed]
+    assert sorted(synced) == printed
+    assert report["printed"] == 6 and report["failed"] == 2
+    assert not report["running"]
+    for result in pipeline.results:
+        assert result["synced"] is (result["serial"] not in failed)
+    assert pipeline.results[3]["error"] == "label render failed"
+    assert pipeline.results[5]["error"] == "paper out"
+
+
+def test_sync_failures_are_reported():
+    def sync(serial):
+        if serial.endswith(("1", "2")):
+            raise OSError("InvenTree unreachable")
+
+    pipeline = BatchPipeline(lambda serial: b"x", lambda serial, data: True, sync)
+    report = pipeline.run(SERIALS)
+
+    assert report["printed"] == len(SERIALS)
+    assert report["stages"]["sync"]["items"] == len(SERIALS)
+    assert report["stages"]["sync"]["failed"] == 2
+    assert [r["synced"] for r in pipeline.results].count(False) == 2
+
+
+def test_no_sync_stage():
+    results = []
+    pipeline = BatchPipeline(lambda serial: b"x", lambda serial, data: True, on_result=results.append)
+    report = pipeline.run(SERIALS)
+    assert "sync" not in report["stages"]
+    assert [r["serial"] for r in results] == SERIALS
+    assert all(r["synced"] is False for r in results)
@@ -0,0 +1,47 @@
+# Data Matrix round trip: encode with each backend, decode with a reference decoder
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from PIL import Image
+
+from datamatrix import LIBDMTX_AVAILABLE, DataMatrixEncoder
+from layout import MODEL_TEXTS
+
+SERIALS = [f"{model}-{number:06d}" for model in MODEL_TEXTS for number in (0, 123456, 999999)]
+BACKENDS = [
+    "python",
+    pytest.param(
+        "libdmtx", marks=pytest.mark.skipif(not LIBDMTX_AVAILABLE, reason="libdmtx not available")
+    ),
+]
+
+
+def _image(bitmap):
+    # white border: the decoders need a quiet zone around the symbol
+    return Image.fromarray(np.pad(np.where(bitmap, 0, 255).astype(np.uint8), 20, constant_values=255))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("serial", SERIALS)
+def test_round_trip(backend, serial, decode_datamatrix):
+    bitmap = DataMatrixEncoder(backend).render(serial, 200)
+    assert decode_datamatrix(_image(bitmap)) == [serial]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_batch_matches_single(backend, decode_datamatrix):
+    encoder = DataMatrixEncoder(backend)
+    bitmaps = encoder.render_batch(SERIALS, 150)
+    for serial, bitmap in zip(SERIALS, bitmaps):
+        assert np.array_equal(bitmap, encoder.render(serial, 150))
+        assert decode_datamatrix(_image(bitmap)) == [serial]
+
+
+def test_non_integer_scale_decodes(decode_datamatrix):
+    # size not a multiple of the module count: uneven nearest-neighbour expansion
+    encoder = DataMatrixEncoder("python")
+    serial = "RC-103G-000042"
+    bitmap = encoder.render(serial, 97)
+    assert bitmap.shape == (97, 97)
+    assert decode_datamatrix(_image(bitmap)) == [serial]
+
@@ -0,0 +1,67 @@
+# LabelArchive: read-only access next to a writing process
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from label_archive import INDEX_NAME, ArchiveError, LabelArchive
+
+
+@pytest.fixture
+def writer(tmp_path):
+    archive = LabelArchive(str(tmp_path), fsync=False)
+    yield archive
+    archive.close()
+
+
+def _segment_sizes(directory):
+    return {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)}
+
+
+def test_reader_sees_unmerged_labels(writer, tmp_path):
+    writer.store("RC-110-000001", "pdf", b"first")
+    writer.store("RC-110-000001", "pdf", b"second")
+    reader = LabelArchive(str(tmp_path), read_only=True)
+    try:
+        assert [entry["length"] for entry in reader.history("RC-110-000001")] == [5, 6]
+        assert reader.get("RC-110-000001")[1] == b"second"
+        assert reader.verify()["ok"]
+    finally:
+        reader.close()
+
+
+def test_reader_writes_nothing(writer, tmp_path):
+    writer.store("RC-110-000001", "tspl", b"label")
+    segment = writer._paths[writer._segment]
+    with open(segment, "ab") as f:
+        f.write(b"\x00" * 7)  # a record the writer is still writing
+    before = _segment_sizes(str(tmp_path))
+    index_mtime = os.stat(os.path.join(str(tmp_path), INDEX_NAME)).st_mtime_ns
+
+    reader = LabelArchive(str(tmp_path), read_only=True)
+    assert reader.get("RC-110-000001")[1] == b"label"
+    with pytest.raises(ArchiveError):
+        reader.store("RC-110-000002", "tspl", b"x")
+    reader.close()
+
+    assert _segment_sizes(str(tmp_path)) == before
+    assert os.stat(os.path.join(str(tmp_path), INDEX_NAME)).st_mtime_ns == index_mtime
+
+
+def test_writer_merges_while_reader_is_open(writer, tmp_path):
+    writer.store("RC-110-000001", "pdf", b"one")
+    reader = LabelArchive(str(tmp_path), read_only=True)
+    try:
+        writer.close()  # merges the tail and replaces the index file
+        assert reader.get("RC-110-000001")[1] == b"one"
+    finally:
+        reader.close()
+    reopened = LabelArchive(str(tmp_path), read_only=True)
+    assert reopened.stats()["indexed"] == 1
+    reopened.close()
+
+
+def test_reader_needs_an_archive(tmp_path):
+    with pytest.raises(ArchiveError):
+        LabelArchive(str(tmp_path / "missing"), read_only=True)
+    assert not os.path.exists(tmp_path / "missing")
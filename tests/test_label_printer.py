@@ -0,0 +1,125 @@
+# LabelPrinter: one archive writer per archive directory
+# -*- coding: utf-8 -*-
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+import pytest
+import toml
+
+from conftest import ROOT
+from layout import compile_layout
+from print_labels import LabelPrinter
+
+
+def _sizes(directory):
+    return {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)}
+
+
+def test_second_printer_leaves_the_writers_archive_alone(label_config, tmp_path):
+    writer = LabelPrinter(label_config)
+    writer.archive_label("RC-110-000001", "pdf", b"printed label")
+    segment = writer.archive._paths[writer.archive._segment]
+    with open(segment, "ab") as f:
+        f.write(b"\x00" * 7)  # the writer is in the middle of the next record
+    directory = str(tmp_path / "archive")
+    before = _sizes(directory)
+
+    reader = LabelPrinter(label_config, archive="read_only")
+    assert reader.archive.get("RC-110-000001")[1] == b"printed label"
+    reader.archive_label("RC-110-000002", "pdf", b"not stored")  # logged, not written
+    reader.archive.close()
+    assert _sizes(directory) == before
+
+    render_only = LabelPrinter(label_config, archive=False)
+    assert render_only.archive is None
+    assert _sizes(directory) == before
+    writer.archive.close()
+
+
+def test_concurrent_prints_keep_their_own_label(label_config):
+    true = shutil.which("true")
+    if true is None:
+        pytest.skip("no `true` executable to stand in for Acrobat")
+    printer = LabelPrinter(label_config)
+    printer.render_client = None
+    printer.print_backend = "acrobat"
+    printer.acrobat_path = true
+    printer.acrobat_print_wait = 0.05
+    serials = [f"RC-110-{i:06d}" for i in range(1, 7)]
+    template = os.path.join(ROOT, "template51x25.pdf")
+
+    with ThreadPoolExecutor(max_workers=len(serials)) as pool:
+        results = list(pool.map(lambda serial: printer.create_and_print_label(serial, template), serials))
+
+    assert all(results)
+    for serial in serials:
+        with fitz.open(stream=printer.archive.get(serial)[1], filetype="pdf") as pdf:
+            assert serial in pdf[0].get_text()
+    printer.archive.close()
+
+
+@pytest.mark.parametrize("kind", ["tspl", "pdf"])
+def test_label_set_renders_from_one_layout_snapshot(label_config, monkeypatch, kind):
+    printer = LabelPrinter(label_config, archive=False)
+    config = toml.load(label_config)
+    config["label_sets"]["RC-110"] = ["device", "box"]
+    set_layout = compile_layout(config, label_config)
+    printer.apply_layout(set_layout)
+    reloaded = compile_layout(toml.load(label_config), label_config)
+
+    validated = []
+    validate = printer._validate_serial_number
+    monkeypatch.setattr(printer, "_validate_serial_number", lambda serial: validated.append(serial) or validate(serial))
+    encode = printer.dm_encoder.encode
+
+    def encode_then_reload(data):
+        printer.layout = reloaded  # hot reload in the middle of the set
+        return encode(data)
+
+    monkeypatch.setattr(printer.dm_encoder, "encode", encode_then_reload)
+    used = []
+    render_bits = printer.compositor.render_bits
+    monkeypatch.setattr(
+        printer.compositor, "render_bits", lambda layout, *args: used.append(layout) or render_bits(layout, *args)
+    )
+    draw_label = printer._draw_label
+    monkeypatch.setattr(
+        printer, "_draw_label",
+        lambda c, model_layout, serial: used.append(model_layout) or draw_label(c, model_layout, serial),
+    )
+
+    data = printer.render_label_set(kind, "RC-110-000001", os.path.join(ROOT, "template51x25.pdf"))
+
+    assert data is not None
+    assert validated == ["RC-110-000001"]
+    assert used and all(obj is set_layout or obj is set_layout.model("RC-110") for obj in used)
+
+
+def test_printed_prerender_is_not_rendered_again(label_config, monkeypatch):
+    printer = LabelPrinter(label_config, archive=False)
+    printer.render_client = None
+    template = os.path.join(ROOT, "template51x25.pdf")
+    rendered = []
+    render_for_print = printer.render_for_print
+    monkeypatch.setattr(
+        printer, "render_for_print",
+        lambda kind, serial, *args: rendered.append(serial) or render_for_print(kind, serial, *args),
+    )
+
+    printer.prerender("RC-110-000001", template)
+    assert printer.render_for_backend("RC-110-000001", template) is not None
+    assert rendered == ["RC-110-000001"]
+    for _poll in range(3):  # /device_status while the unit waits for its scan
+        printer.prerender("RC-110-000001", template)
+    printer._prerender_pool.submit(lambda: None).result()
+    assert rendered == ["RC-110-000001"]
+
+    printer.render_for_backend("RC-110-000001", template)  # reprint: rendered, not the used entry
+    assert rendered == ["RC-110-000001"] * 2
+
+    printer.discard_prerendered()  # unplugged; plugged in again
+    printer.prerender("RC-110-000001", template)
+    printer._prerender_pool.submit(lambda: None).result()
+    assert rendered == ["RC-110-000001"] * 3
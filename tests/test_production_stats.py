@@ -0,0 +1,71 @@
+# ProductionStats deltas: a client either gets every change since its version or a reset
+# -*- coding: utf-8 -*-
+from production_stats import ProductionStats
+
+
+def _scan(n, station="A", status="ready"):
+    return {
+        "barcode": f"RC-110-{n:06d}",
+        "status": status,
+        "manufacturing_date": "2026-10-18T10:00:00",
+        "scanner_id": station,
+    }
+
+
+def _replay(snapshot, *deltas):
+    counters = dict(snapshot["counters"])
+    for delta in deltas:
+        if delta["reset"]:
+            counters = {}
+        counters.update(delta["counters"])
+    return counters
+
+
+def test_delta_since_current_version():
+    stats = ProductionStats()
+    stats.apply_events([_scan(1), _scan(2)])
+    first = stats.delta(0)
+    assert first["reset"] is True
+    stats.apply_events([_scan(3, "B")])
+    delta = stats.delta(first["version"])
+    assert delta["reset"] is False
+    assert _replay(first, delta) == stats.delta(0)["counters"]
+    assert [item["barcode"] for item in delta["items"]] == ["RC-110-000003"]
+
+
+def test_counter_log_trimmed_more_than_item_log():
+    # 4 counter changes per scan: _changes wraps long before _item_changes
+    stats = ProductionStats(max_changes=40)
+    stats.apply_events([_scan(1)])
+    old = stats.delta(0)
+    stats.apply_events([_scan(2, "D")])
+    stats.apply_events([_scan(n) for n in range(3, 16)])
+    assert len(stats._item_changes) < stats._item_changes.maxlen
+
+    delta = stats.delta(old["version"])
+    assert delta["reset"] is True
+    assert delta["counters"]["station|2026-10-18|D"] == 1
+
+
+def test_item_log_trimmed_more_than_counter_log():
+    # status changes only go to _item_changes
+    stats = ProductionStats(max_changes=40)
+    stats.apply_events([_scan(1), _scan(2)])
+    old = stats.delta(0)
+    for i in range(40):
+        stats.apply_events([_scan(1, status="ready" if i % 2 else "sold")])
+    assert len(stats._changes) < stats._changes.maxlen
+
+    delta = stats.delta(old["version"])
+    assert delta["reset"] is True
+    assert {item["barcode"] for item in delta["items"]} == {"RC-110-000001", "RC-110-000002"}
+
+
+def test_recent_client_still_gets_delta_after_trimming():
+    stats = ProductionStats(max_changes=40)
+    stats.apply_events([_scan(n) for n in range(1, 20)])
+    recent = stats.delta(0)
+    stats.apply_events([_scan(20, "E")])
+    delta = stats.delta(recent["version"])
+    assert delta["reset"] is False
+    assert _replay(recent, delta) == stats.delta(0)["counters"]
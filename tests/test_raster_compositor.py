@@ -0,0 +1,51 @@
+# Raster compositor: cached static layer + serial overlay against the full PDF raster
+# -*- coding: utf-8 -*-
+import math
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import ROOT, write_label_config
+from layout import MODEL_TEXTS
+from print_labels import LabelPrinter
+from raster_compositor import POINTS_PER_INCH, RasterCompositor
+
+TEMPLATE = os.path.join(ROOT, "template51x25.pdf")
+# Anti-aliasing and the Data Matrix resampled from print_dpi in the PDF
+# path; a misplaced symbol or serial run is hundreds of pixels
+MAX_DIFF_PIXELS = 100
+
+
+@pytest.fixture(scope="module")
+def printer(tmp_path_factory):
+    printer = LabelPrinter(write_label_config(tmp_path_factory.mktemp("compositor")), archive=False)
+    printer.label_cache = None
+    printer.render_client = None
+    return printer
+
+
+def _ink(bits, width):
+    return np.unpackbits(bits, axis=1)[:, :width].astype(bool)
+
+
+@pytest.mark.parametrize("model", list(MODEL_TEXTS))
+def test_composed_label_matches_pdf_raster(printer, model, decode_datamatrix):
+    serial = f"{model}-123456"
+    layout = printer.layout
+    dpi = printer.device_dpi
+
+    bits, layer = printer.compositor.render_bits(layout, model, serial, TEMPLATE, dpi)
+    full = RasterCompositor.rasterize_pdf(printer.render_label_pdf(serial, TEMPLATE, use_cache=False), dpi)
+
+    composed = _ink(bits, layer.width)
+    assert composed.shape == _ink(full.bits, full.width).shape
+    assert np.count_nonzero(composed ^ _ink(full.bits, full.width)) <= MAX_DIFF_PIXELS
+
+    zoom = dpi / POINTS_PER_INCH
+    top = layer.page_height_pt - layout.dm_y - layout.dm_size
+    x0, y0 = math.floor(layout.dm_x * zoom), math.floor(top * zoom)
+    x1, y1 = math.ceil((layout.dm_x + layout.dm_size) * zoom), math.ceil((top + layout.dm_size) * zoom)
+    symbol = np.where(composed[y0:y1, x0:x1], 0, 255).astype(np.uint8)
+    assert decode_datamatrix(Image.fromarray(np.pad(symbol, 20, constant_values=255))) == [serial]
@@ -0,0 +1,118 @@
+# Readiness rules and the prefetch cache against the SQLite stand-in
+# -*- coding: utf-8 -*-
+import pytest
+
+import readiness
+from readiness import (
+    LocalReadinessSource,
+    ReadinessCache,
+    check_readiness,
+    readiness_rules,
+    split_by_readiness,
+)
+
+READY = ["RC-110-000001", "RC-110-000002", "RC-103G-000003"]
+NOT_READY = ["RC-102-000004"]
+MISSING = "RC-410-999999"
+
+
+class Config:
+    DEVICE_VALIDATION_ENABLED = True
+    REQUIRE_TESTS_OK = True
+    REQUIRE_CALIBRATION_OK = True
+    REQUIRE_PROG_TIME = True
+    REQUIRE_CALIB_TIME = False
+
+
+class CountingSource(LocalReadinessSource):
+    """Stand-in that records the serials of every query"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.calls = []
+
+    def fetch(self, serials):
+        serials = list(serials)
+        self.calls.append(serials)
+        return super().fetch(serials)
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = CountingSource(str(tmp_path / "readiness.db"))
+    source.seed(READY, ready=True)
+    source.seed(NOT_READY, ready=False)
+    yield source
+    source.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(readiness.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_prefetch_is_one_query_per_batch(source):
+    cache = ReadinessCache(source)
+    infos = cache.prefetch(READY + NOT_READY + [MISSING, READY[0]])
+    assert len(source.calls) == 1
+    assert sorted(source.calls[0]) == sorted(READY + NOT_READY + [MISSING])
+    assert list(infos) == READY + NOT_READY + [MISSING]
+    assert infos[MISSING] is None
+    assert infos[READY[0]]["tests_ok"] == 1
+
+
+def test_ttl_hits_then_expiry(source, clock):
+    cache = ReadinessCache(source, ttl=60)
+    cache.prefetch(READY)
+    clock[0] += 59
+    cache.prefetch(READY)
+    assert len(source.calls) == 1
+    assert cache.hits == len(READY)
+
+    clock[0] += 2
+    cache.prefetch(READY)
+    assert len(source.calls) == 2
+
+
+def test_only_misses_are_queried(source):
+    cache = ReadinessCache(source)
+    cache.prefetch(READY[:1])
+    cache.prefetch(READY)
+    assert source.calls == [READY[:1], READY[1:]]
+
+
+def test_not_found_is_not_cached(source):
+    cache = ReadinessCache(source)
+    assert cache.get(MISSING) is None
+    source.seed([MISSING], ready=True)
+    assert cache.get(MISSING)["calibration_ok"] == 1
+    assert len(source.calls) == 2
+
+
+def test_rules_validation_on_and_off():
+    config = Config()
+    assert readiness_rules(config) == ("tests_ok", "calibration_ok", "prog_time")
+    config.DEVICE_VALIDATION_ENABLED = False
+    assert readiness_rules(config) == ("tests_ok",)
+
+
+def test_check_readiness(source):
+    infos = ReadinessCache(source).prefetch(READY[:1] + NOT_READY + [MISSING])
+    strict = readiness_rules(Config())
+
+    assert check_readiness(infos[READY[0]], strict) == (True, [])
+    assert check_readiness(infos[NOT_READY[0]], strict) == (False, ["calibration_ok", "prog_time"])
+    assert check_readiness(infos[MISSING], strict) == (False, ["not_found"])
+    # validation off: only the tests have to pass
+    assert check_readiness(infos[NOT_READY[0]], ("tests_ok",)) == (True, [])
+    assert check_readiness({"result": 1, "tests_ok": 1}, ("tests_ok",)) == (False, ["not_found"])
+
+
+def test_split_by_readiness(source):
+    cache = ReadinessCache(source)
+    ready, not_ready = split_by_readiness(cache, READY + NOT_READY + [MISSING], readiness_rules(Config()))
+    assert ready == READY
+    assert not_ready == [(NOT_READY[0], ["calibration_ok", "prog_time"]), (MISSING, ["not_found"])]
+    assert len(source.calls) == 1
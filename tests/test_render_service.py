@@ -0,0 +1,22 @@
+# Render service: input errors are 400, not 500
+# -*- coding: utf-8 -*-
+import pytest
+
+import render_service
+
+
+@pytest.fixture
+def client():
+    return render_service.app.test_client()
+
+
+@pytest.mark.parametrize("body", ['["RC-110-000001"]', '"RC-110-000001"', "42", "null", "{not json"])
+def test_batch_rejects_json_that_is_not_an_object(client, body):
+    response = client.post("/render/batch", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_batch_rejects_serials_that_are_not_a_list(client):
+    response = client.post("/render/batch", json={"serials": "RC-110-000001"})
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+# Serial list parsing: CSV column selection
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+from serial_ingest import ingest_stream, parse_column
+
+CSV = "id,serial,note\n1,RC-110-000001,a\n2,RC-103G-000002,b\n3,bad,c\n"
+NO_HEADER = "x,RC-110-000001\ny,RC-410-000002\n"
+
+
+def _ingest(text, column, name="list.csv"):
+    accepted = []
+    report = ingest_stream(io.StringIO(text), "auto", column, name, lambda serial, model: accepted.append(serial))
+    return report, accepted
+
+
+@pytest.mark.parametrize(
+    "value, expected", [(None, None), ("", None), ("1", 1), (" 0 ", 0), ("serial", "serial"), ("SN", "SN")]
+)
+def test_parse_column(value, expected):
+    assert parse_column(value) == expected
+
+
+def test_numeric_column_selects_by_index():
+    report, accepted = _ingest(NO_HEADER, parse_column("1"))
+    assert accepted == ["RC-110-000001", "RC-410-000002"]
+    assert report.rejected == 0
+
+
+def test_named_column():
+    report, accepted = _ingest(CSV, parse_column("Serial"))
+    assert accepted == ["RC-110-000001", "RC-103G-000002"]
+    assert report.rejected == 1
+
+
+def test_auto_column_finds_header():
+    _report, accepted = _ingest(CSV, parse_column(None))
+    assert accepted == ["RC-110-000001", "RC-103G-000002"]
+
+
+def test_unknown_column_name():
+    with pytest.raises(ValueError, match="CSV column not found: lot"):
+        _ingest(CSV, parse_column("lot"))
@@ -0,0 +1,77 @@
+# TsplPrinter completion feedback against the local PrinterEmulator
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+from PIL import Image
+
+from tspl_printer import PrinterEmulator, PrinterStatusError, TsplPrinter, build_job
+
+JOB = build_job(Image.new("1", (64, 32), 1), 51, 25)
+
+
+@pytest.fixture
+def emulator():
+    emulator = PrinterEmulator(print_time=0.2).start()
+    yield emulator
+    emulator.stop()
+
+
+def _printer(emulator, timeout=2.0):
+    return TsplPrinter(emulator.host, emulator.port, timeout=timeout, poll_interval=0.02)
+
+
+def test_job_completes_after_label_printed(emulator):
+    elapsed = _printer(emulator).print_job(JOB)
+    assert emulator.labels == 1
+    assert elapsed >= emulator.print_time
+    assert emulator.status() == 0
+
+
+def test_instant_print_completes():
+    emulator = PrinterEmulator(print_time=0.0).start()
+    try:
+        _printer(emulator, timeout=1.0).print_job(JOB)
+        assert emulator.labels == 1
+    finally:
+        emulator.stop()
+
+
+def test_several_labels_in_one_job(emulator):
+    _printer(emulator).print_job(JOB * 3)
+    assert emulator.labels == 3
+    assert emulator.status() == 0
+
+
+def test_paper_out_before_job(emulator):
+    emulator.set_condition("paper out")
+    with pytest.raises(PrinterStatusError, match="not ready") as error:
+        _printer(emulator).print_job(JOB)
+    assert error.value.conditions == ["paper out"]
+    assert emulator.labels == 0
+
+
+@pytest.mark.parametrize("condition", ["head open", "paper out"])
+def test_condition_mid_job(emulator, condition):
+    emulator.print_time = 1.0
+    timer = threading.Timer(0.2, emulator.set_condition, (condition,))
+    timer.start()
+    try:
+        with pytest.raises(PrinterStatusError, match="Printer error") as error:
+            _printer(emulator).print_job(JOB)
+    finally:
+        timer.cancel()
+    assert condition in error.value.conditions
+
+
+def test_timeout_while_printing(emulator):
+    emulator.print_time = 2.0
+    with pytest.raises(PrinterStatusError, match="still printing"):
+        _printer(emulator, timeout=0.3).print_job(JOB)
+
+
+def test_idle_printer_is_not_success(emulator):
+    # job accepted but never printed: must not be reported as done
+    with pytest.raises(PrinterStatusError, match="printing never started"):
+        _printer(emulator, timeout=0.3).print_job(b"CLS\r\n")
+    assert emulator.labels == 0
@@ -0,0 +1,164 @@
+# Station throughput analytics: step timestamps per unit in SQLite
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import time
+
+# UI flow: connect -> validate -> print -> scan
+STEPS = ("connect", "validate", "print", "scan")
+CYCLE_BUCKETS_S = (15, 30, 45, 60, 90, 120, 180, 300, 600)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    scanned     INTEGER NOT NULL,  -- epoch ms of the scan confirmation
+    station     TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    serial      TEXT NOT NULL,
+    validate_ms INTEGER NOT NULL,  -- connect -> validated
+    print_ms    INTEGER NOT NULL,  -- validated -> printed
+    scan_ms     INTEGER NOT NULL   -- printed -> scanned
+);
+CREATE INDEX IF NOT EXISTS units_scanned ON units (scanned);
+"""
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _distribution(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_s": round(sum(values) / len(values) / 1000, 2),
+        "p50_s": round(_percentile(values, 50) / 1000, 2),
+        "p90_s": round(_percentile(values, 90) / 1000, 2),
+        "p99_s": round(_percentile(values, 99) / 1000, 2),
+        "max_s": round(values[-1] / 1000, 2),
+    }
+
+
+class ThroughputLog:
+    """Collects step timestamps of units in progress; a unit is written as one
+    row of step durations when its scan is confirmed"""
+
+    def __init__(self, path, station, max_pending=1000):
+        self.path = path
+        self.station = station
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = {}  # serial -> [connect, validate, print] epoch seconds
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def step(self, serial, step, when=None):
+        """Record the first time a unit reaches a step"""
+        if not serial:
+            return
+        when = time.time() if when is None else when
+        with self._lock:
+            stamps = self._pending.get(serial)
+            if stamps is None:
+                if step != "connect":
+                    return  # unit not seen connecting (e.g. server restarted)
+                if len(self._pending) >= self.max_pending:
+                    self._pending.pop(next(iter(self._pending)))
+                stamps = self._pending[serial] = [when, None, None]
+            index = STEPS.index(step)
+            if index < 3:
+                if stamps[index] is None:
+                    stamps[index] = when
+                return
+
+            # scan: unit complete
+            del self._pending[serial]
+            connected = stamps[0]
+            validated = stamps[1] or connected
+            printed = stamps[2] or validated
+            row = (
+                int(when * 1000),
+                self.station,
+                serial.rsplit("-", 1)[0],
+                serial,
+                int((validated - connected) * 1000),
+                int((printed - validated) * 1000),
+                int((when - printed) * 1000),
+            )
+            self._db.execute("INSERT INTO units VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self._db.commit()
+
+    def query(self, hours=24.0, station=None, model=None):
+        """Cycle times, idle gaps, units per hour and step durations over the last hours"""
+        since = int((time.time() - hours * 3600) * 1000)
+        sql = (
+            "SELECT scanned, station, model, validate_ms, print_ms, scan_ms "
+            "FROM units WHERE scanned >= ?"
+        )
+        params = [since]
+        if station:
+            sql += " AND station = ?"
+            params.append(station)
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        sql += " ORDER BY station, scanned"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        cycles, idle_gaps = [], []
+        steps = {"validate": [], "print": [], "scan": []}
+        per_station, per_model, per_hour = {}, {}, {}
+        previous = {}  # station -> scanned of the previous unit
+        for scanned, unit_station, unit_model, validate_ms, print_ms, scan_ms in rows:
+            cycle = validate_ms + print_ms + scan_ms
+            cycles.append(cycle)
+            steps["validate"].append(validate_ms)
+            steps["print"].append(print_ms)
+            steps["scan"].append(scan_ms)
+            connected = scanned - cycle
+            last = previous.get(unit_station)
+            if last is not None and connected >= last:
+                idle_gaps.append(connected - last)
+            previous[unit_station] = scanned
+            per_station[unit_station] = per_station.get(unit_station, 0) + 1
+            per_model[unit_model] = per_model.get(unit_model, 0) + 1
+            hour = time.strftime("%Y-%m-%dT%H:00", time.localtime(scanned / 1000))
+            per_hour[hour] = per_hour.get(hour, 0) + 1
+
+        histogram = dict.fromkeys([f"<{b}s" for b in CYCLE_BUCKETS_S] + [f">={CYCLE_BUCKETS_S[-1]}s"], 0)
+        for cycle in cycles:
+            bucket = next((f"<{b}s" for b in CYCLE_BUCKETS_S if cycle < b * 1000), f">={CYCLE_BUCKETS_S[-1]}s")
+            histogram[bucket] += 1
+
+        step_stats = {name: _distribution(values) for name, values in steps.items()}
+        slowest = max(step_stats, key=lambda name: step_stats[name].get("mean_s", 0)) if rows else None
+        # Units per hour of production (hours with at least one unit)
+        active_hours = max(len(per_hour), 1)
+        return {
+            "hours": hours,
+            "units": len(rows),
+            "cycle_time": _distribution(cycles),
+            "cycle_histogram": histogram,
+            "idle_gap": _distribution(idle_gaps),
+            "idle_total_s": round(sum(idle_gaps) / 1000, 1),
+            "steps": step_stats,
+            "slowest_step": slowest,
+            "uph": {
+                "overall": round(len(rows) / active_hours, 1),
+                "per_station": {k: round(v / active_hours, 1) for k, v in per_station.items()},
+                "per_model": {k: round(v / active_hours, 1) for k, v in per_model.items()},
+            },
+            "per_hour": per_hour,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
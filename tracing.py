@@ -0,0 +1,174 @@
+# Per-unit tracing: device connect -> validation -> print -> scan confirmation
+# -*- coding: utf-8 -*-
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Trace of the unit handled by the current request (None - spans are no-ops)
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Timed spans of one unit. Offsets are relative to the first sighting"""
+
+    __slots__ = ("trace_id", "handle", "serial", "started_at", "t0", "spans", "finished", "_marks")
+
+    def __init__(self, handle, start=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.handle = handle
+        self.serial = None
+        self.t0 = time.perf_counter() if start is None else start
+        self.started_at = time.time() - (time.perf_counter() - self.t0)
+        self.spans = []  # (name, start, duration, attrs)
+        self.finished = False
+        self._marks = {}
+
+    def add(self, name, start, end, attrs=None):
+        """Record a span from perf_counter() start/end"""
+        self.spans.append((name, start - self.t0, end - start, attrs))
+
+    def event(self, name, **attrs):
+        now = time.perf_counter()
+        self.spans.append((name, now - self.t0, 0.0, attrs or None))
+
+    def mark(self, name, **attrs):
+        """Event recorded only when attrs differ from the previous mark of this name"""
+        if self._marks.get(name) != attrs:
+            self._marks[name] = attrs
+            self.event(name, **attrs)
+
+    def to_dict(self):
+        spans = sorted(self.spans, key=lambda s: s[1])
+        end = max((start + duration for _n, start, duration, _a in spans), default=0.0)
+        return {
+            "trace_id": self.trace_id,
+            "serial": self.serial,
+            "handle": self.handle,
+            "started_at": self.started_at,
+            "finished": self.finished,
+            "total_ms": round(end * 1000, 2),
+            "spans": [
+                {
+                    "name": name,
+                    "offset_ms": round(start * 1000, 2),
+                    "duration_ms": round(duration * 1000, 2),
+                    **({"attrs": attrs} if attrs else {}),
+                }
+                for name, start, duration, attrs in spans
+            ],
+        }
+
+
+class TraceStore:
+    """Active traces by device handle and serial, recent ones in memory,
+    finished ones appended to a JSON lines file (rotated at max_file_bytes)"""
+
+    def __init__(self, path=None, max_traces=500, max_file_bytes=16 << 20, enabled=True):
+        self.path = path
+        self.max_traces = max_traces
+        self.max_file_bytes = max_file_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._by_handle = {}
+        self._by_serial = OrderedDict()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def begin(self, handle, serial=None, start=None):
+        """Trace of the device on this handle, a new one on first sighting.
+        Returns (trace, created); start is the perf_counter() of the sighting"""
+        if not self.enabled:
+            return None, False
+        with self._lock:
+            trace = self._by_handle.get(handle)
+            if trace is not None and (trace.finished or (serial and trace.serial not in (None, serial))):
+                trace = None  # handle reused by another unit
+            created = trace is None
+            if created:
+                trace = self._by_handle[handle] = Trace(handle, start)
+            if serial and trace.serial != serial:
+                trace.serial = serial
+                self._by_serial[serial] = trace
+                self._by_serial.move_to_end(serial)
+                while len(self._by_serial) > self.max_traces:
+                    self._by_serial.popitem(last=False)
+        return trace, created
+
+    def release_handles(self):
+        """No devices connected: the next sighting of any handle is a new unit"""
+        with self._lock:
+            self._by_handle.clear()
+
+    def for_serial(self, serial):
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._by_serial.get(serial)
+
+    def finish(self, trace):
+        if trace is None or trace.finished:
+            return
+        trace.finished = True
+        if self.path:
+            line = json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+            with self._lock:
+                try:
+                    if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_file_bytes:
+                        os.replace(self.path, self.path + ".1")
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(line)
+                except OSError:
+                    pass
+
+    def get(self, serial):
+        """Latest trace of a serial as dict: memory first, then the trace files"""
+        trace = self.for_serial(serial)
+        if trace is not None:
+            return trace.to_dict()
+        if not self.path:
+            return None
+        needle = f'"serial": "{serial}"'
+        found = None
+        for path in (self.path, self.path + ".1"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if needle in line:
+                            found = line
+            except OSError:
+                continue
+            if found:
+                return json.loads(found)
+        return None
+
+    @contextmanager
+    def activate(self, trace):
+        """Make trace current for span() calls in this context"""
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block into the current trace; yields attrs dict to add results"""
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add(name, start, time.perf_counter(), attrs or None)
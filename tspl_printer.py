@@ -0,0 +1,244 @@
+# Raw TSPL printing over TCP (port 9100) with job completion feedback
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+from collections import deque
+
+# <ESC>!? - immediate status query, the printer answers with one byte
+STATUS_QUERY = b"\x1b!?"
+STATUS_BITS = (
+    (0x01, "head open"),
+    (0x02, "paper jam"),
+    (0x04, "paper out"),
+    (0x08, "ribbon out"),
+    (0x10, "paused"),
+    (0x20, "printing"),
+    (0x40, "cover open"),
+    (0x80, "temperature error"),
+)
+STATUS_PRINTING = 0x20
+STATUS_ERRORS = 0xFF & ~STATUS_PRINTING
+
+
+def describe_status(status: int):
+    """Names of the conditions set in a status byte"""
+    return [name for bit, name in STATUS_BITS if status & bit]
+
+
+class PrinterStatusError(Exception):
+    """Printer reported an error condition or did not finish the job in time"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+        self.conditions = describe_status(status) if status is not None else []
+
+
+def build_job(image, width_mm, height_mm, gap_mm=2.0, copies=1, speed=None, density=None):
+    """TSPL job printing a 1-bit PIL image (white = bit 1, as TSPL BITMAP expects)"""
+    width_bytes = (image.width + 7) // 8
+    header = [
+        f"SIZE {width_mm} mm,{height_mm} mm",
+        f"GAP {gap_mm} mm,0 mm",
+        "DIRECTION 1",
+    ]
+    if speed is not None:
+        header.append(f"SPEED {speed}")
+    if density is not None:
+        header.append(f"DENSITY {density}")
+    header += ["CLS", f"BITMAP 0,0,{width_bytes},{image.height},0,"]
+    return (
+        "\r\n".join(header).encode("ascii")
+        + image.tobytes()
+        + f"\r\nPRINT 1,{copies}\r\n".encode("ascii")
+    )
+
+
+class TsplPrinter:
+    """Send a TSPL job and poll <ESC>!? until the label is really printed.
+
+    Completion: the printing bit was seen and cleared again. A printer that
+    stays idle is still processing the job (a 300 dpi BITMAP takes a while),
+    so that is waited for until timeout. Any error bit ends the wait with
+    PrinterStatusError.
+    """
+
+    def __init__(self, host, port=9100, timeout=15.0, poll_interval=0.05, logger=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.logger = logger
+
+    def _connect(self):
+        return socket.create_connection((self.host, self.port), timeout=min(self.timeout, 5.0))
+
+    @staticmethod
+    def _query(sock):
+        sock.sendall(STATUS_QUERY)
+        reply = sock.recv(1)
+        if not reply:
+            raise PrinterStatusError("Printer closed the connection")
+        return reply[0]
+
+    def status(self):
+        """Current status byte"""
+        with self._connect() as sock:
+            return self._query(sock)
+
+    def print_job(self, job: bytes):
+        """Send job and wait for completion. Returns elapsed seconds"""
+        started = time.monotonic()
+        with self._connect() as sock:
+            status = self._query(sock)
+            if status & STATUS_ERRORS:
+                raise PrinterStatusError(
+                    f"Printer not ready: {', '.join(describe_status(status & STATUS_ERRORS))}", status
+                )
+
+            sock.sendall(job)
+
+            deadline = started + self.timeout
+            seen_printing = False
+            while True:
+                status = self._query(sock)
+                if status & STATUS_ERRORS:
+                    raise PrinterStatusError(
+                        f"Printer error: {', '.join(describe_status(status & STATUS_ERRORS))}", status
+                    )
+                if status & STATUS_PRINTING:
+                    seen_printing = True
+                elif seen_printing:
+                    break
+                if time.monotonic() > deadline:
+                    reason = "still printing" if seen_printing else "printing never started"
+                    raise PrinterStatusError(
+                        f"Label not printed within {self.timeout} s ({reason})", status
+                    )
+                time.sleep(self.poll_interval)
+
+        elapsed = time.monotonic() - started
+        if self.logger:
+            self.logger.info("TSPL job printed in %.2f s", elapsed)
+        return elapsed
+
+
+class PrinterEmulator:
+    """Local TSPL printer on a TCP port: accepts jobs, answers <ESC>!?.
+
+    Every PRINT keeps the printing bit set for print_time seconds, and for
+    at least one status reply (as a real printer does), so print_time=0 works.
+    Conditions can be injected with set_condition("paper out", True) etc.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, print_time=0.3, keep_jobs=100):
+        self.print_time = print_time
+        self.labels = 0
+        self.jobs = deque(maxlen=keep_jobs)  # BITMAP data of the latest printed labels
+        self._conditions = 0
+        self._busy_until = 0.0
+        self._unreported = False  # a PRINT not yet seen as printing by a status query
+        self._lock = threading.Lock()
+        self._server = socket.create_server((host, port))
+        self._server.settimeout(0.2)
+        self.host, self.port = self._server.getsockname()[:2]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="PrinterEmulator", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._server.close()
+
+    def set_condition(self, name, active=True):
+        bit = next(bit for bit, condition in STATUS_BITS if condition == name)
+        with self._lock:
+            self._conditions = self._conditions | bit if active else self._conditions & ~bit
+
+    def status(self):
+        with self._lock:
+            status = self._conditions
+            if self._unreported or time.monotonic() < self._busy_until:
+                status |= STATUS_PRINTING
+            self._unreported = False
+            return status
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                conn, _addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        buffer = b""
+        bitmap = None
+        with conn:
+            conn.settimeout(0.2)
+            while not self._stop.is_set():
+                try:
+                    chunk = conn.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                buffer += chunk
+                buffer, bitmap = self._consume(conn, buffer, bitmap)
+
+    def _consume(self, conn, buffer, bitmap):
+        while buffer:
+            if buffer.startswith(STATUS_QUERY):
+                conn.sendall(bytes([self.status()]))
+                buffer = buffer[len(STATUS_QUERY):]
+                continue
+            if buffer.startswith(b"BITMAP"):
+                # BITMAP x,y,width_bytes,height,mode,<binary data>
+                parts = buffer.split(b",", 5)
+                if len(parts) < 6:
+                    return buffer, bitmap
+                size = int(parts[2]) * int(parts[3])
+                if len(parts[5]) < size:
+                    return buffer, bitmap
+                bitmap = parts[5][:size]
+                buffer = parts[5][size:]
+                continue
+            end = buffer.find(b"\r\n")
+            if end < 0:
+                return buffer, bitmap
+            line, buffer = buffer[:end].strip(), buffer[end + 2:]
+            if line.startswith(b"PRINT"):
+                with self._lock:
+                    if not self._conditions:
+                        self.labels += 1
+                        self.jobs.append(bitmap)
+                        self._busy_until = max(self._busy_until, time.monotonic()) + self.print_time
+                        self._unreported = True
+        return buffer, bitmap
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="TSPL printer emulator")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--print-time", type=float, default=0.3)
+    args = parser.parse_args()
+
+    emulator = PrinterEmulator(port=args.port, print_time=args.print_time).start()
+    print(f"TSPL printer emulator on {emulator.host}:{emulator.port}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Labels printed: {emulator.labels}, status: {describe_status(emulator.status()) or 'ready'}")
+    except KeyboardInterrupt:
+        emulator.stop()
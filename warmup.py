@@ -0,0 +1,79 @@
+# Startup warm-up: initialize lazily loaded pieces before the first label
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+# Process start as seen by the first import of this module
+STARTED = time.perf_counter()
+
+
+class Warmup:
+    """Runs named steps once in a background thread and records their cost.
+
+    A failed step is logged and skipped; the app is ready when all steps
+    have run, failed or not.
+    """
+
+    def __init__(self, steps, logger=None):
+        self.steps = list(steps)  # (name, callable)
+        self.logger = logger
+        self.timings = {}  # name -> ms
+        self.errors = {}  # name -> message
+        self.started_at = None  # seconds since STARTED
+        self.ready_at = None
+        self.milestones = {}  # name -> seconds since STARTED (listening, interactive, ...)
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="Warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def mark(self, name):
+        """Record a startup milestone (first time only); returns its time"""
+        return self.milestones.setdefault(name, round(time.perf_counter() - STARTED, 3))
+
+    def _run(self):
+        self.started_at = time.perf_counter() - STARTED
+        for name, step in self.steps:
+            t0 = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+                if self.logger:
+                    self.logger.warning("Warm-up step '%s' failed: %s", name, e)
+            self.timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+        self.ready_at = time.perf_counter() - STARTED
+        self._done.set()
+        if self.logger:
+            total = sum(self.timings.values())
+            self.logger.info(
+                "Warm-up done in %.0f ms, ready %.2f s after start: %s",
+                total,
+                self.ready_at,
+                ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items()),
+            )
+
+    def status(self):
+        """Startup metrics: per-step cost, warm-up total, time to ready"""
+        return {
+            "ready": self.ready,
+            "uptime_s": round(time.perf_counter() - STARTED, 2),
+            "warmup_started_s": None if self.started_at is None else round(self.started_at, 3),
+            "ready_s": None if self.ready_at is None else round(self.ready_at, 3),
+            "warmup_ms": round(sum(self.timings.values()), 1),
+            "steps": dict(self.timings),
+            "pending": [name for name, _step in self.steps if name not in self.timings],
+            "errors": dict(self.errors),
+            "milestones": dict(self.milestones),
+        }